@@ -1,32 +1,3822 @@
-from functools import partial
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from functools import partial, wraps
+import hashlib
 import json
+import math
+import mmap
 import os
-from os import listdir
-from os.path import join
+import queue
 import random
+import re
 import sqlite3
+import struct
 import subprocess
-import sys
 import textwrap
 import threading
 import time
 from tkinter import *
 from tkinter import filedialog, messagebox, \
                     ttk, scrolledtext
+from urllib.parse import unquote, urlparse
+import unicodedata
 import webbrowser
 
 # Set this to not to print pygame message.
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 
-import audio_metadata
 from io import BytesIO
-import lyricsgenius as lg
-from mutagen.mp3 import MP3
-from pygame import mixer
-from PIL import ImageTk, Image, ImageFilter, \
-                ImageFont, ImageDraw, ImageEnhance
-import requests
-from ttkthemes import themed_tk as thk
+from pygame import error as pygame_error, mixer
+
+# audio_metadata, lyricsgenius, numpy, PIL, requests, ttkthemes and
+# other modules that are not needed to show the window are imported by
+# the functions that use them (worker processes of folder imports only
+# need audio_metadata).
+
+
+# Bitrates in kbps of MPEG audio frames, by (MPEG 1 or not, layer).
+MP3_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224,
+                256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112,
+                128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96,
+                112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112,
+                 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56,
+                 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56,
+                 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates of MPEG audio frames, by version bits of the header.
+MP3_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+# The integrated loudness in LUFS that songs are brought to when their
+# loudness is normalized (the reference level of ReplayGain 2.0).
+TARGET_LOUDNESS = -18.0
+# The number of songs whose loudness is analyzed at a time. Since every
+# song (of up to 20 minutes) is decoded whole, which takes up to about
+# 210 MB, this is kept small whatever the number of CPUs.
+LOUDNESS_WORKERS = 2
+# The number of columns of lowest and highest samples that the
+# waveform of a song is made of.
+WAVEFORM_COLUMNS = 600
+# The seconds of audio that are decoded at a time to compute the
+# waveform of a song, so long songs (like DJ mixes of hours) are never
+# held in memory whole.
+AUDIO_PIECE_SECONDS = 30
+
+
+def parse_mp3_frame_header(header):
+    """
+    Parse the 4 bytes 'header' of an MPEG audio frame and return a
+    tuple of frame length in bytes, samples per frame, sample rate,
+    whether it is MPEG 1 and whether it is mono, or None if 'header'
+    is not a valid frame header.
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) \
+            or sample_rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 1
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or mpeg1:
+        samples = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        frame_length = 72 * bitrate // sample_rate + padding
+    mono = header[3] >> 6 == 3
+    return frame_length, samples, sample_rate, mpeg1, mono
+
+
+def find_mp3_audio(data):
+    """
+    Return the offset of the first MPEG audio frame inside 'data' (a
+    bytes-like object holding the whole file), skipping ID3v2 tags, or
+    raise ValueError if there is not any.
+    """
+    offset = 0
+    # A file may start with more than one ID3v2 tag.
+    while data[offset:offset + 3] == b'ID3' and len(data) >= offset + 10:
+        # The size is stored in 4 bytes of 7 bits each.
+        tag_size = 0
+        for byte in data[offset + 6:offset + 10]:
+            tag_size = (tag_size << 7) | (byte & 0x7F)
+        if data[offset + 5] & 0x10:
+            # The tag has a footer.
+            tag_size += 10
+        offset += 10 + tag_size
+    # Since a pair of bytes inside junk data may look like a frame
+    # header, we only accept a header if the next frame follows it.
+    search_end = min(len(data), offset + 1024 * 1024)
+    offset = data.find(b'\xff', offset, search_end)
+    while offset != -1:
+        frame_header = parse_mp3_frame_header(data[offset:offset + 4])
+        if frame_header is not None:
+            next_offset = offset + frame_header[0]
+            if next_offset + 4 > len(data) or parse_mp3_frame_header(
+                data[next_offset:next_offset + 4]
+            ) is not None:
+                return offset
+        offset = data.find(b'\xff', offset + 1, search_end)
+    raise ValueError('no MPEG audio frame found')
+
+
+def iter_mp3_frames(data, offset):
+    """
+    Walk the MPEG audio frames inside 'data' starting from the frame
+    at 'offset', and yield a tuple of offset, length, samples and
+    sample rate of each of them. The walk stops at the first byte
+    that is not a frame header (usually an ID3v1 or APE tag).
+    """
+    data_length = len(data)
+    while offset + 4 <= data_length:
+        frame_header = parse_mp3_frame_header(data[offset:offset + 4])
+        if frame_header is None:
+            return
+        frame_length, samples, sample_rate = frame_header[:3]
+        yield offset, frame_length, samples, sample_rate
+        offset += frame_length
+
+
+def get_xing_offset(offset, mpeg1, mono):
+    """
+    Return the offset of the Xing header (named Info for CBR files)
+    inside the MPEG audio frame at 'offset', if it has one; the header
+    comes after the side information of the frame.
+    """
+    if mpeg1:
+        side_info_size = 17 if mono else 32
+    else:
+        side_info_size = 9 if mono else 17
+    return offset + 4 + side_info_size
+
+
+def read_mp3_duration(file_path):
+    """
+    Read the duration in seconds of the MP3 file with path
+    'file_path' from its Xing, Info or VBRI header, or count its
+    frames if it has not any of them. The file is mapped into memory,
+    so only the pages that are read are loaded.
+    """
+    with open(file_path, 'rb') as mp3_file, mmap.mmap(
+        mp3_file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        offset = find_mp3_audio(data)
+        frame_length, samples, sample_rate, mpeg1, mono = \
+            parse_mp3_frame_header(data[offset:offset + 4])
+        xing_offset = get_xing_offset(offset, mpeg1, mono)
+        if data[xing_offset:xing_offset + 4] in (b'Xing', b'Info'):
+            flags, = struct.unpack(
+                '>I', data[xing_offset + 4:xing_offset + 8]
+            )
+            if flags & 1:
+                frames_count, = struct.unpack(
+                    '>I', data[xing_offset + 8:xing_offset + 12]
+                )
+                total_samples = frames_count * samples
+                # Skip the fields of frames count, bytes count, table
+                # of contents and quality, to reach the LAME header
+                # that holds the encoder delay and padding.
+                lame_offset = xing_offset + 8
+                for flag, field_size in ((1, 4), (2, 4), (4, 100), (8, 4)):
+                    if flags & flag:
+                        lame_offset += field_size
+                if data[lame_offset:lame_offset + 3] in (b'LAM', b'Lav'):
+                    delay_padding = data[lame_offset + 21:lame_offset + 24]
+                    if len(delay_padding) == 3:
+                        delay = (delay_padding[0] << 4) \
+                            | (delay_padding[1] >> 4)
+                        padding = ((delay_padding[1] & 0x0F) << 8) \
+                            | delay_padding[2]
+                        if delay + padding < total_samples:
+                            total_samples -= delay + padding
+                return total_samples / sample_rate
+        vbri_offset = offset + 36
+        if data[vbri_offset:vbri_offset + 4] == b'VBRI':
+            frames_count, = struct.unpack(
+                '>I', data[vbri_offset + 14:vbri_offset + 18]
+            )
+            return frames_count * samples / sample_rate
+        total_samples = 0
+        for _, _, samples, sample_rate in iter_mp3_frames(data, offset):
+            total_samples += samples
+        return total_samples / sample_rate
+
+
+def build_seek_index(file_path):
+    """
+    Walk the MPEG audio frames of the MP3 file with path 'file_path'
+    once and return its seek index: a tuple of the samples of a frame,
+    the sample rate and the offsets of all audio frames in the file,
+    as the bytes of an array of 32-bit integers. Raise ValueError if
+    the frames do not all have the same number of samples and sample
+    rate (then the time of a frame can not be found from its index).
+    """
+    with open(file_path, 'rb') as mp3_file, mmap.mmap(
+        mp3_file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        offset = find_mp3_audio(data)
+        frame_length, frame_samples, sample_rate, mpeg1, mono = \
+            parse_mp3_frame_header(data[offset:offset + 4])
+        xing_offset = get_xing_offset(offset, mpeg1, mono)
+        if (
+            data[xing_offset:xing_offset + 4] in (b'Xing', b'Info')
+            or data[offset + 36:offset + 40] == b'VBRI'
+        ):
+            # The first frame holds a VBR header and no audio.
+            offset += frame_length
+        offsets = array('I')
+        for offset, _, samples, rate in iter_mp3_frames(data, offset):
+            if samples != frame_samples or rate != sample_rate:
+                raise ValueError('MPEG audio frames of different lengths')
+            offsets.append(offset)
+    return frame_samples, sample_rate, offsets.tobytes()
+
+
+def read_wav_duration(file_path):
+    """
+    Read the duration in seconds of the WAV file with path
+    'file_path' from the sizes of its RIFF chunks, without reading
+    the samples.
+    """
+    with open(file_path, 'rb') as wav_file:
+        file_size = os.fstat(wav_file.fileno()).st_size
+        riff_header = wav_file.read(12)
+        if len(riff_header) < 12 or riff_header[:4] != b'RIFF' \
+                or riff_header[8:] != b'WAVE':
+            raise ValueError('not a RIFF WAVE file')
+        format_tag = byte_rate = sample_rate = samples_count = None
+        while True:
+            chunk_header = wav_file.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError('no data chunk found')
+            chunk_id = chunk_header[:4]
+            chunk_size, = struct.unpack('<I', chunk_header[4:])
+            if chunk_id == b'fmt ':
+                format_tag, _, sample_rate, byte_rate = struct.unpack(
+                    '<HHII', wav_file.read(12)
+                )
+                chunk_size -= 12
+            elif chunk_id == b'fact' and chunk_size >= 4:
+                samples_count, = struct.unpack('<I', wav_file.read(4))
+                chunk_size -= 4
+            elif chunk_id == b'data':
+                if not byte_rate:
+                    raise ValueError('no fmt chunk before data chunk')
+                # Since recorders that are stopped unexpectedly leave a
+                # wrong (usually 0 or 0xFFFFFFFF) size behind, we trust
+                # the size of the file more.
+                data_size = min(chunk_size, file_size - wav_file.tell())
+                if data_size <= 0:
+                    data_size = file_size - wav_file.tell()
+                # The data of compressed formats (anything but PCM,
+                # IEEE float and extensible) is counted by fact chunk.
+                if format_tag not in (1, 3, 0xFFFE) \
+                        and samples_count is not None:
+                    return samples_count / sample_rate
+                return data_size / byte_rate
+            # Chunks are aligned to 2 bytes.
+            wav_file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def read_duration(file_path):
+    """
+    Read the duration in seconds of the file with path 'file_path'
+    from the headers of its container, or raise ValueError if its
+    type is not supported or it is corrupted.
+    """
+    if file_path.lower().endswith('.mp3'):
+        return read_mp3_duration(file_path)
+    elif file_path.lower().endswith('.wav'):
+        return read_wav_duration(file_path)
+    raise ValueError('unsupported file type')
+
+
+def get_audio_payload(file_path):
+    """
+    Return the offset and the length of the audio inside the MP3 or
+    WAV file with path 'file_path': its MPEG audio frames without ID3
+    and APE tags, or the samples of its 'data' chunk without the other
+    RIFF chunks. Only the headers and the end of the file are read.
+    Raise ValueError if its type is not supported or it is corrupted.
+    """
+    if file_path.lower().endswith('.mp3'):
+        with open(file_path, 'rb') as mp3_file, mmap.mmap(
+            mp3_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            offset = find_mp3_audio(data)
+            end = len(data)
+            if data[end - 128:end - 125] == b'TAG':
+                # An ID3v1 tag is the last 128 bytes of the file.
+                end -= 128
+            if data[end - 32:end - 24] == b'APETAGEX':
+                # The footer of an APEv2 tag holds the size of the tag
+                # (without its header) and whether it has a header.
+                tag_size, _, flags = struct.unpack(
+                    '<III', data[end - 20:end - 8]
+                )
+                end -= tag_size + (32 if flags & 0x80000000 else 0)
+            return offset, max(0, end - offset)
+    elif file_path.lower().endswith('.wav'):
+        with open(file_path, 'rb') as wav_file:
+            file_size = os.fstat(wav_file.fileno()).st_size
+            riff_header = wav_file.read(12)
+            if len(riff_header) < 12 or riff_header[:4] != b'RIFF' \
+                    or riff_header[8:] != b'WAVE':
+                raise ValueError('not a RIFF WAVE file')
+            while True:
+                chunk_header = wav_file.read(8)
+                if len(chunk_header) < 8:
+                    raise ValueError('no data chunk found')
+                chunk_size, = struct.unpack('<I', chunk_header[4:])
+                if chunk_header[:4] == b'data':
+                    offset = wav_file.tell()
+                    return offset, min(chunk_size, file_size - offset)
+                wav_file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    raise ValueError('unsupported file type')
+
+
+def read_payload_size(file_path):
+    """
+    Return the length of the audio inside the file with path
+    'file_path' (see get_audio_payload()), or None if it could not be
+    read. This function runs inside the worker processes of duplicate
+    finding.
+    """
+    try:
+        return get_audio_payload(file_path)[1]
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def hash_audio_payload(file_path, quick=False):
+    """
+    Return the SHA-1 hash of the audio inside the file with path
+    'file_path', so copies with other tags or names have the same
+    hash, or None if it could not be read. A 'quick' hash only reads
+    three blocks of 16 KB, from the beginning, the middle and the end
+    of the audio. This function runs inside the worker processes of
+    duplicate finding.
+    """
+    block_size = 16 * 1024
+    digest = hashlib.sha1()
+    try:
+        offset, length = get_audio_payload(file_path)
+        with open(file_path, 'rb') as audio_file:
+            if quick and length > 3 * block_size:
+                for block_offset in (
+                    offset,
+                    offset + (length - block_size) // 2,
+                    offset + length - block_size,
+                ):
+                    audio_file.seek(block_offset)
+                    digest.update(audio_file.read(block_size))
+            else:
+                audio_file.seek(offset)
+                while length > 0:
+                    block = audio_file.read(min(length, 1024 * 1024))
+                    if len(block) == 0:
+                        break
+                    digest.update(block)
+                    length -= len(block)
+    except (OSError, ValueError, struct.error):
+        return None
+    return digest.hexdigest()
+
+
+def hash_duplicate_candidates(entries, executor):
+    """
+    Find the hashes that are needed to tell the duplicates among
+    'entries', a dictionary of the audio length and hash (None if they
+    are not known yet) of songs keyed by their path, and return the
+    new lengths and hashes in the same form. The work runs inside
+    pool 'executor' in three steps, so most songs are never read
+    fully: the length of the audio is read from the headers of the
+    songs, songs of the same length get a quick hash, and only songs
+    whose quick hashes are the same too are hashed fully. This
+    function runs on a worker thread, so it must not use the database.
+    """
+    found = {}
+    unknown = [path for path, (size, _) in entries.items() if size is None]
+    for path, size in zip(unknown, executor.map(
+        read_payload_size, unknown, chunksize=64
+    )):
+        if size is not None:
+            found[path] = (size, None)
+    sizes = {}
+    for path, (size, payload_hash) in entries.items():
+        size = found.get(path, (size,))[0]
+        if size is not None:
+            sizes.setdefault(size, []).append((path, payload_hash))
+
+    # A song whose audio has a length of its own has no duplicate; the
+    # songs of a length whose songs are all hashed are done.
+    candidates = [
+        (path, size)
+        for size, songs in sizes.items()
+        if len(songs) > 1 and any(h is None for _, h in songs)
+        for path, _ in songs
+    ]
+    quick_hashes = {}
+    for (path, size), quick_hash in zip(candidates, executor.map(
+        partial(hash_audio_payload, quick=True),
+        [path for path, _ in candidates], chunksize=16,
+    )):
+        if quick_hash is not None:
+            quick_hashes.setdefault((size, quick_hash), []).append(path)
+    full_candidates = [
+        (path, size)
+        for (size, _), paths in quick_hashes.items() if len(paths) > 1
+        for path in paths
+        if entries[path][1] is None or path in found
+    ]
+    for (path, size), payload_hash in zip(full_candidates, executor.map(
+        hash_audio_payload, [path for path, _ in full_candidates],
+    )):
+        if payload_hash is not None:
+            found[path] = (size, payload_hash)
+    return found
+
+
+def k_weighting_power(rate, segment_length):
+    """
+    Return the power response of the K-weighting filter of ITU-R
+    BS.1770 (a high shelf of about +4 dB above 1.7 kHz and a high-pass
+    filter at 38 Hz) for sample rate 'rate', at the frequencies of the
+    real FFT of 'segment_length' samples, as a NumPy array.
+    """
+    import numpy as np
+
+    # The filters are the biquads of the recommendation, designed for
+    # any sample rate from their analog parameters (as libebur128
+    # does).
+    k = np.tan(np.pi * 1681.974450955533 / rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = np.array([
+        vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k,
+    ]) / a0
+    shelf_a = np.array([a0, 2 * (k * k - 1), 1 - k / q + k * k]) / a0
+    k = np.tan(np.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    high_pass_b = np.array([1, -2, 1])
+    high_pass_a = np.array([1 + k / q + k * k, 2 * (k * k - 1),
+                            1 - k / q + k * k]) / (1 + k / q + k * k)
+    z = np.exp(-1j * 2 * np.pi * np.fft.rfftfreq(segment_length))
+    powers = [z ** 0, z, z ** 2]
+    response = np.ones(len(z))
+    for b, a in ((shelf_b, shelf_a), (high_pass_b, high_pass_a)):
+        response = response * np.abs(
+            sum(b[k] * powers[k] for k in range(3))
+            / sum(a[k] * powers[k] for k in range(3))
+        ) ** 2
+    return response
+
+
+def get_sample_scale(samples):
+    """
+    Return the zero and the full scale of the samples of NumPy array
+    'samples', whose type is the sample format of pygame.mixer (signed
+    or unsigned integers of any size, or floating point numbers), so
+    (samples - zero) / full_scale is from -1 to 1.
+    """
+    import numpy as np
+
+    if samples.dtype.kind == 'f':
+        return 0, 1.0
+    info = np.iinfo(samples.dtype)
+    full_scale = (int(info.max) - int(info.min) + 1) // 2
+    return int(info.min) + full_scale, full_scale
+
+
+def measure_loudness(samples, rate):
+    """
+    Measure the integrated loudness in LUFS and the sample peak (1.0
+    is full scale) of samples 'samples', a NumPy array of one column
+    per channel in any sample format (see get_sample_scale()), and
+    return them; the loudness is None if the samples are silent. The
+    samples are cut into segments of 100 ms, the K-weighted power of
+    every segment is found with one FFT of all segments, and the
+    gated blocks of 400 ms of ITU-R BS.1770 are made of four segments
+    each.
+    """
+    import numpy as np
+
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    zero, full_scale = get_sample_scale(samples)
+    # The peak is found from both extremes, since the absolute value
+    # of the lowest sample of signed integers does not fit their type.
+    peak = max(
+        float(samples.max(initial=zero)) - zero,
+        zero - float(samples.min(initial=zero)),
+    ) / full_scale
+    segment_length = rate // 10
+    segments_count = len(samples) // segment_length
+    if segments_count < 4:
+        return None, peak
+    response = k_weighting_power(rate, segment_length)
+    powers = np.zeros(segments_count)
+    # The channels are summed with the same weight (of the left and
+    # right channels); segments are taken a few seconds at a time to
+    # keep the memory of long songs small.
+    step = 600
+    for first in range(0, segments_count, step):
+        last = min(first + step, segments_count)
+        for channel in range(samples.shape[1]):
+            segments = samples[
+                first * segment_length:last * segment_length, channel
+            ].reshape(-1, segment_length).astype(np.float32)
+            segments = (segments - zero) / full_scale
+            spectrum = np.fft.rfft(segments, axis=1)
+            energy = (spectrum.real ** 2 + spectrum.imag ** 2) @ response
+            # By Parseval's theorem, the mean square of the filtered
+            # segment is its weighted spectral energy over length².
+            powers[first:last] += 2 * energy / segment_length ** 2
+    # Blocks of 400 ms that overlap by 75%.
+    blocks = np.convolve(powers, np.full(4, 0.25), mode='valid')
+    with np.errstate(divide='ignore'):
+        blocks_loudness = -0.691 + 10 * np.log10(blocks)
+    # Absolute gate of -70 LUFS, then relative gate of 10 LU below the
+    # loudness of the blocks that pass the absolute gate.
+    blocks = blocks[blocks_loudness > -70]
+    if len(blocks) == 0:
+        return None, peak
+    relative_gate = -0.691 + 10 * np.log10(blocks.mean()) - 10
+    blocks = blocks[-0.691 + 10 * np.log10(blocks) > relative_gate]
+    return float(-0.691 + 10 * np.log10(blocks.mean())), peak
+
+
+def analyze_loudness(file_path):
+    """
+    Decode the file with path 'file_path' with pygame.mixer (which
+    must be initialized) and return its integrated loudness and sample
+    peak (see measure_loudness()).
+    """
+    from pygame import sndarray
+
+    rate = mixer.get_init()[0]
+    sound = mixer.Sound(file_path)
+    # The samples are a view on the sound, not a copy of them, and the
+    # sound is kept until they are measured.
+    return measure_loudness(sndarray.samples(sound), rate)
+
+
+def get_loudness_gain(loudness, peak):
+    """
+    Return the gain in dB that brings a song of integrated loudness
+    'loudness' and sample peak 'peak' to TARGET_LOUDNESS, lowered so
+    the peak is not clipped; return 0 if the loudness is not known.
+    """
+    if loudness is None:
+        return 0.0
+    gain = TARGET_LOUDNESS - loudness
+    if peak:
+        gain = min(gain, -20 * math.log10(peak))
+    return gain
+
+
+def run_loudness_analysis(files_list, results, stopped):
+    """
+    Analyze the loudness of the files of 'files_list' on a pool of
+    LOUDNESS_WORKERS worker threads (decoding and NumPy release the
+    GIL, so they run in parallel) and put a tuple of the path and the
+    result of every file that has been analyzed in queue 'results',
+    then None when all files are done; files that are left when event
+    'stopped' is set are skipped. This function runs on a worker thread, so it must not
+    use the database.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def analyze(file_path):
+        if stopped.is_set():
+            return file_path, None
+        try:
+            return file_path, analyze_loudness(file_path)
+        except Exception as e:
+            # Skip the files that could not be decoded; they will be
+            # tried again on the next analysis.
+            print('LIBRARY: could not analyze "{}" ({}).'.format(
+                    file_path, e))
+            return file_path, None
+
+    with ThreadPoolExecutor(max_workers=LOUDNESS_WORKERS) as executor:
+        for file_path, result in executor.map(analyze, files_list):
+            if result is not None:
+                results.put((file_path, result))
+    results.put(None)
+
+
+def iter_audio_pieces(file_path, piece_seconds=AUDIO_PIECE_SECONDS):
+    """
+    Decode the file with path 'file_path' with pygame.mixer (which
+    must be initialized) about 'piece_seconds' seconds at a time, and
+    yield a tuple of the start and the end of each piece, as fractions
+    of the song, and its samples (see pygame.sndarray.samples()), so a
+    long song is never decoded whole. MP3 files are cut between their
+    frames and WAV files between their sample frames; other files (and
+    WAV files that wave module does not read) are decoded whole as one
+    piece.
+    """
+    from pygame import sndarray
+
+    lower_path = file_path.lower()
+    if lower_path.endswith('.mp3'):
+        with open(file_path, 'rb') as mp3_file, mmap.mmap(
+            mp3_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            # The offset of the first frame of every piece and the
+            # samples before it, and the same of the end of the audio.
+            bounds = []
+            total_samples = 0
+            end = find_mp3_audio(data)
+            for offset, frame_length, samples, rate in iter_mp3_frames(
+                data, end
+            ):
+                if (
+                    len(bounds) == 0
+                    or total_samples - bounds[-1][1] >= piece_seconds * rate
+                ):
+                    bounds.append((offset, total_samples))
+                total_samples += samples
+                end = offset + frame_length
+            if total_samples == 0:
+                return
+            bounds.append((end, total_samples))
+            for (start, first), (stop, last) in zip(bounds, bounds[1:]):
+                # A piece of frames is a valid MP3 file itself.
+                sound = mixer.Sound(file=BytesIO(data[start:stop]))
+                yield (
+                    first / total_samples, last / total_samples,
+                    sndarray.samples(sound),
+                )
+        return
+    wav_file = None
+    if lower_path.endswith('.wav'):
+        import wave
+
+        try:
+            wav_file = wave.open(file_path, 'rb')
+        except (wave.Error, EOFError):
+            # The formats that wave module does not read (like samples
+            # of floating point) are decoded whole.
+            pass
+    if wav_file is not None:
+        with wav_file:
+            params = wav_file.getparams()
+            piece_frames = int(piece_seconds * params.framerate)
+            frame_size = params.sampwidth * params.nchannels
+            done = 0
+            while done < params.nframes:
+                frames = wav_file.readframes(piece_frames)
+                if len(frames) < frame_size:
+                    break
+                # Since the mixer only decodes whole files, each piece
+                # is given the header of the file.
+                piece = BytesIO()
+                with wave.open(piece, 'wb') as piece_file:
+                    piece_file.setparams(params)
+                    piece_file.writeframes(frames)
+                piece.seek(0)
+                sound = mixer.Sound(file=piece)
+                count = len(frames) // frame_size
+                yield (
+                    done / params.nframes,
+                    min(done + count, params.nframes) / params.nframes,
+                    sndarray.samples(sound),
+                )
+                done += count
+    else:
+        sound = mixer.Sound(file_path)
+        yield 0.0, 1.0, sndarray.samples(sound)
+
+
+def compute_waveform(file_path, columns=WAVEFORM_COLUMNS):
+    """
+    Decode the file with path 'file_path' with pygame.mixer (which
+    must be initialized) and return the lowest and highest samples of
+    all channels in each of 'columns' equal parts of the song, as the
+    bytes of a NumPy array of 'uint8' (the samples from full scale
+    below zero to full scale above it are scaled to 0 to 255) with one
+    row of two values per column. The
+    song is decoded a piece at a time (see iter_audio_pieces()), and
+    the columns that a piece covers are merged with the pieces before
+    it.
+    """
+    import numpy as np
+
+    lowest = np.full(columns, np.inf)
+    highest = np.full(columns, -np.inf)
+    zero, full_scale = 0, 1
+    for start, end, samples in iter_audio_pieces(file_path):
+        if len(samples) == 0 or end <= start:
+            continue
+        zero, full_scale = get_sample_scale(samples)
+        first_column = int(start * columns)
+        last_column = min(math.ceil(end * columns), columns)
+        # The first sample of every column inside the piece; columns
+        # shorter than a sample repeat samples in several columns.
+        # Reducing the columns first and the channels last is much
+        # faster than the other way round.
+        starts = (
+            (np.arange(first_column, last_column) / columns - start)
+            / (end - start) * len(samples)
+        ).astype(np.intp).clip(0, len(samples) - 1)
+        piece_lowest = np.minimum.reduceat(samples, starts, axis=0)
+        piece_highest = np.maximum.reduceat(samples, starts, axis=0)
+        if samples.ndim == 2:
+            piece_lowest = piece_lowest.min(axis=1)
+            piece_highest = piece_highest.max(axis=1)
+        part = slice(first_column, last_column)
+        np.minimum(lowest[part], piece_lowest, out=lowest[part])
+        np.maximum(highest[part], piece_highest, out=highest[part])
+    # The columns that no samples fell in are silent.
+    empty = lowest > highest
+    lowest[empty] = 0
+    highest[empty] = 0
+    peaks = np.column_stack((lowest, highest))
+    peaks = (peaks - zero) / full_scale * 128 + 128
+    return peaks.clip(0, 255).astype(np.uint8).tobytes()
+
+
+def probe_file(file_path, tags_keys_list):
+    """
+    Read size, modification time, duration, tags with keys of
+    'tags_keys_list' parameter and a hash of the artwork of the file
+    with path 'file_path' and return them as a dictionary. This
+    function runs inside the worker processes of folder imports, so
+    it must not use pygame.mixer or any widget.
+    """
+    import audio_metadata
+
+    file_stat = os.stat(file_path)
+    file_metadata = audio_metadata.load(file_path)
+    try:
+        duration = read_duration(file_path)
+    except (ValueError, struct.error):
+        duration = file_metadata.streaminfo.duration
+    entry = {
+        'path': file_path,
+        'size': file_stat.st_size,
+        'mtime': file_stat.st_mtime,
+        'duration': duration,
+        # The hash is the key of the artwork in the artwork cache of
+        # the window; it is empty if the file has no artwork (None is
+        # left for the rows of older versions, which did not hash it).
+        'artwork_hash': '',
+    }
+    if len(file_metadata.pictures) != 0:
+        entry['artwork_hash'] = hashlib.sha1(
+            file_metadata.pictures[0].data
+        ).hexdigest()
+    metadata_tags = file_metadata.get('tags', {})
+    for key in tags_keys_list:
+        if key in metadata_tags:
+            entry[key] = str(metadata_tags[key][0])
+        else:
+            entry[key] = None
+    return entry
+
+
+def scan_directory(dir_path):
+    """
+    Walk the directory with path 'dir_path' and its subdirectories
+    and yield the path of every file of type mp3 or wav inside
+    them.
+    """
+    dirs_stack = [dir_path]
+    while len(dirs_stack) != 0:
+        try:
+            dir_entries = os.scandir(dirs_stack.pop())
+        except OSError:
+            continue
+        sub_dirs = []
+        files = []
+        with dir_entries:
+            for entry in dir_entries:
+                try:
+                    if entry.is_dir():
+                        sub_dirs.append(entry.path)
+                    elif (
+                        entry.name.endswith('.mp3')
+                        or entry.name.endswith('.wav')
+                    ):
+                        files.append(entry.path.replace('\\', '/'))
+                except OSError:
+                    continue
+        # Yield the files of each directory sorted by name (so
+        # the tracks of an album keep their order) and walk the
+        # subdirectories in the same order.
+        yield from sorted(files)
+        dirs_stack.extend(sorted(sub_dirs, reverse=True))
+
+
+def check_library_files(stored):
+    """
+    Stat the files of 'stored' parameter, a dictionary returned by
+    PlayerEngine.get_library_stats(), and return the list of the files
+    whose size or modification time has been changed and the list of
+    the files that no longer exist. This function does not use the
+    database, so it can run on a worker thread.
+    """
+    changed_files = []
+    missing_files = []
+    for file_path, stat in stored.items():
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            missing_files.append(file_path)
+            continue
+        if stat != (file_stat.st_size, file_stat.st_mtime):
+            changed_files.append(file_path)
+    return changed_files, missing_files
+
+
+def iter_playlist_file(file_path):
+    """
+    Read the playlist file of type M3U, M3U8 or PLS with path
+    'file_path' line by line and yield a tuple of path, duration and
+    title of each file of type mp3 or wav inside it (duration and
+    title are None if the playlist does not include them).
+    """
+    from urllib.request import url2pathname
+
+    base_dir = os.path.dirname(os.path.abspath(file_path))
+
+    def resolve(location):
+        # Return the absolute path of a location inside the playlist,
+        # or None if it is not a local file of a supported type.
+        if location.startswith('file://'):
+            location = url2pathname(unquote(urlparse(location).path))
+        elif '://' in location:
+            return None
+        location = location.replace('\\', '/')
+        if not (os.path.isabs(location) or location[1:3] == ':/'):
+            location = os.path.normpath(
+                os.path.join(base_dir, location)
+            ).replace('\\', '/')
+        if location.endswith('.mp3') or location.endswith('.wav'):
+            return location
+        return None
+
+    def parse_duration(text):
+        # Return the duration in seconds, or None if it is unknown.
+        try:
+            duration = float(text)
+        except ValueError:
+            return None
+        if duration < 0:
+            return None
+        return duration
+
+    with open(file_path, 'rb') as playlist_file:
+        lines = (
+            line.strip().decode('utf-8', errors='surrogateescape')
+            for line in playlist_file
+        )
+        if file_path.lower().endswith('.pls'):
+            # Entries of a PLS file are keys like 'File1', 'Title1'
+            # and 'Length1'; an entry is complete when the next one
+            # starts.
+            entry_number = None
+            entry = {}
+            for line in lines:
+                key, _, value = line.partition('=')
+                key_match = re.fullmatch(r'(File|Title|Length)(\d+)', key)
+                if key_match is None:
+                    continue
+                key, number = key_match.groups()
+                if number != entry_number:
+                    if 'File' in entry:
+                        yield entry['File'], entry.get('Length'), \
+                            entry.get('Title')
+                    entry_number = number
+                    entry = {}
+                if key == 'File':
+                    location = resolve(value)
+                    if location is not None:
+                        entry['File'] = location
+                elif key == 'Length':
+                    entry['Length'] = parse_duration(value)
+                else:
+                    entry['Title'] = value
+            if 'File' in entry:
+                yield entry['File'], entry.get('Length'), entry.get('Title')
+        else:
+            duration = title = None
+            for line in lines:
+                if line.startswith('\ufeff'):
+                    line = line[1:]
+                if line.startswith('#EXTINF:'):
+                    # '#EXTINF:<duration> <attributes>,<title>'
+                    info, _, title = line[8:].partition(',')
+                    duration = parse_duration(info.split(' ')[0])
+                    title = title.strip() or None
+                elif line != '' and not line.startswith('#'):
+                    location = resolve(line)
+                    if location is not None:
+                        yield location, duration, title
+                    duration = title = None
+
+
+def normalize_lyrics_key(text):
+    """
+    Return the artist or title 'text' in the form that lyrics are
+    cached by: lower case, without accents, text in parentheses or
+    brackets (like '(Remastered 2011)') and extra spaces.
+    """
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'\s*[(\[][^)\]]*[)\]]', '', text.casefold())
+    return ' '.join(text.split())
+
+
+def fetch_lyrics(token, artist, title, api_root=None):
+    """
+    Search Genius API with client access token 'token' for the song
+    with title 'title' by 'artist' and return its lyrics, or None if
+    it was not found. This function runs on a worker thread, so it
+    must not use the database or any widget. 'api_root' parameter
+    (if it is not None) replaces the address of Genius website, for
+    example with a local server.
+    """
+    import lyricsgenius as lg
+
+    genius = lg.Genius(
+        token,
+        skip_non_songs=True,
+        excluded_terms=['(Remix)', '(Live)'],
+        remove_section_headers=True,
+        timeout=10,
+    )
+    if api_root is not None:
+        api_root = api_root.rstrip('/') + '/'
+        genius.API_ROOT = api_root
+        genius.PUBLIC_API_ROOT = api_root + 'api/'
+        genius.WEB_ROOT = api_root
+    song = genius.search_song(title, artist)
+    if song is None or not song.lyrics:
+        return None
+    return song.lyrics
+
+
+# Events of inotify (see inotify(7)) that the folder watcher uses.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_ONLYDIR
+)
+# File systems that inotify does not see the changes of other
+# computers on; the folders on them are polled.
+NETWORK_FILE_SYSTEMS = {
+    '9p', 'afs', 'ceph', 'cifs', 'fuse.sshfs', 'nfs', 'nfs4', 'smb3',
+    'smbfs',
+}
+
+
+def load_inotify():
+    """
+    Load the C library with ctypes and return it if it has the
+    inotify functions of Linux; otherwise return None.
+    """
+    import ctypes
+    import ctypes.util
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+    except (OSError, TypeError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32,
+    ]
+    return libc
+
+
+def is_network_path(path):
+    """
+    Return True if the folder with path 'path' is on a network file
+    system (like a NAS mounted with NFS or SMB), according to the
+    mounts of Linux; otherwise return False.
+    """
+    try:
+        with open('/proc/self/mounts') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False
+    path = os.path.realpath(path)
+    mount_point, fs_type = '', None
+    for point, point_type in mounts:
+        # Spaces of mount points are written as '\040'.
+        point = point.replace('\\040', ' ')
+        if (
+            (path == point or path.startswith(point.rstrip('/') + '/'))
+            and len(point) > len(mount_point)
+        ):
+            mount_point, fs_type = point, point_type
+    return fs_type in NETWORK_FILE_SYSTEMS
+
+
+class VirtualListbox(Listbox):
+    """
+    A listbox that gets its rows from a backing model (any sequence)
+    and only keeps the rows in sight as items of the Tk listbox, so
+    scrolling and selecting cost the same for any size of the model.
+    The listbox can show only some items of the model (see set_rows).
+    Indexes of the methods below are indexes of the model.
+    """
+
+    def __init__(self, master, model, row_text, **options):
+        """
+        Initialize the listbox with model 'model' parameter; the text
+        of each row is made by calling 'row_text' parameter with the
+        item of the model.
+        """
+        Listbox.__init__(self, master, **options)
+        self.model = model
+        self.row_text = row_text
+        # Indexes of the shown items of the model, or None if all of
+        # them are shown; 'top' is a position in the shown items.
+        self.rows = None
+        self.top = 0
+        self.selection = None
+        self.active = None
+        self.yscrollcommand = None
+        # Replace the class bindings of Listbox, which work on the
+        # rows in sight, with the bindings of VirtualListbox.
+        self.bindtags(
+            (str(self), 'VirtualListbox', str(self.winfo_toplevel()), 'all')
+        )
+        self.bind_class('VirtualListbox', '<Button-1>', self.on_click)
+        self.bind_class('VirtualListbox', '<MouseWheel>', self.on_mousewheel)
+        self.bind_class('VirtualListbox', '<Button-4>', self.on_mousewheel)
+        self.bind_class('VirtualListbox', '<Button-5>', self.on_mousewheel)
+        self.bind_class('VirtualListbox', '<Prior>', self.on_page_key)
+        self.bind_class('VirtualListbox', '<Next>', self.on_page_key)
+
+    def configure(self, cnf=None, **kw):
+        """
+        Configure the listbox; 'yscrollcommand' option is kept and
+        called with the position of the rows in sight in the model.
+        """
+        if 'yscrollcommand' in kw:
+            self.yscrollcommand = kw.pop('yscrollcommand')
+            self.render()
+        return Listbox.configure(self, cnf, **kw)
+
+    config = configure
+
+    def rows_count(self):
+        """Return the number of rows in sight."""
+        return int(self.cget('height'))
+
+    def shown_count(self):
+        """Return the number of shown items of the model."""
+        if self.rows is None:
+            return len(self.model)
+        return len(self.rows)
+
+    def item_index(self, row):
+        """Return the index in the model of the shown row 'row'."""
+        if self.rows is None:
+            return row
+        return self.rows[row]
+
+    def row_index(self, index):
+        """
+        Return the position of the item with index 'index' in the
+        shown rows, or None if it is not shown.
+        """
+        if self.rows is None:
+            return index
+        row = bisect_left(self.rows, index)
+        if row < len(self.rows) and self.rows[row] == index:
+            return row
+        return None
+
+    def set_rows(self, rows, keep_position=False):
+        """
+        Show only the items of the model with indexes 'rows' (a sorted
+        list), or all of them if 'rows' is None, from the first one
+        (or from the same position, if 'keep_position' is True).
+        """
+        self.rows = rows
+        if not keep_position:
+            self.top = 0
+        self.render()
+
+    def render(self):
+        """Show the rows in sight and the selected row, if in sight."""
+        shown_count = self.shown_count()
+        rows_count = self.rows_count()
+        self.top = max(0, min(self.top, shown_count - rows_count))
+        bottom = min(self.top + rows_count, shown_count)
+        Listbox.delete(self, 0, 'end')
+        Listbox.insert(
+            self, 0,
+            *[
+                self.row_text(self.model[self.item_index(row)])
+                for row in range(self.top, bottom)
+            ]
+        )
+        for index, show in (
+            (self.selection, Listbox.selection_set),
+            (self.active, Listbox.activate),
+        ):
+            if index is None:
+                continue
+            row = self.row_index(index)
+            if row is not None and self.top <= row < bottom:
+                show(self, row - self.top)
+        if self.yscrollcommand is not None:
+            if shown_count == 0:
+                self.yscrollcommand(0.0, 1.0)
+            else:
+                self.yscrollcommand(self.top / shown_count, bottom / shown_count)
+
+    def refresh(self):
+        """
+        Show the rows again after the model has been changed and drop
+        the selection if its item no longer exists.
+        """
+        model_size = len(self.model)
+        if self.selection is not None and self.selection >= model_size:
+            self.selection = None
+        if self.active is not None and self.active >= model_size:
+            self.active = None
+        self.render()
+
+    def size(self):
+        """Return the number of shown items of the model."""
+        return self.shown_count()
+
+    def get(self, first, last=None):
+        """Return the text of the row with index 'first' parameter."""
+        return self.row_text(self.model[first])
+
+    def curselection(self):
+        """Return a tuple including the index of the selected row."""
+        if self.selection is None:
+            return ()
+        return (self.selection,)
+
+    def selection_set(self, first, last=None):
+        """Select the row with index 'first' parameter."""
+        if first == 'end':
+            if self.shown_count() == 0:
+                return
+            first = self.item_index(self.shown_count() - 1)
+        if 0 <= first < len(self.model):
+            self.selection = first
+        self.render()
+
+    select_set = selection_set
+
+    def selection_clear(self, first, last=None):
+        """Clear the selection."""
+        self.selection = None
+        Listbox.selection_clear(self, 0, 'end')
+
+    select_clear = selection_clear
+
+    def activate(self, index):
+        """Set the row with index 'index' parameter as the active row."""
+        self.active = index
+        self.render()
+
+    def nearest(self, y):
+        """Return the index of the row nearest to the y-coordinate 'y'."""
+        row = min(self.top + Listbox.nearest(self, y), self.shown_count() - 1)
+        if row < 0:
+            return row
+        return self.item_index(row)
+
+    def step(self, index, steps):
+        """
+        Return the index of the item shown 'steps' rows after (or
+        before, if it is negative) the item with index 'index', staying
+        inside the shown items.
+        """
+        if self.shown_count() == 0:
+            return index
+        row = self.row_index(index)
+        if row is None:
+            # Since the item is not shown, step from the nearest shown
+            # row in the direction of the steps.
+            row = bisect_left(self.rows, index) - (steps > 0)
+        row = max(0, min(row + steps, self.shown_count() - 1))
+        return self.item_index(row)
+
+    def see(self, index):
+        """Scroll the listbox so the row with index 'index' is in sight."""
+        row = self.row_index(index)
+        if row is None:
+            return
+        rows_count = self.rows_count()
+        if row < self.top:
+            self.top = row
+        elif row >= self.top + rows_count:
+            self.top = row - rows_count + 1
+        else:
+            return
+        self.render()
+
+    def yview(self, *args):
+        """
+        Return the position of the rows in sight, or scroll the
+        listbox according to the arguments of a scrollbar command.
+        """
+        shown_count = self.shown_count()
+        if len(args) == 0:
+            if shown_count == 0:
+                return (0.0, 1.0)
+            bottom = min(self.top + self.rows_count(), shown_count)
+            return (self.top / shown_count, bottom / shown_count)
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * shown_count)
+        elif args[0] == 'scroll':
+            if args[2] == 'pages':
+                self.top += int(args[1]) * self.rows_count()
+            else:
+                self.top += int(args[1])
+        self.render()
+
+    def on_click(self, event):
+        """Select the clicked row."""
+        self.focus_set()
+        if self.shown_count() != 0:
+            self.selection = self.active = self.nearest(event.y)
+            self.render()
+
+    def on_mousewheel(self, event):
+        """Scroll the listbox with the mouse wheel."""
+        if event.num == 4:
+            units = -5
+        elif event.num == 5:
+            units = 5
+        elif abs(event.delta) >= 120:
+            units = -(event.delta // 120) * 4
+        else:
+            units = -event.delta
+        self.yview('scroll', units, 'units')
+
+    def on_page_key(self, event):
+        """Scroll the listbox a page on pressing Page Up and Page Down."""
+        if event.keysym == 'Prior':
+            self.yview('scroll', -1, 'pages')
+        else:
+            self.yview('scroll', 1, 'pages')
+
+
+class ShuffleOrder:
+    """
+    A shuffled order of the indexes of a PlayQueue. The order is drawn
+    one song at a time with the Fisher-Yates algorithm, so every song
+    is played once before any song is repeated, and the drawn part of
+    the order is kept as history for playing the previous songs.
+    """
+
+    def __init__(self, seed=None):
+        """
+        Initialize an empty order; a 'seed' parameter other than None
+        makes the order the same on every run.
+        """
+        self.random = random.Random(seed)
+        self.reset(0)
+
+    def reset(self, tracks_count, current=None):
+        """
+        Start a new order of 'tracks_count' songs, beginning with the
+        song with index 'current' parameter, if it is not None.
+        """
+        self.order = list(range(tracks_count))
+        self.slots = list(range(tracks_count))
+        self.drawn = 0
+        self.position = -1
+        self.next_order_first = None
+        if current is not None:
+            self.set_current(current)
+
+    def swap(self, slot_a, slot_b):
+        """Swap the songs in slots 'slot_a' and 'slot_b' of the order."""
+        order = self.order
+        order[slot_a], order[slot_b] = order[slot_b], order[slot_a]
+        self.slots[order[slot_a]] = slot_a
+        self.slots[order[slot_b]] = slot_b
+
+    def draw(self):
+        """
+        Draw a random song of the songs not drawn yet as the next one
+        of the order (one step of the Fisher-Yates shuffle).
+        """
+        self.swap(
+            self.drawn, self.random.randrange(self.drawn, len(self.order))
+        )
+        self.drawn += 1
+
+    def set_current(self, ix):
+        """
+        Set the song with index 'ix' as the playing song. A song that
+        is picked (not reached with next_index or previous_index) is
+        added to the end of the history, so the songs that have been
+        played are not played again after it.
+        """
+        slot = self.slots[ix]
+        if slot == self.position:
+            return
+        self.next_order_first = None
+        if slot >= self.drawn:
+            # The song has not been drawn yet, so put it next in the
+            # order, after the drawn songs.
+            self.swap(self.drawn, slot)
+            slot = self.drawn
+            self.drawn += 1
+        elif slot != self.drawn - 1:
+            # Move the song from its place in the history to the end of
+            # it; only the songs drawn after it are shifted.
+            order = self.order
+            order.insert(self.drawn - 1, order.pop(slot))
+            for moved_slot in range(slot, self.drawn):
+                self.slots[order[moved_slot]] = moved_slot
+            slot = self.drawn - 1
+        self.position = slot
+
+    def next_index(self):
+        """
+        Return the index of the next song of the order and set it as
+        the playing song. After all songs have been played a new
+        order is started.
+        """
+        if len(self.order) == 0:
+            return None
+        if self.position + 1 == len(self.order):
+            first = self.peek_next_index()
+            self.reset(len(self.order), first)
+            return first
+        if self.position + 1 == self.drawn:
+            self.draw()
+        self.position += 1
+        return self.order[self.position]
+
+    def peek_next_index(self):
+        """
+        Return the index of the next song of the order without setting
+        it as the playing song; next_index returns the same song.
+        """
+        if len(self.order) == 0:
+            return None
+        if self.position + 1 == len(self.order):
+            # The next song is the first one of a new order, which is
+            # drawn now and kept until the new order is started.
+            if self.next_order_first is None:
+                last = self.order[self.position]
+                first = self.random.randrange(len(self.order))
+                if first == last and len(self.order) > 1:
+                    # Do not play the last song of the previous order
+                    # twice in a row.
+                    first = self.random.randrange(len(self.order) - 1)
+                    if first >= last:
+                        first += 1
+                self.next_order_first = first
+            return self.next_order_first
+        if self.position + 1 == self.drawn:
+            self.draw()
+        return self.order[self.position + 1]
+
+    def previous_index(self):
+        """
+        Return the index of the song played before the playing song
+        and set it as the playing song; return None if there is no
+        such song.
+        """
+        if self.position <= 0:
+            return None
+        self.position -= 1
+        return self.order[self.position]
+
+    def extend(self, tracks_count):
+        """Add 'tracks_count' songs to the end of the queue."""
+        first = len(self.order)
+        self.order.extend(range(first, first + tracks_count))
+        self.slots.extend(range(first, first + tracks_count))
+        self.next_order_first = None
+
+    def renumber(self, new_indexes):
+        """
+        Replace the index of each song of the order with its item in
+        'new_indexes' parameter, dropping the songs whose item is None.
+        This costs time proportional to the size of the queue, so it
+        is only used when many songs are removed at once.
+        """
+        order = []
+        drawn = 0
+        position = -1
+        for slot, ix in enumerate(self.order):
+            new_ix = new_indexes[ix]
+            if new_ix is None:
+                continue
+            if slot < self.drawn:
+                drawn += 1
+            if slot <= self.position:
+                position += 1
+            order.append(new_ix)
+        self.order = order
+        self.slots = [0] * len(order)
+        for slot, ix in enumerate(order):
+            self.slots[ix] = slot
+        self.drawn = drawn
+        self.position = min(position, drawn - 1)
+        self.next_order_first = None
+
+    def remove(self, ix):
+        """
+        Remove the song with index 'ix' of the queue. Only the songs
+        after it in the queue, and the songs drawn after it if it has
+        been drawn, are updated.
+        """
+        order = self.order
+        slots = self.slots
+        slot = slots.pop(ix)
+        # The songs after the removed song move one index down.
+        for new_ix in range(ix, len(slots)):
+            order[slots[new_ix]] = new_ix
+        if slot < self.drawn:
+            # Since the history keeps the order in which the songs
+            # were played, the songs drawn after the removed song are
+            # shifted down, which frees the last slot of the history.
+            for moved_slot in range(slot + 1, self.drawn):
+                order[moved_slot - 1] = order[moved_slot]
+                slots[order[moved_slot - 1]] = moved_slot - 1
+            self.drawn -= 1
+            if slot <= self.position:
+                self.position -= 1
+            slot = self.drawn
+        # The songs that have not been drawn are in no particular
+        # order, so the free slot is filled with the last one.
+        last = order.pop()
+        if slot < len(order):
+            order[slot] = last
+            slots[last] = slot
+        self.next_order_first = None
+
+    def move(self, ix, new_ix):
+        """
+        Move the song with index 'ix' of the queue to 'new_ix'; only
+        the songs between the two indexes are updated, so moving a
+        song by one place is a swap.
+        """
+        slots = self.slots
+        slots.insert(new_ix, slots.pop(ix))
+        for moved_ix in range(min(ix, new_ix), max(ix, new_ix) + 1):
+            self.order[slots[moved_ix]] = moved_ix
+
+
+class PlayQueue:
+    """
+    The songs of playing list, with the position of the playing song
+    kept as an index, so finding the next or previous song does not
+    need to search the list (and works when a song is in the list
+    more than once).
+    """
+
+    def __init__(self, shuffle_seed=None):
+        """
+        Initialize an empty queue; 'shuffle_seed' parameter is the
+        seed of the shuffled order of the songs.
+        """
+        self.tracks = []
+        self.current = None
+        self.shuffle_order = ShuffleOrder(shuffle_seed)
+        # The number of changes of the songs, so the data that is
+        # made from them can be made again when they change.
+        self.changes = 0
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __getitem__(self, ix):
+        return self.tracks[ix]
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    @property
+    def current_track(self):
+        """Return the path of the playing song, or None."""
+        if self.current is None:
+            return None
+        return self.tracks[self.current]
+
+    def set_current(self, ix):
+        """Set the song with index 'ix' as the playing song."""
+        self.current = ix
+        self.shuffle_order.set_current(ix)
+
+    def extend(self, tracks):
+        """Add songs 'tracks' to the end of the queue."""
+        tracks_count = len(self.tracks)
+        self.tracks.extend(tracks)
+        self.shuffle_order.extend(len(self.tracks) - tracks_count)
+        self.changes += 1
+
+    def replace(self, tracks):
+        """Replace all songs of the queue with songs 'tracks'."""
+        self.tracks = list(tracks)
+        self.current = None
+        self.shuffle_order.reset(len(self.tracks))
+        self.changes += 1
+
+    def clear(self):
+        """Remove all songs of the queue."""
+        self.replace([])
+
+    def remove(self, ix):
+        """Remove the song with index 'ix' and return its path."""
+        track = self.tracks.pop(ix)
+        self.shuffle_order.remove(ix)
+        self.changes += 1
+        if self.current is not None:
+            if ix < self.current:
+                self.current -= 1
+            elif ix == self.current:
+                self.current = None
+        return track
+
+    def remove_many(self, ixs):
+        """
+        Remove the songs with indexes 'ixs' at once; the songs and the
+        shuffled order are made again only once, however many songs
+        are removed.
+        """
+        removed = set(ixs)
+        if len(removed) == 0:
+            return
+        new_indexes = []
+        tracks = []
+        for ix, track in enumerate(self.tracks):
+            if ix in removed:
+                new_indexes.append(None)
+            else:
+                new_indexes.append(len(tracks))
+                tracks.append(track)
+        self.tracks = tracks
+        self.shuffle_order.renumber(new_indexes)
+        self.changes += 1
+        if self.current is not None:
+            self.current = new_indexes[self.current]
+
+    def move(self, ix, new_ix):
+        """Move the song with index 'ix' to index 'new_ix'."""
+        self.tracks.insert(new_ix, self.tracks.pop(ix))
+        self.shuffle_order.move(ix, new_ix)
+        self.changes += 1
+        if self.current is not None:
+            if self.current == ix:
+                self.current = new_ix
+            elif ix < self.current <= new_ix:
+                self.current -= 1
+            elif new_ix <= self.current < ix:
+                self.current += 1
+
+    def rename(self, new_paths):
+        """
+        Replace the paths of the songs that are keys of dictionary
+        'new_paths' with their values, keeping their positions.
+        """
+        renamed = False
+        for ix, track in enumerate(self.tracks):
+            new_path = new_paths.get(track)
+            if new_path is not None:
+                self.tracks[ix] = new_path
+                renamed = True
+        if renamed:
+            self.changes += 1
+
+    def next_index(self):
+        """
+        Return the index of the song after the playing one, which is
+        the first song after the last one.
+        """
+        if self.current is None or self.current == len(self.tracks)-1:
+            return 0
+        return self.current + 1
+
+    def previous_index(self):
+        """
+        Return the index of the song before the playing one, which is
+        the last song before the first one.
+        """
+        if self.current is None or self.current == 0:
+            return len(self.tracks) - 1
+        return self.current - 1
+
+    def shuffle_next_index(self):
+        """Return the index of the next song of the shuffled order."""
+        return self.shuffle_order.next_index()
+
+    def shuffle_peek_index(self):
+        """
+        Return the index of the next song of the shuffled order,
+        without setting it as the playing song.
+        """
+        return self.shuffle_order.peek_next_index()
+
+    def shuffle_previous_index(self):
+        """
+        Return the index of the song played before the playing song in
+        the shuffled order, or the playing song if there is none.
+        """
+        ix = self.shuffle_order.previous_index()
+        if ix is None:
+            return self.current
+        return ix
+
+    def reshuffle(self):
+        """Start a new shuffled order from the playing song."""
+        self.shuffle_order.reset(len(self.tracks), self.current)
+
+
+class FileSlice:
+    """
+    A read-only file object of the part of a file from byte 'start' to
+    its end, which pygame.mixer.music loads as if it was the whole
+    file; an MP3 file is played from any of its frames this way,
+    without the decoder reading the frames before it.
+    """
+
+    def __init__(self, file_path, start):
+        """Open the file with path 'file_path' at byte 'start'."""
+        self.file = open(file_path, 'rb')
+        self.start = start
+        self.file.seek(start)
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            offset += self.start
+        position = self.file.seek(offset, whence)
+        # The bytes before 'start' are not part of the slice.
+        if position < self.start:
+            position = self.file.seek(self.start)
+        return position - self.start
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def close(self):
+        self.file.close()
+
+
+class ArtworkCache:
+    """
+    The least recently used artworks, ready to be shown, keyed by a
+    hash of the picture inside the file. The artworks that have not
+    been shown for the longest time are dropped when the sizes of all
+    artworks (in bytes of pixels) exceed a budget.
+    """
+
+    def __init__(self, max_bytes):
+        """Initialize an empty cache of 'max_bytes' bytes at most."""
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """
+        Return the artwork with key 'key' and mark it as the most
+        recently used one, or return None if it is not in the cache.
+        """
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, artwork, size):
+        """
+        Keep the artwork 'artwork' of 'size' bytes with key 'key', and
+        drop the least recently used artworks until the cache fits in
+        its budget (the new artwork is kept even if it is bigger than
+        the budget).
+        """
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (artwork, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, dropped_size) = self.entries.popitem(last=False)
+            self.total_bytes -= dropped_size
+
+
+class Tracer:
+    """
+    Opt-in timing of the hot paths of the player. While it is enabled,
+    every traced call is kept as a span (its name, start and duration)
+    and counted in a histogram of durations by name; while it is
+    disabled, a traced call only costs checking 'enabled'.
+    """
+
+    # Upper bounds in milliseconds of the buckets of the histograms;
+    # the last bucket counts the longer spans.
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self, max_spans=100000):
+        """
+        Initialize a disabled tracer that keeps the last 'max_spans'
+        spans.
+        """
+        self.enabled = False
+        self.spans = deque(maxlen=max_spans)
+        self.histograms = {}
+        self.origin = time.perf_counter()
+        self.profiler = None
+
+    def enable(self):
+        """Start recording spans."""
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording spans; the recorded ones are kept."""
+        self.enabled = False
+
+    def clear(self):
+        """Drop the recorded spans and histograms."""
+        self.spans.clear()
+        self.histograms = {}
+
+    def record(self, name, start, end, args=None):
+        """
+        Keep a span with name 'name' from 'start' to 'end' (values of
+        time.perf_counter) and arguments 'args' and count it in the
+        histogram of 'name'.
+        """
+        duration_ms = (end - start) * 1000
+        self.spans.append(
+            (name, start, duration_ms, threading.get_ident(), args)
+        )
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'buckets': [0] * (len(self.BUCKETS_MS) + 1),
+            }
+        histogram['count'] += 1
+        histogram['total_ms'] += duration_ms
+        histogram['max_ms'] = max(histogram['max_ms'], duration_ms)
+        histogram['buckets'][bisect_left(self.BUCKETS_MS, duration_ms)] += 1
+
+    def traced(self, name):
+        """
+        Return a decorator that records a span with name 'name' for
+        every call of the decorated function, while tracing is enabled.
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, start, time.perf_counter())
+            return wrapper
+        return decorator
+
+    def get_histograms(self):
+        """
+        Return the histograms with their mean in milliseconds and the
+        counts of their buckets keyed by the upper bound of each bucket.
+        """
+        histograms = {}
+        for name, histogram in sorted(self.histograms.items()):
+            bounds = ['<={}ms'.format(bound) for bound in self.BUCKETS_MS]
+            bounds.append('>{}ms'.format(self.BUCKETS_MS[-1]))
+            histograms[name] = {
+                'count': histogram['count'],
+                'total_ms': round(histogram['total_ms'], 3),
+                'mean_ms': round(
+                    histogram['total_ms'] / histogram['count'], 3
+                ),
+                'max_ms': round(histogram['max_ms'], 3),
+                'buckets': dict(zip(bounds, histogram['buckets'])),
+            }
+        return histograms
+
+    def export_json(self, file_path):
+        """Write the histograms and the spans to JSON file 'file_path'."""
+        data = {
+            'histograms': self.get_histograms(),
+            'spans': [
+                {
+                    'name': name,
+                    'start_ms': round((start - self.origin) * 1000, 3),
+                    'duration_ms': round(duration_ms, 3),
+                    'thread': thread_id,
+                    'args': args,
+                }
+                for name, start, duration_ms, thread_id, args in self.spans
+            ],
+        }
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+        print('TRACE: {} spans EXPORTED to "{}".'.format(
+                len(self.spans), file_path))
+
+    def export_chrome_trace(self, file_path):
+        """
+        Write the spans to file 'file_path' in the trace event format
+        of Chrome, which chrome://tracing and Perfetto can open.
+        """
+        pid = os.getpid()
+        events = []
+        for name, start, duration_ms, thread_id, args in self.spans:
+            event = {
+                'name': name, 'cat': name.split(':')[0], 'ph': 'X',
+                'ts': round((start - self.origin) * 1e6, 1),
+                'dur': round(duration_ms * 1000, 1),
+                'pid': pid, 'tid': thread_id,
+            }
+            if args is not None:
+                event['args'] = args
+            events.append(event)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        print('TRACE: {} spans EXPORTED to "{}".'.format(
+                len(events), file_path))
+
+    def start_profile(self):
+        """Start profiling every function call with cProfile."""
+        import cProfile
+
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self, file_path=None):
+        """
+        Stop profiling; write the statistics to file 'file_path' (which
+        pstats and snakeviz can open), or print the slowest functions
+        if it is None.
+        """
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        if file_path is not None:
+            self.profiler.dump_stats(file_path)
+            print('PROFILE: statistics SAVED to "{}".'.format(file_path))
+        else:
+            import pstats
+
+            pstats.Stats(self.profiler).sort_stats('cumulative').print_stats(25)
+        self.profiler = None
+
+
+# All hot paths report to this tracer; it is disabled until the user
+# turns it on (from Playback menu or with --trace option).
+TRACER = Tracer()
+
+
+class TracedCursor(sqlite3.Cursor):
+    """A cursor that records a span for every SQL statement it runs."""
+
+    def execute(self, sql, *args):
+        if not TRACER.enabled:
+            return super().execute(sql, *args)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            TRACER.record('sql: ' + ' '.join(sql.split())[:60], start,
+                          time.perf_counter(), {'sql': sql})
+
+    def executemany(self, sql, *args):
+        if not TRACER.enabled:
+            return super().executemany(sql, *args)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            TRACER.record('sql: ' + ' '.join(sql.split())[:60], start,
+                          time.perf_counter(), {'sql': sql})
+
+
+class FolderWatcher:
+    """
+    Watch the library folders ('roots') on a thread and report the
+    songs that are created (or changed), deleted or moved inside
+    them. Folders are watched with inotify where it is available;
+    folders on network file systems (or all folders, where inotify is
+    not available) are polled instead: the modification time of every
+    folder is kept and only the folders whose time has changed are
+    read again. Since rewriting a song (like changing its tags) does
+    not change the time of its folder, the songs of the other polled
+    folders are checked one by one too, less often.
+
+    The thread only reports changes through a queue; get_changes()
+    takes them on the thread that owns the database.
+    """
+
+    def __init__(self, roots, known_files, poll_interval=10.0,
+                 restat_interval=60.0):
+        """
+        Initialize a watcher of folders 'roots'. 'known_files' is a
+        dictionary of the size and modification time of the songs
+        that were inside them, keyed by their path (like the one
+        returned by PlayerEngine.get_library_stats()), so the changes
+        made while they were not watched are reported first. Polled
+        folders are checked every 'poll_interval' seconds and their
+        songs every 'restat_interval' seconds.
+        """
+        self.roots = [root.replace('\\', '/').rstrip('/') for root in roots]
+        self.known_files = known_files
+        # Library folders that could not be read yet (like a NAS that
+        # is not mounted); they are tried again on every poll.
+        self.unsynced_roots = list(self.roots)
+        self.poll_interval = poll_interval
+        self.restat_interval = restat_interval
+        # The size and modification time of the songs of every folder
+        # and the names of its subfolders, keyed by the folder.
+        self.files = {}
+        self.subdirs = {}
+        # The modification time of every polled folder.
+        self.dirs_mtimes = {}
+        self.inotify = None
+        self.fd = None
+        self.watches = {}
+        self.watched_dirs = {}
+        # Changes found since they were last reported; songs that are
+        # deleted and created with the same size and modification
+        # time are reported as moved.
+        self.created = {}
+        self.deleted = {}
+        self.moved = []
+        self.changes = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start watching on a daemon thread."""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop watching; the thread ends within half a second."""
+        self.stopped.set()
+
+    def get_changes(self):
+        """
+        Return the lists of created (or changed) songs, deleted songs
+        and (old path, new path) pairs of moved songs that have been
+        found since the last call, in the order they were found.
+        """
+        created, deleted, moved = [], [], []
+        while True:
+            try:
+                changes = self.changes.get_nowait()
+            except queue.Empty:
+                break
+            created.extend(changes[0])
+            deleted.extend(changes[1])
+            moved.extend(changes[2])
+        return created, deleted, moved
+
+    def run(self):
+        """Watch the folders until the watcher is stopped."""
+        self.inotify = load_inotify()
+        if self.inotify is not None:
+            self.fd = self.inotify.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if self.fd < 0:
+                self.fd = None
+        try:
+            self.sync_roots()
+            self.report()
+            next_poll = time.monotonic() + self.poll_interval
+            next_restat = time.monotonic() + self.restat_interval
+            while not self.stopped.is_set():
+                timeout = min(0.5, max(0, next_poll - time.monotonic()))
+                if self.fd is not None and len(self.watches) != 0:
+                    import select
+
+                    readable, _, _ = select.select([self.fd], [], [], timeout)
+                    if len(readable) != 0:
+                        self.read_events()
+                else:
+                    self.stopped.wait(timeout)
+                if time.monotonic() >= next_poll:
+                    restat = time.monotonic() >= next_restat
+                    self.sync_roots()
+                    self.poll_dirs(restat)
+                    next_poll = time.monotonic() + self.poll_interval
+                    if restat:
+                        next_restat = time.monotonic() + self.restat_interval
+                self.report()
+        finally:
+            if self.fd is not None:
+                os.close(self.fd)
+
+    def sync_roots(self):
+        """
+        Read the library folders that have not been read yet, start
+        watching them and keep the changes of their songs since they
+        were known.
+        """
+        for root in list(self.unsynced_roots):
+            polled = self.fd is None or is_network_path(root)
+            found = self.scan_tree(root, polled)
+            if root not in self.files:
+                # Since the folder could not be read, its songs are
+                # not taken as deleted.
+                continue
+            self.unsynced_roots.remove(root)
+            for path, stat in found.items():
+                if self.known_files.get(path) != stat:
+                    self.created[path] = stat
+            prefix = root + '/'
+            for path, stat in self.known_files.items():
+                if path.startswith(prefix) and path not in found:
+                    self.deleted[path] = stat
+            print('LIBRARY: watching "{}" ({}).'.format(
+                    root, 'polling' if polled else 'inotify'))
+        if len(self.unsynced_roots) == 0:
+            self.known_files = None
+
+    def report(self):
+        """Put the changes that have been found in the queue."""
+        for path in self.created:
+            self.deleted.pop(path, None)
+        # A song that has been moved keeps its size and modification
+        # time, which are unlikely to be the same for two songs.
+        created_by_stat = {}
+        for path, stat in self.created.items():
+            created_by_stat.setdefault(stat, []).append(path)
+        for old_path, stat in list(self.deleted.items()):
+            new_paths = created_by_stat.get(stat)
+            if new_paths is not None and len(new_paths) == 1:
+                del created_by_stat[stat]
+                del self.deleted[old_path]
+                del self.created[new_paths[0]]
+                self.moved.append((old_path, new_paths[0]))
+        if self.created or self.deleted or self.moved:
+            self.changes.put(
+                (list(self.created), list(self.deleted), self.moved)
+            )
+            self.created = {}
+            self.deleted = {}
+            self.moved = []
+
+    def read_dir(self, dir_path):
+        """
+        Read the folder with path 'dir_path' and return the size and
+        modification time of its songs keyed by their names, the
+        names of its subfolders and its modification time; or return
+        None if it could not be read.
+        """
+        files = {}
+        subdirs = set()
+        try:
+            dir_mtime = os.stat(dir_path).st_mtime
+            with os.scandir(dir_path) as dir_entries:
+                for entry in dir_entries:
+                    try:
+                        if entry.is_dir():
+                            subdirs.add(entry.name)
+                        elif (
+                            entry.name.endswith('.mp3')
+                            or entry.name.endswith('.wav')
+                        ):
+                            entry_stat = entry.stat()
+                            files[entry.name] = (
+                                entry_stat.st_size, entry_stat.st_mtime
+                            )
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        return files, subdirs, dir_mtime
+
+    def scan_tree(self, dir_path, polled):
+        """
+        Read the folder with path 'dir_path' and its subfolders, keep
+        their songs and watch them (or poll them, if 'polled' is True
+        or they can not be watched); return the size and modification
+        time of the songs that have been found, keyed by their path.
+        """
+        found = {}
+        dirs_stack = [dir_path]
+        while len(dirs_stack) != 0:
+            path = dirs_stack.pop()
+            if not polled and not self.add_watch(path):
+                polled = True
+            # Since the folder is read after it is watched, no song is
+            # missed if it is created meanwhile.
+            result = self.read_dir(path)
+            if result is None:
+                continue
+            files, subdirs, dir_mtime = result
+            self.files[path] = files
+            self.subdirs[path] = subdirs
+            if polled:
+                self.dirs_mtimes[path] = dir_mtime
+            for name, stat in files.items():
+                found[path + '/' + name] = stat
+            dirs_stack.extend(path + '/' + name for name in subdirs)
+        return found
+
+    def forget_tree(self, dir_path):
+        """
+        Stop watching the folder with path 'dir_path' and its
+        subfolders and return the size and modification time of the
+        songs that were inside them, keyed by their path.
+        """
+        forgotten = {}
+        prefix = dir_path + '/'
+        for path in [
+            path for path in self.files
+            if path == dir_path or path.startswith(prefix)
+        ]:
+            for name, stat in self.files.pop(path).items():
+                forgotten[path + '/' + name] = stat
+            self.subdirs.pop(path, None)
+            self.dirs_mtimes.pop(path, None)
+            wd = self.watched_dirs.pop(path, None)
+            if wd is not None:
+                del self.watches[wd]
+                self.inotify.inotify_rm_watch(self.fd, wd)
+        return forgotten
+
+    def move_tree(self, old_path, new_path):
+        """
+        Keep the folder with path 'old_path' and its subfolders, which
+        have been moved to 'new_path', under their new paths and
+        report their songs as moved.
+        """
+        prefix = old_path + '/'
+        for path in [
+            path for path in self.files
+            if path == old_path or path.startswith(prefix)
+        ]:
+            moved_path = new_path + path[len(old_path):]
+            files = self.files.pop(path)
+            self.files[moved_path] = files
+            self.subdirs[moved_path] = self.subdirs.pop(path)
+            if path in self.dirs_mtimes:
+                self.dirs_mtimes[moved_path] = self.dirs_mtimes.pop(path)
+            wd = self.watched_dirs.pop(path, None)
+            if wd is not None:
+                self.watched_dirs[moved_path] = wd
+                self.watches[wd] = moved_path
+            for name in files:
+                self.moved.append(
+                    (path + '/' + name, moved_path + '/' + name)
+                )
+
+    def add_watch(self, dir_path):
+        """
+        Watch the folder with path 'dir_path' with inotify and return
+        True, or return False if it could not be watched (like when
+        the limit of watches of the system has been reached).
+        """
+        if self.fd is None:
+            return False
+        wd = self.inotify.inotify_add_watch(
+            self.fd, os.fsencode(dir_path), INOTIFY_MASK
+        )
+        if wd < 0:
+            return False
+        self.watches[wd] = dir_path
+        self.watched_dirs[dir_path] = wd
+        return True
+
+    def read_events(self):
+        """Read the waiting events of inotify and keep their changes."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        moved_from = {}
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, name_length = struct.unpack_from(
+                'iIII', data, offset
+            )
+            name = os.fsdecode(
+                data[offset + 16:offset + 16 + name_length].rstrip(b'\0')
+            )
+            offset += 16 + name_length
+            if mask & IN_Q_OVERFLOW:
+                # Since some events have been dropped, we read all
+                # watched folders again.
+                self.rescan_watched()
+                continue
+            dir_path = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                if dir_path is not None:
+                    del self.watches[wd]
+                    self.watched_dirs.pop(dir_path, None)
+                continue
+            if dir_path is None or name == '':
+                continue
+            path = dir_path + '/' + name
+            if mask & IN_ISDIR:
+                subdirs = self.subdirs.setdefault(dir_path, set())
+                if mask & IN_MOVED_FROM:
+                    moved_from[cookie] = path
+                    subdirs.discard(name)
+                elif mask & IN_MOVED_TO and cookie in moved_from:
+                    self.move_tree(moved_from.pop(cookie), path)
+                    subdirs.add(name)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    self.created.update(self.scan_tree(path, False))
+                    subdirs.add(name)
+                elif mask & IN_DELETE:
+                    self.deleted.update(self.forget_tree(path))
+                    subdirs.discard(name)
+            elif name.endswith('.mp3') or name.endswith('.wav'):
+                files = self.files.setdefault(dir_path, {})
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    stat = files.pop(name, None)
+                    if stat is not None:
+                        self.deleted[path] = stat
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    try:
+                        file_stat = os.stat(path)
+                    except OSError:
+                        continue
+                    stat = (file_stat.st_size, file_stat.st_mtime)
+                    if files.get(name) != stat:
+                        files[name] = stat
+                        self.created[path] = stat
+        # The folders that have been moved out of the watched folders
+        # are gone.
+        for path in moved_from.values():
+            self.deleted.update(self.forget_tree(path))
+
+    def rescan_watched(self):
+        """
+        Read all folders that are watched with inotify again and keep
+        the changes since they were read.
+        """
+        for root in self.roots:
+            if root in self.watched_dirs:
+                old_files = self.forget_tree(root)
+                new_files = self.scan_tree(root, False)
+                for path, stat in new_files.items():
+                    if old_files.pop(path, None) != stat:
+                        self.created[path] = stat
+                self.deleted.update(old_files)
+
+    def poll_dirs(self, restat=False):
+        """
+        Read the polled folders whose modification time has changed
+        again and keep the changes of their songs and subfolders; if
+        'restat' is True, check the size and modification time of
+        every song of the other polled folders too.
+        """
+        for dir_path, dir_mtime in list(self.dirs_mtimes.items()):
+            if dir_path not in self.dirs_mtimes:
+                # The folder has been forgotten with its parent.
+                continue
+            try:
+                if os.stat(dir_path).st_mtime == dir_mtime:
+                    if restat:
+                        self.restat_files(dir_path)
+                    continue
+            except OSError:
+                # A folder that is gone is forgotten by its parent; a
+                # library folder that is gone is kept, since a network
+                # folder may come back.
+                continue
+            result = self.read_dir(dir_path)
+            if result is None:
+                continue
+            files, subdirs, self.dirs_mtimes[dir_path] = result
+            old_files = self.files.get(dir_path, {})
+            for name, stat in files.items():
+                if old_files.get(name) != stat:
+                    self.created[dir_path + '/' + name] = stat
+            for name in old_files.keys() - files.keys():
+                self.deleted[dir_path + '/' + name] = old_files[name]
+            self.files[dir_path] = files
+            old_subdirs = self.subdirs.get(dir_path, set())
+            for name in subdirs - old_subdirs:
+                self.created.update(
+                    self.scan_tree(dir_path + '/' + name, True)
+                )
+            for name in old_subdirs - subdirs:
+                self.deleted.update(
+                    self.forget_tree(dir_path + '/' + name)
+                )
+            self.subdirs[dir_path] = subdirs
+
+    def restat_files(self, dir_path):
+        """
+        Check the size and modification time of the songs of the
+        polled folder with path 'dir_path' and keep the songs that
+        have been changed in place.
+        """
+        files = self.files.get(dir_path, {})
+        for name, stat in files.items():
+            path = dir_path + '/' + name
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                # A song that is gone changes the time of its folder,
+                # so it is found on the next poll.
+                continue
+            new_stat = (file_stat.st_size, file_stat.st_mtime)
+            if new_stat != stat:
+                files[name] = new_stat
+                self.created[path] = new_stat
+
+
+class PlayerEngine:
+    """
+    The part of the player that does not need a display: the playing
+    list, the transport state, the mixer and the database. The engine
+    tells what happens to the music through events; a window (or the
+    headless mode) subscribes to them, and passes the choices of the
+    user (like the selected song) to the engine as arguments.
+
+    Events and the arguments of their callbacks are:
+        'track_started' (track_ix): a song has started playing.
+        'paused' and 'unpaused' (): the music has been paused or
+            unpaused.
+        'stopped' (): the music has been stopped.
+        'list_ended' (): the last song has ended and nothing is played
+            after it.
+        'seeked' (position): the playing (or paused) song has been
+            seeked to time 'position' in milliseconds.
+    """
+
+    def __init__(self, db_path='db/playlists.db', shuffle_seed=None):
+        """
+        Connect to the database file with path 'db_path' (and create
+        its tables if they do not exist) and initialize an empty
+        playing list; 'shuffle_seed' parameter other than None makes
+        the shuffled order the same on every run.
+        """
+        self.conn = sqlite3.connect(db_path)
+        # Every statement of the cursor is timed while tracing is on.
+        self.c = self.conn.cursor(TracedCursor)
+
+        self.playing_list = PlayQueue(shuffle_seed)
+        self.playing = False
+        self.paused = False
+        self.repeat = False
+        self.shuffle = False
+        # When gapless playback is on, the next song is queued in the
+        # mixer while the playing song is still playing, so the mixer
+        # starts it right after the playing song ends.
+        self.gapless = False
+        self.queued_song = None
+        self.queued_track = None
+        self.position = 0
+        # The position of the mixer does not change when a song is
+        # seeked, so the time of the song is the position of the mixer
+        # plus the offset of the last seek.
+        self.mixer_position = 0
+        self.position_offset = 0
+        # The path, modification time and seek index (see
+        # build_seek_index()) of the last MP3 song that has been seeked.
+        self.seek_index = None
+        self.track_length = None
+        self.listeners = {}
+        # The volume of the user (from 0 to 1) and the gain of the
+        # playing song, which are multiplied for the mixer; the gain
+        # normalizes the loudness of songs if normalizing is on.
+        self.volume = 1.0
+        self.normalize = False
+        self.track_gain = 1.0
+
+        self.tags_keys_list = [
+            'title', 'album', 'albumartist', 'artist',
+            'composer', 'date', 'tracknumber', 'genre',
+        ]
+        # Tags of the library that the search box searches, besides
+        # the file name.
+        self.search_keys_list = [
+            'title', 'artist', 'albumartist', 'album', 'composer', 'genre',
+        ]
+        self.search_available = False
+        # Indexes of the songs of playing list keyed by their row ids
+        # in the library, made again after the database or the
+        # playing list has been changed.
+        self.playing_rowids = {}
+        self.playing_rowids_changes = None
+        # The number of changes of the paths inside the library, so
+        # other writes to the database (like waveforms or lyrics) do
+        # not make the indexes be mapped again.
+        self.library_version = 0
+
+        # Found lyrics are searched again after 30 days and songs
+        # without lyrics after a day.
+        self.lyrics_ttl = 30 * 24 * 60 * 60
+        self.lyrics_not_found_ttl = 24 * 60 * 60
+        # Songs of playlists that have been deleted from the library
+        # folders, so they are marked before they are played.
+        self.missing_tracks = set()
+
+        # Create tables of playlists and table 'library' that caches
+        # size, modification time, duration and tags of every file
+        # that has been read once.
+        self.create_table()
+        self.create_library_table()
+        self.create_search_table()
+        self.create_lyrics_table()
+        self.create_roots_table()
+        self.create_waveforms_table()
+        self.create_seek_indexes_table()
+        self.c.execute(
+            'SELECT DISTINCT track FROM playlist_items WHERE missing=1'
+        )
+        self.missing_tracks = {row[0] for row in self.c.fetchall()}
+
+    def subscribe(self, event, callback):
+        """Call 'callback' every time event 'event' happens."""
+        self.listeners.setdefault(event, []).append(callback)
+
+    def emit(self, event, *args):
+        """Call the callbacks of event 'event' with 'args'."""
+        for callback in self.listeners.get(event, []):
+            callback(*args)
+
+    def close(self):
+        """Stop the music and close the database."""
+        mixer.music.stop()
+        self.conn.close()
+
+    @TRACER.traced('transport: play_track')
+    def play_track(self, track_ix):
+        """Play the song with index 'track_ix' inside playing list."""
+        self.playing_list.set_current(track_ix)
+        mixer.music.load(self.playing_list.current_track)
+        self.update_track_gain()
+        mixer.music.play()
+        # Loading a song empties the queue of the mixer.
+        self.queued_song = None
+        self.queued_track = None
+        self.position = 0
+        self.mixer_position = 0
+        self.position_offset = 0
+        self.track_length = None
+        self.playing = True
+        self.paused = False
+        self.emit('track_started', track_ix)
+
+    def play_pause(self, track_ix=None, restart=False):
+        """
+        Play the song with index 'track_ix' (the first song if it is
+        None) if no song is playing, or if it is not the paused song,
+        or if 'restart' is True; otherwise pause the playing song or
+        unpause the paused song.
+        """
+        if len(self.playing_list) == 0:
+            return
+        if restart:
+            self.play_track(track_ix or 0)
+        elif self.playing:
+            self.pause()
+        elif self.paused and track_ix in (None, self.playing_list.current):
+            self.unpause()
+        else:
+            self.play_track(track_ix or 0)
+
+    @TRACER.traced('transport: pause')
+    def pause(self):
+        """Pause the playing song."""
+        mixer.music.pause()
+        self.playing = False
+        self.paused = True
+        self.emit('paused')
+
+    @TRACER.traced('transport: unpause')
+    def unpause(self):
+        """Unpause the paused song."""
+        mixer.music.unpause()
+        self.playing = True
+        self.paused = False
+        self.emit('unpaused')
+
+    @TRACER.traced('transport: stop')
+    def stop(self):
+        """Stop music, if something is playing."""
+        mixer.music.stop()
+        self.queued_song = None
+        self.queued_track = None
+        self.playing = False
+        self.paused = False
+        self.emit('stopped')
+
+    @TRACER.traced('transport: seek')
+    def seek(self, seconds):
+        """
+        Play the playing (or paused) song from time 'seconds'; return
+        False if nothing is playing or the mixer could not seek in the
+        song.
+        """
+        if not (self.playing or self.paused):
+            return False
+        track = self.playing_list.current_track
+        seek_index = None
+        if track.lower().endswith('.mp3'):
+            seek_index = self.get_seek_index(track)
+        if seek_index is not None:
+            # Since the decoder can only find a time inside a VBR file
+            # by decoding it from the start, we load the file from the
+            # frame of that time instead.
+            frame_samples, sample_rate, offsets = seek_index
+            frame_ix = max(0, min(
+                int(seconds * sample_rate / frame_samples), len(offsets) - 1
+            ))
+            try:
+                mixer.music.load(FileSlice(track, offsets[frame_ix]), 'mp3')
+                mixer.music.play()
+            except (OSError, pygame_error) as e:
+                print('MIXER: could not seek in "{}" ({}).'.format(track, e))
+                return False
+            if self.paused:
+                mixer.music.pause()
+            # Loading a song empties the queue of the mixer.
+            self.queued_song = None
+            self.mixer_position = 0
+            self.position = frame_ix * frame_samples * 1000 // sample_rate
+            self.position_offset = self.position
+            self.queue_next_track()
+        else:
+            try:
+                mixer.music.set_pos(seconds)
+            except pygame_error as e:
+                print('MIXER: could not seek in "{}" ({}).'.format(track, e))
+                return False
+            self.mixer_position = max(mixer.music.get_pos(), 0)
+            self.position = int(seconds * 1000)
+            self.position_offset = self.position - self.mixer_position
+        self.emit('seeked', self.position)
+        return True
+
+    @TRACER.traced('transport: next_track')
+    def next_track(self):
+        """Set the next song and play it."""
+        if self.playing_list.current is not None:
+            # Since the playing list includes the currently playing
+            # song, we set the next song to play it.
+            if self.shuffle:
+                next_song_ix = self.playing_list.shuffle_next_index()
+            else:
+                next_song_ix = self.playing_list.next_index()
+            self.play_track(next_song_ix)
+
+    @TRACER.traced('transport: previous_track')
+    def previous_track(self):
+        """Set the previous song and play it."""
+        if self.playing_list.current is not None:
+            # Since the playing list includes the currently playing
+            # song, we set the previous song to play it.
+            #
+            # Notice that when shuffle is enabled, the previous song
+            # is the one that was played before the playing song.
+            if self.shuffle:
+                previous_song_ix = self.playing_list.shuffle_previous_index()
+            else:
+                previous_song_ix = self.playing_list.previous_index()
+            self.play_track(previous_song_ix)
+
+    def set_repeat(self, repeat):
+        """Turn repeat on or off according to 'repeat' parameter."""
+        self.repeat = repeat
+        self.queue_next_track()
+
+    def set_shuffle(self, shuffle):
+        """
+        Turn shuffle on or off according to 'shuffle' parameter; a new
+        shuffled order is started when it is turned on.
+        """
+        self.shuffle = shuffle
+        if shuffle:
+            self.playing_list.reshuffle()
+        self.queue_next_track()
+
+    def set_gapless(self, gapless):
+        """
+        Turn gapless playback on or off according to 'gapless'
+        parameter, and queue the next song if it is turned on.
+        """
+        self.gapless = gapless
+        self.queue_next_track()
+
+    def set_volume(self, volume):
+        """Set the volume of the user to 'volume' (from 0 to 1)."""
+        self.volume = volume
+        self.apply_volume()
+
+    def set_normalize(self, normalize):
+        """
+        Turn normalizing the loudness of songs on or off according to
+        'normalize' parameter.
+        """
+        self.normalize = normalize
+        self.update_track_gain()
+
+    def update_track_gain(self):
+        """
+        Find the gain of the playing song (if normalizing is on) and
+        apply it to the volume of the mixer.
+        """
+        track = self.playing_list.current_track
+        if self.normalize and track is not None:
+            self.track_gain = 10 ** (self.get_track_gain(track) / 20)
+        else:
+            self.track_gain = 1.0
+        self.apply_volume()
+
+    def apply_volume(self):
+        """
+        Set the volume of the mixer to the volume of the user with the
+        gain of the playing song on top of it. Since the mixer can not
+        play louder than full volume, quiet songs are only raised as
+        far as the volume of the user leaves room for.
+        """
+        mixer.music.set_volume(min(1.0, self.volume * self.track_gain))
+
+    def get_upcoming_index(self):
+        """
+        Return the index of the song that plays after the playing song
+        ends, according to repeat and shuffle, without changing the
+        playing song; return None if the music stops after it.
+        """
+        current = self.playing_list.current
+        if current is None:
+            return None
+        if self.shuffle:
+            return self.playing_list.shuffle_peek_index()
+        if current == len(self.playing_list)-1 and not self.repeat:
+            return None
+        return self.playing_list.next_index()
+
+    def queue_next_track(self):
+        """
+        Queue the song that plays after the playing song in the mixer,
+        if gapless playback is on. This is called whenever the song
+        that plays next may have changed; the mixer keeps only the
+        last queued song.
+        """
+        if not self.gapless or not (self.playing or self.paused):
+            # Since a song can not be removed from the queue of the
+            # mixer, a queued song that is not wanted anymore is
+            # stopped when it starts (see start_queued_track).
+            self.queued_track = None
+            return
+        track_ix = self.get_upcoming_index()
+        self.queued_track = track_ix
+        if track_ix is None:
+            return
+        track = self.playing_list[track_ix]
+        if track == self.queued_song:
+            return
+        try:
+            mixer.music.queue(track)
+        except pygame_error:
+            print('MIXER: could not queue "{}".'.format(track))
+            self.queued_track = None
+            return
+        self.queued_song = track
+
+    @TRACER.traced('transport: start_queued_track')
+    def start_queued_track(self):
+        """
+        Set the queued song, which the mixer has started right after
+        the previous song ended, as the playing song; or stop it if it
+        is not the song that should play next anymore.
+        """
+        track_ix = self.queued_track
+        queued_song = self.queued_song
+        self.queued_track = None
+        self.queued_song = None
+        if (
+            track_ix is None
+            or track_ix >= len(self.playing_list)
+            or self.playing_list[track_ix] != queued_song
+        ):
+            # Since the song that should play next has changed after
+            # it was queued, we handle it as if the music had ended.
+            mixer.music.stop()
+            self.end_track()
+            return
+        if self.shuffle:
+            self.playing_list.shuffle_next_index()
+        self.playing_list.set_current(track_ix)
+        self.update_track_gain()
+        self.position = 0
+        self.mixer_position = 0
+        self.position_offset = 0
+        self.track_length = None
+        self.emit('track_started', track_ix)
+
+    @TRACER.traced('transport: end_track')
+    def end_track(self):
+        """
+        Play the song after the ended song, or stop if the ended song
+        was the last one in queue and repeat and shuffle are not
+        enabled.
+        """
+        if self.get_upcoming_index() is None:
+            self.playing = False
+            self.paused = False
+            self.emit('list_ended')
+        else:
+            self.next_track()
+
+    def poll(self):
+        """
+        Check the mixer and return the current time of the playing
+        song in milliseconds; or play the next song (or the queued
+        song, if the mixer has started it) and return None if the
+        playing song has ended. None is also returned if nothing is
+        playing. This must be called at least once a second while
+        a song is playing.
+        """
+        if not self.playing:
+            return None
+        if not mixer.music.get_busy():
+            # Since the playing song has been ended, we play the
+            # next song (if there is any).
+            self.end_track()
+            return None
+        mixer_position = max(mixer.music.get_pos(), 0)
+        if (
+            self.queued_song is not None
+            and mixer_position < self.mixer_position
+        ):
+            # Since the position of the mixer starts from 0 again, the
+            # queued song has been started by the mixer.
+            self.start_queued_track()
+            return None
+        self.mixer_position = mixer_position
+        self.position = mixer_position + self.position_offset
+        return self.position
+
+    def get_poll_delay(self):
+        """
+        Return the time in milliseconds after which poll should be
+        called again: when the shown second of the current time
+        changes, or as soon as the queued song starts.
+        """
+        delay = 1000 - self.position % 1000 + 5
+        if self.queued_song is not None and self.track_length:
+            remaining = int(self.track_length * 1000) - self.position
+            if 0 < remaining < delay:
+                delay = remaining + 20
+        return delay
+
+    @TRACER.traced('engine: get_track_length')
+    def get_track_length(self):
+        """
+        Return the total length in seconds of the playing song, from
+        the library (reading the file once if it is new or changed),
+        or None if it could not be read.
+        """
+        playing_song = self.playing_list.current_track
+        if playing_song is None:
+            return None
+        if self.track_length is not None:
+            return self.track_length
+        library_entry = self.get_library_entry(playing_song)
+        if library_entry is None:
+            # Since the file is new or has been changed, we read it
+            # once and keep its details in the library.
+            self.update_library([playing_song])
+            library_entry = self.get_library_entry(playing_song)
+        if library_entry is not None:
+            self.track_length = library_entry['duration']
+        else:
+            # Read the headers of the file (RIFF chunks of WAV files
+            # and Xing, VBRI or LAME header of MP3 files).
+            try:
+                self.track_length = read_duration(playing_song)
+            except (OSError, ValueError, struct.error):
+                return None
+        return self.track_length
+
+    def get_playlist_names(self):
+        """Return the names of saved playlists in the order of saving."""
+        self.c.execute('SELECT name FROM playlists ORDER BY id')
+        return [row[0] for row in self.c.fetchall()]
+
+    def get_library_info(self):
+        """
+        Return a dictionary of duration, title and artist of every file
+        inside the library, keyed by its path.
+        """
+        self.c.execute('SELECT path, duration, title, artist FROM library')
+        return {row[0]: row[1:] for row in self.c}
+
+    def create_table(self):
+        """
+        Create tables 'playlists' and 'playlist_items' inside the
+        database file 'playlists.db', if they do not exist; and move
+        the playlists saved in the older format, in which all files of
+        a playlist were kept as one JSON text, to them.
+        """
+        def check_table_existence(name):
+            # Check if table 'name' exists.
+            self.c.execute(
+                """SELECT count(name) FROM sqlite_master
+                   WHERE type=:type AND name=:name""",
+                {'type': 'table', 'name': name},
+            )
+            if self.c.fetchone()[0] == 1:
+                return True
+            else:
+                return False
+
+        def parse_files(files_str):
+            # Parse the files of a playlist saved in the older format.
+            try:
+                return json.loads(files_str)
+            except ValueError:
+                return [
+                    i.replace('"', '')
+                    for i in files_str.strip('][').split(', ')
+                    if i != ''
+                ]
+
+        if check_table_existence('playlists'):
+            self.c.execute('PRAGMA table_info(playlists)')
+            columns = [row[1] for row in self.c.fetchall()]
+            if 'files' in columns:
+                # Keep the table of the older format until all of its
+                # playlists have been moved.
+                with self.conn:
+                    self.c.execute(
+                        'ALTER TABLE playlists RENAME TO playlists_old'
+                    )
+        if not check_table_existence('playlists'):
+            with self.conn:
+                self.c.execute(
+                    """CREATE TABLE playlists (
+                            id integer PRIMARY KEY,
+                            name text UNIQUE)"""
+                )
+                self.c.execute(
+                    """CREATE TABLE playlist_items (
+                            playlist_id integer,
+                            position integer,
+                            track text,
+                            missing integer DEFAULT 0)"""
+                )
+                self.c.execute(
+                    """CREATE INDEX playlist_items_position
+                       ON playlist_items (playlist_id, position)"""
+                )
+            print('DATABASE: TABLES "playlists", "playlist_items" CREATED.')
+        else:
+            # Add the column that did not exist in older versions of
+            # the table; it marks the songs that have been deleted.
+            self.c.execute('PRAGMA table_info(playlist_items)')
+            columns = [row[1] for row in self.c.fetchall()]
+            if 'missing' not in columns:
+                with self.conn:
+                    self.c.execute(
+                        """ALTER TABLE playlist_items
+                           ADD COLUMN missing integer DEFAULT 0"""
+                    )
+        # Songs that are deleted or moved are found in all playlists
+        # with this index.
+        with self.conn:
+            self.c.execute(
+                """CREATE INDEX IF NOT EXISTS playlist_items_track
+                   ON playlist_items (track)"""
+            )
+        if check_table_existence('playlists_old'):
+            # Keep the first one of the playlists with the same name,
+            # as saving a playlist used to do.
+            self.c.execute(
+                """SELECT name, files FROM playlists_old
+                   WHERE ROWID IN (SELECT MIN(ROWID) FROM playlists_old
+                                   GROUP BY name)
+                   ORDER BY ROWID"""
+            )
+            for name, files_str in self.c.fetchall():
+                self.insert_playlist(name, parse_files(files_str))
+            with self.conn:
+                self.c.execute('DROP TABLE playlists_old')
+            print('DATABASE: playlists MOVED to the new format.')
+
+    def get_playlist_id(self, name):
+        """
+        Return the id of the playlist with name 'name' parameter, if
+        it exists; Otherwise return None.
+        """
+        self.c.execute(
+            'SELECT id FROM playlists WHERE name=:name',
+            {'name': name}
+        )
+        row = self.c.fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def check_playlist_existence(self, name):
+        """
+        Check if the playlist with name 'name' parameter exists inside
+        the database.
+        """
+        return self.get_playlist_id(name) is not None
+
+    def insert_playlist(self, name, files_list):
+        """
+        Insert a playlist with values 'name' and 'files_list'
+        parameters into the database, if it does not exist.
+        """
+        playlist_exists = self.check_playlist_existence(name)
+        if playlist_exists:
+            pass
+        else:
+            with self.conn:
+                self.c.execute(
+                    'INSERT INTO playlists (name) VALUES (:name)',
+                    {'name': name},
+                )
+                playlist_id = self.c.lastrowid
+                self.c.executemany(
+                    'INSERT INTO playlist_items VALUES (?, ?, ?, ?)',
+                    [
+                        (playlist_id, position, track,
+                         track in self.missing_tracks)
+                        for position, track in enumerate(files_list)
+                    ],
+                )
+            print('DATABASE: playlist "{}" INSERTED.'.format(name))
+
+    def update_playlist(self, name, files_list):
+        """
+        Update the playlist with name 'name' parameter and set files
+        'files_list' to it inside database.
+        """
+        playlist_id = self.get_playlist_id(name)
+        with self.conn:
+            self.c.execute(
+                'DELETE FROM playlist_items WHERE playlist_id=:id',
+                {'id': playlist_id},
+            )
+            self.c.executemany(
+                'INSERT INTO playlist_items VALUES (?, ?, ?, ?)',
+                [
+                    (playlist_id, position, track,
+                     track in self.missing_tracks)
+                    for position, track in enumerate(files_list)
+                ],
+            )
+            print('DATABASE: playlist "{}" UPDATED.'.format(name))
+
+    def append_to_playlist(self, name, track):
+        """
+        Add the file with path 'track' parameter to the end of the
+        playlist with name 'name' parameter inside database. This
+        function is called when user wants to add a song to a
+        playlist, and inserts a single row whatever the size of the
+        playlist.
+        """
+        playlist_id = self.get_playlist_id(name)
+        with self.conn:
+            # The largest position is found with the index of
+            # playlist items, without reading the playlist.
+            self.c.execute(
+                """INSERT INTO playlist_items
+                   SELECT :id, COALESCE(MAX(position) + 1, 0), :track,
+                          :missing
+                   FROM playlist_items WHERE playlist_id=:id""",
+                {
+                    'id': playlist_id, 'track': track,
+                    'missing': track in self.missing_tracks,
+                },
+            )
+            print('DATABASE: playlist "{}" UPDATED.'.format(name))
+
+    def delete_playlist(self, name):
+        """Delete the playlist with name 'name' parameter from database."""
+        playlist_id = self.get_playlist_id(name)
+        with self.conn:
+            self.c.execute(
+                'DELETE FROM playlist_items WHERE playlist_id=:id',
+                {'id': playlist_id},
+            )
+            self.c.execute(
+                'DELETE FROM playlists WHERE id=:id',
+                {'id': playlist_id},
+            )
+        print('DATABASE: playlist "{}" DELETED.'.format(name))
+
+    def get_missing_counts(self):
+        """
+        Return the number of songs of every playlist that have been
+        deleted from the library folders, keyed by the name of the
+        playlist, for the playlists that have any.
+        """
+        self.c.execute(
+            """SELECT name, count(*) FROM playlists
+               JOIN playlist_items ON playlist_id=id
+               WHERE missing=1 GROUP BY id"""
+        )
+        return dict(self.c.fetchall())
+
+    def get_playlist(self, name):
+        """
+        Get files list of the playlist with name 'name' parameter from
+        database and return it, if it exists; Otherwise return None.
+        """
+        playlist_id = self.get_playlist_id(name)
+        if playlist_id is None:
+            return None
+        self.c.execute(
+            """SELECT track FROM playlist_items WHERE playlist_id=:id
+               ORDER BY position""",
+            {'id': playlist_id}
+        )
+        return [row[0] for row in self.c.fetchall()]
+
+    def create_library_table(self):
+        """
+        Create table 'library' inside the database file 'playlists.db',
+        if it does not exist. Each row keeps size, modification time,
+        duration, the hash of the artwork and tags of a file, keyed by
+        its path.
+        """
+        self.c.execute(
+            """SELECT count(name) FROM sqlite_master
+               WHERE type=:type AND name=:name""",
+            {'type': 'table', 'name': 'library'},
+        )
+        if self.c.fetchone()[0] == 0:
+            tags_columns = ', '.join(
+                '{} text'.format(key) for key in self.tags_keys_list
+            )
+            with self.conn:
+                self.c.execute(
+                    """CREATE TABLE library (
+                            path text PRIMARY KEY,
+                            size integer,
+                            mtime real,
+                            duration real,
+                            artwork_hash text,
+                            payload_size integer,
+                            payload_hash text,
+                            loudness real,
+                            peak real,
+                            {})""".format(tags_columns)
+                )
+            print('DATABASE: TABLE "library" CREATED.')
+        else:
+            # Add the columns that did not exist in older versions of
+            # the table.
+            self.c.execute('PRAGMA table_info(library)')
+            columns = [row[1] for row in self.c.fetchall()]
+            for column, column_type in (
+                ('artwork_hash', 'text'),
+                ('payload_size', 'integer'),
+                ('payload_hash', 'text'),
+                ('loudness', 'real'),
+                ('peak', 'real'),
+            ):
+                if column not in columns:
+                    with self.conn:
+                        self.c.execute(
+                            'ALTER TABLE library ADD COLUMN {} {}'.format(
+                                column, column_type)
+                        )
+
+    def create_search_table(self):
+        """
+        Create the full-text index 'library_search' (of FTS5) over file
+        names and tags of table 'library', and the triggers that keep
+        it up to date with the library, if they do not exist. The
+        index is filled from the library once, when it is created.
+        """
+        columns = ['filename'] + self.search_keys_list
+        # The file name is the part of the path after the last slash
+        # (or backslash), since SQLite has no function for it.
+        path = "replace({row}.path, '\\', '/')"
+        filename = 'replace({0}, rtrim({0}, replace({0}, \'/\', \'\')), \'\')'.format(path)
+        values = ', '.join(
+            [filename] + ['{row}.' + key for key in self.search_keys_list]
+        )
+        insert = (
+            'INSERT INTO library_search (rowid, {}) VALUES ({{row}}.rowid, {});'
+            .format(', '.join(columns), values)
+        )
+        delete = 'DELETE FROM library_search WHERE rowid = old.rowid;'
+        # Only updates of the searched columns change the index, so
+        # storing hashes or loudness of songs does not index them again.
+        update_trigger = (
+            """CREATE TRIGGER library_search_update
+               AFTER UPDATE OF path, {} ON library BEGIN {} {} END""".format(
+                ', '.join(self.search_keys_list), delete,
+                insert.format(row='new'))
+        )
+        self.c.execute(
+            """SELECT sql FROM sqlite_master
+               WHERE type=:type AND name=:name""",
+            {'type': 'trigger', 'name': 'library_search_update'},
+        )
+        row = self.c.fetchone()
+        if row is not None:
+            if 'UPDATE OF' not in row[0]:
+                # Since the trigger of older databases runs on every
+                # update of the library, we make it again.
+                with self.conn:
+                    self.c.execute('DROP TRIGGER library_search_update')
+                    self.c.execute(update_trigger)
+                print('DATABASE: TRIGGER "library_search_update" UPDATED.')
+            self.search_available = True
+            return
+        try:
+            with self.conn:
+                self.c.execute(
+                    """CREATE VIRTUAL TABLE library_search USING fts5(
+                            {},
+                            tokenize='unicode61 remove_diacritics 2',
+                            prefix='1 2 3')""".format(', '.join(columns))
+                )
+                self.c.execute(
+                    """CREATE TRIGGER library_search_insert
+                       AFTER INSERT ON library BEGIN {} END""".format(
+                        insert.format(row='new'))
+                )
+                self.c.execute(update_trigger)
+                self.c.execute(
+                    """CREATE TRIGGER library_search_delete
+                       AFTER DELETE ON library BEGIN {} END""".format(delete)
+                )
+                self.c.execute(
+                    """INSERT INTO library_search (rowid, {})
+                       SELECT rowid, {} FROM library""".format(
+                        ', '.join(columns), values.format(row='library'))
+                )
+        except sqlite3.OperationalError as e:
+            # SQLite may be built without FTS5; then the search box only
+            # searches file names.
+            print('DATABASE: could not create search index ({}).'.format(e))
+            return
+        self.search_available = True
+        print('DATABASE: TABLE "library_search" CREATED.')
+
+    def search_playing_list(self, text):
+        """
+        Return the sorted indexes of the songs of playing list whose
+        file name or tags (title, artists, album, composer or genre)
+        include words beginning with every word of 'text', or return
+        None if 'text' is shorter than two letters.
+        """
+        words = re.findall(r'\w+', text)
+        if len(''.join(words)) < 2:
+            # A single letter matches almost every song, so the whole
+            # list is shown until the second letter is typed.
+            return None
+        if not self.search_available:
+            words = [word.casefold() for word in words]
+            return [
+                ix for ix, track in enumerate(self.playing_list)
+                if all(
+                    word in os.path.basename(track).casefold()
+                    for word in words
+                )
+            ]
+        # Every word is a prefix query; quoting the words keeps FTS5
+        # from reading them as operators.
+        changes = (self.library_version, self.playing_list.changes)
+        if self.playing_rowids_changes != changes:
+            # Since songs may have been added to (or removed from) the
+            # library or the playing list, we map them again; this
+            # costs a walk of both but makes every search cost only
+            # the number of songs it finds.
+            self.c.execute('SELECT path, rowid FROM library')
+            library_rowids = dict(self.c.fetchall())
+            self.playing_rowids = {}
+            for ix, track in enumerate(self.playing_list):
+                rowid = library_rowids.get(track)
+                if rowid is not None:
+                    self.playing_rowids.setdefault(rowid, []).append(ix)
+            self.playing_rowids_changes = changes
+        self.c.execute(
+            """SELECT rowid FROM library_search
+               WHERE library_search MATCH :query""",
+            {'query': ' '.join('"{}"*'.format(word) for word in words)},
+        )
+        rows = []
+        get_rows = self.playing_rowids.get
+        for rowid, in self.c:
+            rows.extend(get_rows(rowid, ()))
+        rows.sort()
+        return rows
+
+    def get_library_entry(self, file_path):
+        """
+        Get the library entry of the file with path 'file_path' as a
+        dictionary and return it, if the file has not been changed
+        since it was read; Otherwise return None.
+        """
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return None
+        columns = self.library_columns()
+        self.c.execute(
+            'SELECT {} FROM library WHERE path=:path'.format(', '.join(columns)),
+            {'path': file_path},
+        )
+        row = self.c.fetchone()
+        if (
+            row is None
+            or row[1] != file_stat.st_size
+            or row[2] != file_stat.st_mtime
+        ):
+            return None
+        return dict(zip(columns, row))
+
+    def library_columns(self):
+        """Return the names of the columns of table 'library'."""
+        return [
+            'path', 'size', 'mtime', 'duration', 'artwork_hash',
+        ] + self.tags_keys_list
+
+    def store_library_entries(self, entries):
+        """
+        Insert or update the entries 'entries' inside table 'library'.
+        Since an entry is only stored again when its file has been
+        changed, the hash and the loudness of its audio are cleared.
+        """
+        columns = self.library_columns()
+        with self.conn:
+            self.c.executemany(
+                """INSERT INTO library ({}) VALUES ({})
+                   ON CONFLICT(path) DO UPDATE SET {},
+                   payload_size=NULL, payload_hash=NULL,
+                   loudness=NULL, peak=NULL""".format(
+                    ', '.join(columns),
+                    ', '.join(':' + column for column in columns),
+                    ', '.join(
+                        '{0}=excluded.{0}'.format(column)
+                        for column in columns[1:]
+                    ),
+                ),
+                entries,
+            )
+        self.library_version += 1
+
+    def get_payload_hashes(self):
+        """
+        Return a dictionary of the length and the hash of the audio
+        (None if they are not known yet) of every file inside the
+        library that has been read, keyed by its path.
+        """
+        self.c.execute(
+            """SELECT path, payload_size, payload_hash FROM library
+               WHERE size IS NOT NULL"""
+        )
+        return {
+            path: (size, payload_hash)
+            for path, size, payload_hash in self.c
+        }
+
+    def store_payload_hashes(self, hashes):
+        """
+        Keep 'hashes', a dictionary of the length and the hash of the
+        audio of files keyed by their path, inside the library.
+        """
+        with self.conn:
+            self.c.executemany(
+                """UPDATE library SET payload_size=?, payload_hash=?
+                   WHERE path=?""",
+                [
+                    (size, payload_hash, path)
+                    for path, (size, payload_hash) in hashes.items()
+                ],
+            )
+        print('DATABASE: {} audio hashes STORED.'.format(len(hashes)))
+
+    def get_unanalyzed_files(self, max_duration=20 * 60):
+        """
+        Return the paths of the files inside the library whose loudness
+        has not been analyzed, leaving out the files that are longer
+        than 'max_duration' seconds, since they are decoded whole.
+        """
+        self.c.execute(
+            """SELECT path FROM library
+               WHERE size IS NOT NULL AND peak IS NULL
+               AND (duration IS NULL OR duration <= :max_duration)
+               ORDER BY path""",
+            {'max_duration': max_duration},
+        )
+        return [row[0] for row in self.c.fetchall()]
+
+    def store_loudness(self, results):
+        """
+        Keep 'results', a dictionary of the integrated loudness and the
+        sample peak of files keyed by their path, inside the library.
+        """
+        with self.conn:
+            self.c.executemany(
+                'UPDATE library SET loudness=?, peak=? WHERE path=?',
+                [
+                    (loudness, peak, path)
+                    for path, (loudness, peak) in results.items()
+                ],
+            )
+        print('DATABASE: loudness of {} library entries STORED.'.format(
+                len(results)))
+
+    def get_track_gain(self, track):
+        """
+        Return the gain in dB that normalizes the loudness of the file
+        with path 'track', or 0 if it has not been analyzed.
+        """
+        self.c.execute(
+            'SELECT loudness, peak FROM library WHERE path=:path',
+            {'path': track},
+        )
+        row = self.c.fetchone()
+        if row is None:
+            return 0.0
+        return get_loudness_gain(*row)
+
+    def get_duplicate_groups(self):
+        """
+        Return the groups of files inside the library that have the
+        same audio, as lists of their paths sorted by path.
+        """
+        self.c.execute(
+            """SELECT payload_hash, path FROM library
+               WHERE payload_hash IN (
+                   SELECT payload_hash FROM library
+                   WHERE payload_hash IS NOT NULL
+                   GROUP BY payload_hash HAVING count(*) > 1)
+               ORDER BY payload_hash, path"""
+        )
+        groups = {}
+        for payload_hash, path in self.c:
+            groups.setdefault(payload_hash, []).append(path)
+        return list(groups.values())
+
+    def get_library_stats(self):
+        """
+        Return a dictionary of the stored size and modification time
+        of all files inside the library, keyed by their path.
+        """
+        self.c.execute('SELECT path, size, mtime FROM library')
+        return {path: (size, mtime) for path, size, mtime in self.c}
+
+    def get_changed_files(self, files_list, stored=None):
+        """
+        Return the files of 'files_list' parameter which are not in the
+        library or whose size or modification time has been changed.
+        'stored' parameter can be a dictionary returned by
+        self.get_library_stats() to not to fetch it again.
+        """
+        # Fetch the stored size and modification time of all files at
+        # once, so checking a file costs a dictionary lookup and a
+        # stat call instead of a query or reading the whole file.
+        if stored is None:
+            stored = self.get_library_stats()
+        changed_files = []
+        for file_path in files_list:
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+            if (
+                stored.get(file_path)
+                != (file_stat.st_size, file_stat.st_mtime)
+            ):
+                changed_files.append(file_path)
+        return changed_files
+
+    def update_library(self, files_list):
+        """
+        Read the files of 'files_list' parameter which are not in the
+        library or whose size or modification time has been changed,
+        store them inside the library and return the number of files
+        that have been read.
+        """
+        entries = []
+        for file_path in self.get_changed_files(files_list):
+            try:
+                entries.append(probe_file(file_path, self.tags_keys_list))
+            except Exception as e:
+                # Skip the files that could not be read; they will be
+                # tried again on the next update.
+                print('LIBRARY: could not read "{}" ({}).'.format(
+                        file_path, e))
+        if len(entries) != 0:
+            self.store_library_entries(entries)
+            print('DATABASE: {} library entries UPDATED.'.format(len(entries)))
+        return len(entries)
+
+    def rescan_library(self):
+        """
+        Rescan all files inside the library; read the changed files
+        again and delete the files that no longer exist.
+        """
+        changed_files, missing_files = check_library_files(
+            self.get_library_stats()
+        )
+        self.remove_library_files(missing_files)
+        self.update_library(changed_files)
+
+    def remove_library_files(self, files_list):
+        """
+        Delete the files of 'files_list' parameter, which no longer
+        exist, from the library and mark them as missing in the
+        playlists and the playing list.
+        """
+        if len(files_list) == 0:
+            return
+        rows = [(file_path,) for file_path in files_list]
+        with self.conn:
+            self.c.executemany('DELETE FROM library WHERE path=?', rows)
+            self.c.executemany('DELETE FROM waveforms WHERE path=?', rows)
+            self.c.executemany('DELETE FROM seek_indexes WHERE path=?', rows)
+            self.c.executemany(
+                'UPDATE playlist_items SET missing=1 WHERE track=?', rows
+            )
+        self.library_version += 1
+        self.missing_tracks.update(files_list)
+        print('DATABASE: {} library entries DELETED.'.format(
+                len(files_list)))
+
+    def mark_found_files(self, files_list):
+        """
+        Unmark the files of 'files_list' parameter, which exist again,
+        as missing in the playlists and the playing list.
+        """
+        found_files = [
+            (file_path,) for file_path in files_list
+            if file_path in self.missing_tracks
+        ]
+        if len(found_files) == 0:
+            return
+        with self.conn:
+            self.c.executemany(
+                'UPDATE playlist_items SET missing=0 WHERE track=?',
+                found_files,
+            )
+        self.missing_tracks.difference_update(files_list)
+
+    def move_library_files(self, moves):
+        """
+        Keep the files of 'moves' parameter, a list of (old path, new
+        path) pairs of files that have been moved or renamed, under
+        their new paths inside the library, the playlists and the
+        playing list, so their details are not read again.
+        """
+        if len(moves) == 0:
+            return
+        rows = [{'old': old, 'new': new} for old, new in moves]
+        with self.conn:
+            # Deleting an entry of the new path first keeps the
+            # triggers of the search index in step with the library.
+            self.c.executemany('DELETE FROM library WHERE path=:new', rows)
+            self.c.executemany(
+                'UPDATE library SET path=:new WHERE path=:old', rows
+            )
+            self.c.executemany(
+                'DELETE FROM waveforms WHERE path=:new', rows
+            )
+            self.c.executemany(
+                'UPDATE waveforms SET path=:new WHERE path=:old', rows
+            )
+            self.c.executemany(
+                'DELETE FROM seek_indexes WHERE path=:new', rows
+            )
+            self.c.executemany(
+                'UPDATE seek_indexes SET path=:new WHERE path=:old', rows
+            )
+            self.c.executemany(
+                """UPDATE playlist_items SET track=:new, missing=0
+                   WHERE track=:old""",
+                rows,
+            )
+        self.library_version += 1
+        self.playing_list.rename(dict(moves))
+        self.missing_tracks.difference_update(new for _, new in moves)
+        print('DATABASE: {} library entries MOVED.'.format(len(moves)))
+
+    def store_playlist_info(self, entries):
+        """
+        Keep durations and titles of 'entries' parameter, that are
+        read from a playlist file, inside the library for the files
+        that are not in the library yet. Size and modification time of
+        these files are left empty, so they are read on the next
+        update of the library.
+        """
+        rows = []
+        for track, duration, title in entries:
+            artist = None
+            if title is not None and ' - ' in title:
+                # Extended M3U titles are usually 'Artist - Title'.
+                artist, title = title.split(' - ', 1)
+            rows.append((track, duration, title, artist))
+        if len(rows) != 0:
+            with self.conn:
+                self.c.executemany(
+                    """INSERT OR IGNORE INTO library
+                       (path, duration, title, artist)
+                       VALUES (?, ?, ?, ?)""",
+                    rows,
+                )
+            self.library_version += 1
+
+    def scan_playlist_file(self, file_path):
+        """
+        Yield the path of every file inside the playlist file with path
+        'file_path' and keep the durations and titles of the playlist
+        inside the library in batches.
+        """
+        entries = []
+        for track, duration, title in iter_playlist_file(file_path):
+            if duration is not None or title is not None:
+                entries.append((track, duration, title))
+                if len(entries) == 500:
+                    self.store_playlist_info(entries)
+                    entries = []
+            yield track
+        self.store_playlist_info(entries)
+
+    def create_lyrics_table(self):
+        """
+        Create table 'lyrics' inside the database file 'playlists.db',
+        if it does not exist. Each row keeps the lyrics of a song (or
+        NULL if they were not found) and the time they were searched,
+        keyed by the normalized artist and title of the song.
+        """
+        with self.conn:
+            self.c.execute(
+                """CREATE TABLE IF NOT EXISTS lyrics (
+                        artist text,
+                        title text,
+                        lyrics text,
+                        fetched real,
+                        PRIMARY KEY (artist, title))"""
+            )
+
+    def get_cached_lyrics(self, file_artist, file_title):
+        """
+        Return a tuple of the lyrics (None if they were not found) of
+        the song with title 'file_title' by 'file_artist' from the
+        database, or None if they have not been searched yet or it
+        is time to search them again.
+        """
+        self.c.execute(
+            """SELECT lyrics FROM lyrics
+               WHERE artist=:artist AND title=:title
+               AND fetched > :now - CASE WHEN lyrics IS NULL
+                   THEN :not_found_ttl ELSE :ttl END""",
+            {
+                'artist': normalize_lyrics_key(file_artist),
+                'title': normalize_lyrics_key(file_title),
+                'now': time.time(),
+                'ttl': self.lyrics_ttl,
+                'not_found_ttl': self.lyrics_not_found_ttl,
+            },
+        )
+        return self.c.fetchone()
+
+    def create_roots_table(self):
+        """
+        Create table 'library_roots' inside the database file
+        'playlists.db', if it does not exist. Each row keeps the path
+        of a folder whose songs are watched and kept in the library.
+        """
+        with self.conn:
+            self.c.execute(
+                """CREATE TABLE IF NOT EXISTS library_roots (
+                        path text PRIMARY KEY)"""
+            )
+
+    def get_library_roots(self):
+        """Return the paths of the library folders in the order of adding."""
+        self.c.execute('SELECT path FROM library_roots ORDER BY rowid')
+        return [row[0] for row in self.c.fetchall()]
+
+    def add_library_root(self, dir_path):
+        """Add the folder with path 'dir_path' to the library folders."""
+        with self.conn:
+            self.c.execute(
+                'INSERT OR IGNORE INTO library_roots VALUES (:path)',
+                {'path': dir_path.replace('\\', '/').rstrip('/')},
+            )
+        print('DATABASE: library folder "{}" ADDED.'.format(dir_path))
+
+    def remove_library_root(self, dir_path):
+        """
+        Remove the folder with path 'dir_path' from the library
+        folders; its songs are kept in the library.
+        """
+        with self.conn:
+            self.c.execute(
+                'DELETE FROM library_roots WHERE path=:path',
+                {'path': dir_path},
+            )
+        print('DATABASE: library folder "{}" REMOVED.'.format(dir_path))
+
+    def store_lyrics(self, key, lyrics):
+        """
+        Keep lyrics 'lyrics' (None if they were not found) of the song
+        with normalized artist and title 'key' inside the database.
+        """
+        artist, title = key
+        with self.conn:
+            self.c.execute(
+                """INSERT OR REPLACE INTO lyrics
+                   VALUES (:artist, :title, :lyrics, :fetched)""",
+                {
+                    'artist': artist, 'title': title,
+                    'lyrics': lyrics, 'fetched': time.time(),
+                },
+            )
+        print('DATABASE: lyrics of "{} - {}" STORED.'.format(artist, title))
+
+    def create_seek_indexes_table(self):
+        """
+        Create table 'seek_indexes' inside the database file
+        'playlists.db', if it does not exist. Each row keeps the seek
+        index of an MP3 song (see build_seek_index()) and the
+        modification time of the file it was built from, keyed by the
+        path of the song. A song that can not be indexed keeps an index
+        without offsets, so its file is not walked again until it is
+        changed.
+        """
+        with self.conn:
+            self.c.execute(
+                """CREATE TABLE IF NOT EXISTS seek_indexes (
+                        path text PRIMARY KEY,
+                        mtime real,
+                        frame_samples integer,
+                        sample_rate integer,
+                        offsets blob)"""
+            )
+
+    @TRACER.traced('engine: get_seek_index')
+    def get_seek_index(self, file_path, build=True):
+        """
+        Return the seek index of the MP3 song with path 'file_path',
+        with its offsets as a memory view of integers, from memory or
+        the database; build it (and keep it in the database) if it is
+        not there and 'build' parameter is True. Return None if there
+        is not any index.
+        """
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except OSError:
+            return None
+        # Since the file may have been rewritten since its index was
+        # kept in memory, the index is only used if the modification
+        # time is the same.
+        if (
+            self.seek_index is not None
+            and self.seek_index[:2] == (file_path, mtime)
+        ):
+            return self.seek_index[2]
+        self.c.execute(
+            """SELECT frame_samples, sample_rate, offsets FROM seek_indexes
+               WHERE path=:path AND mtime=:mtime""",
+            {'path': file_path, 'mtime': mtime},
+        )
+        seek_index = self.c.fetchone()
+        if seek_index is None:
+            if not build:
+                return None
+            try:
+                seek_index = build_seek_index(file_path)
+            except OSError as e:
+                print('LIBRARY: could not index "{}" ({}).'.format(
+                        file_path, e))
+                return None
+            except ValueError as e:
+                print('LIBRARY: could not index "{}" ({}).'.format(
+                        file_path, e))
+                seek_index = (0, 0, b'')
+            self.store_seek_index(file_path, mtime, seek_index)
+        frame_samples, sample_rate, offsets = seek_index
+        if len(offsets) == 0:
+            return None
+        seek_index = (frame_samples, sample_rate, memoryview(offsets).cast('I'))
+        self.seek_index = (file_path, mtime, seek_index)
+        return seek_index
+
+    def has_seek_index(self, file_path):
+        """
+        Return True if the database keeps a seek index of the MP3 song
+        with path 'file_path' that is up to date, even an index without
+        offsets of a song that can not be indexed.
+        """
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except OSError:
+            return False
+        self.c.execute(
+            'SELECT 1 FROM seek_indexes WHERE path=:path AND mtime=:mtime',
+            {'path': file_path, 'mtime': mtime},
+        )
+        return self.c.fetchone() is not None
+
+    def store_seek_index(self, file_path, mtime, seek_index):
+        """
+        Keep seek index 'seek_index' of the MP3 song with path
+        'file_path', whose file had modification time 'mtime', inside
+        the database.
+        """
+        frame_samples, sample_rate, offsets = seek_index
+        with self.conn:
+            self.c.execute(
+                """INSERT OR REPLACE INTO seek_indexes
+                   VALUES (:path, :mtime, :frame_samples, :sample_rate,
+                           :offsets)""",
+                {
+                    'path': file_path, 'mtime': mtime,
+                    'frame_samples': frame_samples,
+                    'sample_rate': sample_rate, 'offsets': offsets,
+                },
+            )
+        print('DATABASE: seek index of "{}" STORED.'.format(file_path))
+
+    def create_waveforms_table(self):
+        """
+        Create table 'waveforms' inside the database file
+        'playlists.db', if it does not exist. Each row keeps the
+        waveform of a song (see compute_waveform()) and the
+        modification time of the file it was computed from, keyed by
+        the path of the song.
+        """
+        with self.conn:
+            self.c.execute(
+                """CREATE TABLE IF NOT EXISTS waveforms (
+                        path text PRIMARY KEY,
+                        mtime real,
+                        peaks blob)"""
+            )
+
+    def get_cached_waveform(self, file_path):
+        """
+        Return the waveform of the song with path 'file_path' from the
+        database, or None if it has not been computed or the file has
+        been changed since then.
+        """
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except OSError:
+            return None
+        self.c.execute(
+            'SELECT peaks FROM waveforms WHERE path=:path AND mtime=:mtime',
+            {'path': file_path, 'mtime': mtime},
+        )
+        row = self.c.fetchone()
+        return None if row is None else row[0]
+
+    def store_waveform(self, file_path, mtime, peaks):
+        """
+        Keep waveform 'peaks' of the song with path 'file_path', whose
+        file had modification time 'mtime', inside the database.
+        """
+        with self.conn:
+            self.c.execute(
+                """INSERT OR REPLACE INTO waveforms
+                   VALUES (:path, :mtime, :peaks)""",
+                {'path': file_path, 'mtime': mtime, 'peaks': peaks},
+            )
+        print('DATABASE: waveform of "{}" STORED.'.format(file_path))
 
 
 class MusicPlayer:
@@ -34,9 +3824,19 @@ class MusicPlayer:
     def __init__(self, master):
         """Initialize and configure root window widgets"""
 
-        # Connect to database of playlists and initialize a cursor.
-        self.conn = sqlite3.connect('db/playlists.db')
-        self.c = self.conn.cursor()
+        # The engine plays the music and keeps the playing list and the
+        # database; the window shows what it does through its events.
+        # Set environment variable JUNKIE_SHUFFLE_SEED to play the same
+        # shuffled order on every run.
+        self.engine = PlayerEngine(
+            shuffle_seed=os.environ.get('JUNKIE_SHUFFLE_SEED')
+        )
+        self.engine.subscribe('track_started', self.show_track)
+        self.engine.subscribe('paused', self.show_paused)
+        self.engine.subscribe('unpaused', self.show_unpaused)
+        self.engine.subscribe('stopped', self.show_stopped)
+        self.engine.subscribe('list_ended', self.show_list_ended)
+        self.engine.subscribe('seeked', self.show_seeked)
 
         # Define self.master with a value of the root window.
         self.master = master
@@ -60,6 +3860,13 @@ class MusicPlayer:
             accelerator='Ctrl+Shift+O',
         )
         self.master.bind_all('<Control-O>', self.browse_directory)
+        # Songs of an opened folder that are already in the playing
+        # list (even under another name) are skipped if this is on.
+        self.skip_duplicates_var = IntVar()
+        self.file_menu.add_checkbutton(
+            label='Skip duplicates',
+            variable=self.skip_duplicates_var,
+        )
         self.file_menu.add_separator()
         self.file_menu.add_command(
             label='Save now playing list as...',
@@ -73,12 +3880,85 @@ class MusicPlayer:
             accelerator='Ctrl+P',
         )
         self.master.bind_all('<Control-p>', self.show_playlists)
+        self.file_menu.add_command(
+            label='Rescan library',
+            command=self.rescan_library,
+            accelerator='Ctrl+R',
+        )
+        self.master.bind_all('<Control-r>', self.rescan_library)
+        self.file_menu.add_command(
+            label='Library folders...',
+            command=self.show_library_folders,
+        )
+        self.file_menu.add_command(
+            label='Find duplicates...',
+            command=self.find_duplicates,
+        )
+        self.file_menu.add_separator()
+        self.file_menu.add_command(
+            label='Import playlist file...',
+            command=self.import_playlist_file,
+            accelerator='Ctrl+I',
+        )
+        self.master.bind_all('<Control-i>', self.import_playlist_file)
+        self.file_menu.add_command(
+            label='Export playing list...',
+            command=self.export_playing_list,
+            accelerator='Ctrl+E',
+        )
+        self.master.bind_all('<Control-e>', self.export_playing_list)
         self.file_menu.add_separator()
         self.file_menu.add_command(
             label='Exit', command=self.master.destroy, accelerator='Ctrl+Q'
         )
         self.master.bind_all('<Control-q>', self.closing)
 
+        self.playback_menu = Menu(self.menubar, tearoff=0)
+        self.menubar.add_cascade(label='Playback', menu=self.playback_menu)
+        self.gapless_var = IntVar()
+        self.playback_menu.add_checkbutton(
+            label='Gapless playback',
+            variable=self.gapless_var,
+            command=self.set_gapless,
+            accelerator='Ctrl+G',
+        )
+        self.master.bind_all('<Control-g>', self.toggle_gapless)
+        # Songs whose loudness has been analyzed are brought to the
+        # same loudness if this is on.
+        self.normalize_var = IntVar()
+        self.playback_menu.add_checkbutton(
+            label='Normalize loudness',
+            variable=self.normalize_var,
+            command=self.set_normalize,
+        )
+        self.playback_menu.add_command(
+            label='Analyze loudness',
+            command=self.start_loudness_analysis,
+        )
+        self.playback_menu.add_separator()
+        # Timings of the hot paths (showing songs, SQL statements and
+        # transport) are only recorded while tracing is on.
+        self.trace_var = IntVar(value=int(TRACER.enabled))
+        self.playback_menu.add_checkbutton(
+            label='Trace timings',
+            variable=self.trace_var,
+            command=self.set_tracing,
+        )
+        self.playback_menu.add_command(
+            label='Export timings...',
+            command=partial(self.export_trace, False),
+        )
+        self.playback_menu.add_command(
+            label='Export Chrome trace...',
+            command=partial(self.export_trace, True),
+        )
+        self.profile_var = IntVar()
+        self.playback_menu.add_checkbutton(
+            label='Profile session',
+            variable=self.profile_var,
+            command=self.set_profiling,
+        )
+
         self.helpmenu = Menu(self.menubar, tearoff=0)
         self.menubar.add_cascade(label='Help', menu=self.helpmenu)
         self.helpmenu.add_command(label='About', command=self.about)
@@ -118,20 +3998,23 @@ class MusicPlayer:
 
         # Initialize playing list listbox, a label and some button
         # widgets related to the listbox.
-        self.paused = False
-        self.playing_list = []
-        self.playing_song_ix = 0
-        self.playing_listbox = Listbox(
-            self.playing_listbox_frame, selectforeground='white',
+        self.playing_list = self.engine.playing_list
+        self.playing_listbox = VirtualListbox(
+            self.playing_listbox_frame, self.playing_list,
+            self.get_row_text, selectforeground='white',
             activestyle='dotbox', selectbackground='grey',
             foreground='black', width=50,
             selectmode='single', height=20,
         )
-        self.playing_listbox.bind('<Double-1>', self.play_or_pause)
+        self.playing_listbox.bind(
+            '<Double-1>', partial(self.transport, 'play_pause')
+        )
         self.playing_listbox.bind('<Button-3>', self.do_popup)
         self.playing_listbox.bind('<Down>', self.change_selection)
         self.playing_listbox.bind('<Up>', self.change_selection)
-        self.playing_listbox.bind('<Return>', self.play_or_pause)
+        self.playing_listbox.bind(
+            '<Return>', partial(self.transport, 'play_pause')
+        )
         self.playing_listbox.grid(row=0, column=0)
 
         self.y_scrollbar = ttk.Scrollbar(
@@ -151,11 +4034,62 @@ class MusicPlayer:
         self.y_scrollbar.config(command=self.playing_listbox.yview)
         self.x_scrollbar.config(command=self.playing_listbox.xview)
 
+        # A search box above the playing list, that shows only the
+        # songs whose file name or tags match the search text as it
+        # is typed (see search_playing_list).
+        self.search_var = StringVar()
+        self.search_job = None
+        self.search_entry = ttk.Entry(
+            self.playing_list_frame, textvariable=self.search_var, width=50
+        )
+        self.search_entry.pack(before=self.playing_listbox_frame, pady=5)
+        self.create_tooltip(
+            self.search_entry, text='Search playing list (Ctrl+F)'
+        )
+        self.search_var.trace_add('write', self.schedule_search)
+        self.search_entry.bind('<Escape>', self.clear_search)
+        self.search_entry.bind('<Down>', self.focus_playing_list)
+        self.master.bind_all('<Control-f>', self.focus_search)
+
         self.playing_list_name = ttk.Label(
             self.playing_list_frame, text='', style='playlist_name_label.TLabel'
         )
         self.playing_list_name.pack(pady=10)
 
+        # Initialize a progress bar and a button widget for cancelling,
+        # that are shown while the files of an imported folder are
+        # being read.
+        self.import_executor = None
+        self.import_results = queue.Queue()
+        self.import_scans = set()
+        self.import_library_stats = None
+        # The songs of the playing list and of the folder imports when
+        # duplicates are skipped; the imported songs that duplicate an
+        # earlier song are removed once they have been hashed.
+        self.import_seen = None
+        self.duplicates_imported = set()
+        self.duplicates_thread = None
+        self.duplicates_results = queue.Queue()
+        self.duplicates_again = False
+        self.duplicates_show = False
+        self.rescan_thread = None
+        self.rescan_results = queue.Queue()
+        self.import_total = 0
+        self.import_done = 0
+        self.import_frame = Frame(self.playing_list_frame)
+        self.import_progressbar = ttk.Progressbar(
+            self.import_frame, orient='horizontal',
+            mode='determinate', length=250,
+        )
+        self.import_progressbar.grid(row=0, column=0, padx=5)
+        self.import_cancel_button = ttk.Button(
+            self.import_frame,
+            text='Cancel',
+            command=self.stop_import,
+            width=10,
+        )
+        self.import_cancel_button.grid(row=0, column=1)
+
         self.add_file_button = ttk.Button(
             self.playing_list_buttons_frame,
             text='Add file',
@@ -200,8 +4134,10 @@ class MusicPlayer:
 
         # Initialize a menu that pops up on right clicking
         # on the listbox items.
-        self.listbox_menu = Menu(root, tearoff=0)
-        self.listbox_menu.add_command(label='Play', command=self.play_or_pause)
+        self.listbox_menu = Menu(self.master, tearoff=0)
+        self.listbox_menu.add_command(
+            label='Play', command=partial(self.transport, 'play_pause')
+        )
         self.listbox_menu.add_command(
             label='Add to playlist',
             command=partial(self.show_playlists, 'Add to playlist'),
@@ -228,8 +4164,8 @@ class MusicPlayer:
         self.playlist_buttons_frame.pack(pady=23)
 
         # Initialize song length and current time label widgets.
-        self.music_ended = False
         self.timeline_changed = False
+        self.clock_job = None
         
         ttk.Style().configure('Time.TLabel', background=self.default_bg)
 
@@ -250,14 +4186,20 @@ class MusicPlayer:
 
         # Initialize player panel widgets (the empty label widget is for
         # filling the white space on the right side of the buttons).
-        self.playing = False
         self.playing_song = ''
-        self.play_photoimage = PhotoImage(file='png/play-24.png')
-        self.pause_photoimage = PhotoImage(file='png/pause-24.png')
+        self.details_job = None
+        self.transport_commands = {
+            'play_pause': self.play_or_pause,
+            'next': self.engine.next_track,
+            'previous': self.engine.previous_track,
+        }
+        # Icons that are not shown when the window appears are loaded
+        # the first time they are shown.
+        self.icons = {}
         self.play_button = ttk.Button(
             self.player_middle_frame,
-            image=self.play_photoimage,
-            command=self.play_or_pause
+            image=self.get_icon('play-24'),
+            command=partial(self.transport, 'play_pause')
         )
         self.play_button.grid(row=0, column=4, padx=0)
 
@@ -266,7 +4208,7 @@ class MusicPlayer:
         self.next_button = ttk.Button(
             self.player_middle_frame,
             image=self.next_photoimage,
-            command=self.next_music
+            command=partial(self.transport, 'next')
         )
         self.next_button.grid(row=0, column=5, padx=5)
 
@@ -274,7 +4216,7 @@ class MusicPlayer:
         self.previous_button = ttk.Button(
             self.player_middle_frame,
             image=self.previous_photoimage,
-            command=self.previous_music
+            command=partial(self.transport, 'previous')
         )
         self.previous_button.grid(row=0, column=3, padx=5)
 
@@ -310,12 +4252,9 @@ class MusicPlayer:
 
         # Initialize widgets for volume adjustment.
         self.muted = False
-        self.muted_photoimage = PhotoImage(file='png/muted-16.png')
-        self.volume_high_photoimage = PhotoImage(file='png/volume-high-16.png')
-        self.volume_low_photoimage = PhotoImage(file='png/volume-low-16.png')
         self.volume_button = ttk.Button(
             self.player_bottom_frame,
-            image=self.volume_high_photoimage,
+            image=self.get_icon('volume-high-16'),
             command=self.mute_music
         )
         self.volume_button.grid(row=0, column=5, padx=5)
@@ -329,7 +4268,7 @@ class MusicPlayer:
             orient='horizontal', command=self.set_volume,
         )
         self.volume_scale.set(50)
-        mixer.music.set_volume(0.5)
+        self.engine.set_volume(0.5)
         self.volume_scale.grid(row=0, column=6)
 
         # Initialize checkbutton widgets
@@ -337,7 +4276,6 @@ class MusicPlayer:
             'Checkbutton.TCheckbutton', background=self.default_bg
         )
 
-        self.shuffle = False
         self.shuffle_checkbutton_var = IntVar()
         self.shuffle_photo = PhotoImage(file='png/shuffle-16.png')
         self.shuffle_checkbutton = ttk.Checkbutton(
@@ -351,7 +4289,6 @@ class MusicPlayer:
             self.shuffle_checkbutton, text='Turn Shuffle on'
         )
 
-        self.repeat = False
         self.repeat_checkbutton_var = IntVar()
         self.repeat_photo = PhotoImage(file='png/repeat-16.png')
         self.repeat_checkbutton = ttk.Checkbutton(
@@ -389,8 +4326,24 @@ class MusicPlayer:
             font=('Nirmala UI', 12), background=self.default_bg,
         )
 
-        self.artwork_path = 'png/default-music-artwork-324.png'
-        self.artwork_photoimage = PhotoImage(file=self.artwork_path)
+        # Artworks are decoded and resized once and then kept in
+        # memory, so playing songs of the same album again does not
+        # decode them again.
+        self.artwork_size = 324
+        self.artwork_cache = ArtworkCache(32 * 1024 * 1024)
+        self.default_artwork_photoimage = PhotoImage(
+            file='png/default-music-artwork-324.png'
+        )
+        self.artwork_key = 'default'
+        # The image (of PIL module) of the default artwork is only
+        # opened when song tags are shown on it.
+        self.artwork_image = None
+        self.artwork_photoimage = self.default_artwork_photoimage
+        # Blurred artworks and artworks with song tags drawn on them
+        # are kept too, so the tags can be shown and hidden quickly.
+        self.tags_cache = ArtworkCache(16 * 1024 * 1024)
+        self.tags_fonts = None
+        self.tags_photoimage = None
         self.artwork_label = ttk.Label(
             self.player_top_frame, image=self.artwork_photoimage
         )
@@ -410,10 +4363,33 @@ class MusicPlayer:
         )
         self.file_artists_label.grid(row=2, column=1)
 
-        self.tags_keys_list = [
-            'title', 'album', 'albumartist', 'artist',
-            'composer', 'date', 'tracknumber', 'genre',
-        ]
+        # Initialize the seek bar, which shows the waveform of the
+        # playing song; clicking on it (or dragging the playhead)
+        # seeks the song. Waveforms are computed once on worker threads
+        # and then kept in the database.
+        self.waveform_height = 36
+        self.waveform_canvas = Canvas(
+            self.player_top_frame, width=self.artwork_size,
+            height=self.waveform_height, background=self.default_bg,
+            highlightthickness=0, cursor='hand2',
+        )
+        self.waveform_canvas.grid(row=3, column=1, pady=(10, 0))
+        self.waveform_canvas.create_line(
+            0, 0, 0, self.waveform_height, fill='black', width=2,
+            tags='playhead',
+        )
+        self.waveform_canvas.bind('<Button-1>', self.drag_playhead)
+        self.waveform_canvas.bind('<B1-Motion>', self.drag_playhead)
+        self.waveform_canvas.bind('<ButtonRelease-1>', self.seek_to_pointer)
+        self.seek_dragging = False
+        self.waveform_pending = set()
+        # The songs to compute the waveforms of, which a single worker
+        # thread takes one at a time, and the results it puts back.
+        self.waveform_jobs = queue.Queue()
+        self.waveform_results = queue.Queue()
+        self.waveform_thread = None
+
+        self.tags_keys_list = self.engine.tags_keys_list
         self.tags_names_list = [
             'Title', 'Album', 'Album Artist', 'Artist',
             'Composer', 'Year', 'Track Number', 'Genre',
@@ -431,19 +4407,43 @@ class MusicPlayer:
         self.api_access_error = 'Junkie player could not access to the API. Please check and try again.'
         self.connection_error = 'Junkie player could not connect to the internet. Please check your connection and try again.'
         self.lyrics_not_found = 'Junkie player could not find the lyrics. Please check and try again.'
+        self.no_timings = 'Junkie player has not recorded any timings. Please turn on Trace timings and try again.'
+        self.no_folder_selected = 'Junkie player could not recognize any selected folder. Please check and try again.'
+        self.no_duplicates = 'Junkie player could not find any duplicate songs in the library.'
+        self.loudness_analyzed = 'Junkie player has analyzed the loudness of all songs in the library.'
+
+        # Lyrics are searched on worker threads and kept in the
+        # database. Set environment variable JUNKIE_GENIUS_ROOT to
+        # search another server than Genius.
+        self.token = None
+        self.genius_root = os.environ.get('JUNKIE_GENIUS_ROOT')
+        self.lyrics_results = queue.Queue()
+        self.lyrics_windows = {}
+
+        # The loudness of songs is analyzed on worker threads.
+        self.loudness_thread = None
+        self.loudness_stopped = None
+        self.loudness_results = queue.Queue()
 
         self.tip_window = None
 
-    def add_to_playing_list(self, file_path):
-        """Add songs to playing list."""
-        file_name = os.path.basename(file_path)
-        global index
-        if self.playing_list == []:
-            index = 0
-        self.playing_listbox.insert(index, ' ' + file_name)
-        if file_path != '':
-            self.playing_list.insert(index, file_path)
-            index += 1
+        # The library folders are watched on a thread, which reports
+        # the songs that are created, deleted or moved inside them.
+        self.watcher = None
+        self.watcher_job = None
+        self.start_watcher()
+
+    def get_row_text(self, file_path):
+        """Return the text of the row of a song in playing list."""
+        if file_path in self.engine.missing_tracks:
+            return ' [missing] ' + os.path.basename(file_path)
+        return ' ' + os.path.basename(file_path)
+
+    def add_to_playing_list(self, *files):
+        """Add songs to the end of playing list."""
+        self.playing_list.extend(files)
+        self.refresh_playing_list()
+        self.engine.queue_next_track()
 
     def browse_file(self, event):
         """Open file browser and add the selected file to playing list."""
@@ -453,27 +4453,158 @@ class MusicPlayer:
             # and the type of selected file is MP3 Format Sound we can
             # add it to playing list.
             self.add_to_playing_list(file_path)
+            self.engine.update_library([file_path])
             self.playing_list_name['text'] = 'Unsaved list'
 
     def browse_directory(self, event):
         """
-        Open directory browser and add all files of type mp3,
-        inside the selected directory to playing list.
+        Open directory browser and add all files of type mp3 and wav,
+        inside the selected directory and its subdirectories to
+        playing list.
         """
         dir_path = filedialog.askdirectory()
         if dir_path != '':
             # Since filepath is not empty (File browse not cancelled)
             # we can pick the files of type mp3 and add them
             # to playing list.
-            valid_files = [
-                join(dir_path, f).replace('\\', '/')
-                for f in listdir(dir_path)
-                if f.endswith('.mp3') or f.endswith('.wav')
-            ]
-            for file in valid_files:
-                self.add_to_playing_list(file)
+            self.import_directory(dir_path)
             self.playing_list_name['text'] = 'Unsaved list'
 
+    def import_directory(self, dir_path):
+        """
+        Add the files inside the directory with path 'dir_path' to
+        playing list in chunks, while the directory is being walked.
+        """
+        files_iterator = scan_directory(dir_path)
+        self.import_scans.add(files_iterator)
+        self.import_next_chunk(files_iterator)
+
+    def import_next_chunk(self, files_iterator, read_files=True):
+        """
+        Add the next chunk of files of 'files_iterator' parameter to
+        playing list, start reading them (if 'read_files' parameter
+        is True) and schedule the next chunk.
+        """
+        if files_iterator not in self.import_scans:
+            # The import has been cancelled.
+            return
+        # Stop the chunk after 500 files or 20 milliseconds, whichever
+        # comes first, so the window stays responsive while deep
+        # directories are being walked.
+        chunk = []
+        deadline = time.perf_counter() + 0.02
+        for file_path in files_iterator:
+            chunk.append(file_path)
+            if len(chunk) == 500 or time.perf_counter() > deadline:
+                break
+        else:
+            self.import_scans.discard(files_iterator)
+        if read_files and self.skip_duplicates_var.get():
+            # Songs with the same path are skipped right away; the
+            # others are compared by their audio after they are read.
+            if self.import_seen is None:
+                self.import_seen = set(self.playing_list)
+            chunk = [
+                file_path for file_path in chunk
+                if file_path not in self.import_seen
+            ]
+            self.import_seen.update(chunk)
+            self.duplicates_imported.update(chunk)
+        if len(chunk) != 0:
+            self.add_to_playing_list(*chunk)
+            if read_files:
+                # Read only the files that are new or have been changed
+                # since the last time they were added to the library.
+                self.start_import(chunk)
+        if files_iterator in self.import_scans:
+            self.master.after(
+                1, self.import_next_chunk, files_iterator, read_files
+            )
+        elif (
+            self.import_executor is None
+            and len(self.import_scans) == 0
+        ):
+            # Since no file is being read, the import is finished.
+            self.import_library_stats = None
+            self.finish_import()
+
+    def import_playlist_file(self, *args):
+        """
+        Open file browser and load the selected playlist file of type
+        M3U, M3U8 or PLS to playing list.
+        """
+        file_path = filedialog.askopenfilename(
+            filetypes=[
+                ('Playlist files', '*.m3u *.m3u8 *.pls'),
+                ('All files', '*.*'),
+            ]
+        )
+        if file_path != '':
+            self.clear_playing_list()
+            self.playing_list_name['text'] = os.path.splitext(
+                os.path.basename(file_path)
+            )[0]
+            # The files are not read while the playlist is loaded;
+            # durations and titles of the playlist are used until the
+            # files are played.
+            files_iterator = self.engine.scan_playlist_file(file_path)
+            self.import_scans.add(files_iterator)
+            self.import_next_chunk(files_iterator, read_files=False)
+
+    def export_playing_list(self, *args):
+        """
+        Open file browser and write playing list to the selected
+        playlist file of type M3U8, M3U or PLS.
+        """
+        if len(self.playing_list) == 0:
+            messagebox.showerror(
+                'Playlist empty',
+                self.playlist_empty,
+            )
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension='.m3u8',
+            filetypes=[
+                ('M3U8 playlist', '*.m3u8'),
+                ('M3U playlist', '*.m3u'),
+                ('PLS playlist', '*.pls'),
+            ],
+        )
+        if file_path == '':
+            return
+        library_info = self.engine.get_library_info()
+
+        def get_info(track):
+            # Return duration in whole seconds (-1 if unknown) and
+            # title of a file.
+            duration, title, artist = library_info.get(
+                track, (None, None, None)
+            )
+            if duration is None:
+                duration = -1
+            if title is None:
+                title = os.path.splitext(os.path.basename(track))[0]
+            elif artist is not None:
+                title = '{} - {}'.format(artist, title)
+            return round(duration), title
+
+        with open(file_path, 'w', encoding='utf-8', newline='\n') as f:
+            if file_path.lower().endswith('.pls'):
+                f.write('[playlist]\n')
+                for number, track in enumerate(self.playing_list, 1):
+                    duration, title = get_info(track)
+                    f.write('File{0}={1}\nTitle{0}={2}\nLength{0}={3}\n'.format(
+                            number, track, title, duration))
+                f.write('NumberOfEntries={}\nVersion=2\n'.format(
+                        len(self.playing_list)))
+            else:
+                f.write('#EXTM3U\n')
+                for track in self.playing_list:
+                    duration, title = get_info(track)
+                    f.write('#EXTINF:{},{}\n{}\n'.format(
+                            duration, title, track))
+        print('PLAYLIST: playing list EXPORTED to "{}".'.format(file_path))
+
     def remove_song(self):
         """Remove the selected song from playing list."""
         song_selection = self.playing_listbox.curselection()
@@ -481,8 +4612,10 @@ class MusicPlayer:
             # Since a song is selected we can remove it from
             # playing list.
             selected_song_index = song_selection[0]
-            self.playing_listbox.delete(selected_song_index)
-            self.playing_list.pop(selected_song_index)
+            self.playing_list.remove(selected_song_index)
+            self.playing_listbox.selection_clear(0, 'end')
+            self.refresh_playing_list()
+            self.engine.queue_next_track()
         else:
             # Otherwise we show an error message box.
             messagebox.showerror(
@@ -501,142 +4634,393 @@ class MusicPlayer:
             new_index = selected_song_index - 1
         elif direction == 'Down':
             new_index = selected_song_index + 1
-        file_path = self.playing_list[selected_song_index]
-        filename = os.path.basename(file_path)
+        if not 0 <= new_index < len(self.playing_list):
+            return
+        self.playing_list.move(selected_song_index, new_index)
+        self.refresh_playing_list()
+        self.playing_listbox.selection_set(new_index)
+        self.playing_listbox.see(new_index)
+        self.engine.queue_next_track()
+
+    def clear_playing_list(self, *args):
+        """Clear playing list"""
+        self.playing_list.clear()
+        self.refresh_playing_list()
+        self.playing_list_name['text'] = 'Unsaved list'
+        self.engine.queue_next_track()
+
+    def refresh_playing_list(self):
+        """
+        Show the playing list again after it has been changed, keeping
+        only the songs that match the search text (if there is any).
+        """
+        if self.search_var.get().strip() == '':
+            self.playing_listbox.refresh()
+        else:
+            self.search_playing_list(keep_position=True)
+
+    def schedule_search(self, *args):
+        """
+        Search the playing list shortly after the search text has been
+        changed; typing another letter before that delays the search,
+        so only the last text is searched.
+        """
+        if self.search_job is not None:
+            self.master.after_cancel(self.search_job)
+        self.search_job = self.master.after(50, self.search_playing_list)
+
+    def search_playing_list(self, keep_position=False):
+        """Show only the songs of playing list that match the search text."""
+        self.search_job = None
+        rows = self.engine.search_playing_list(self.search_var.get())
+        self.playing_listbox.set_rows(rows, keep_position)
 
-        self.playing_listbox.delete(selected_song_index)
-        self.playing_list.pop(selected_song_index)
-        self.playing_listbox.insert(new_index, ' '+filename)
-        self.playing_list.insert(new_index, file_path)
-        self.playing_listbox.selection_set(new_index)
+    def clear_search(self, event):
+        """Clear the search text and show the whole playing list again."""
+        self.search_var.set('')
 
-    def clear_playing_list(self, *args):
-        """Clear playing list"""
-        self.playing_listbox.delete(0, 'end')
-        self.playing_list = []
-        self.playing_list_name['text'] = 'Unsaved list'
+    def focus_search(self, event):
+        """Move the keyboard focus to the search box."""
+        self.search_entry.focus_set()
+        self.search_entry.select_range(0, 'end')
+
+    def focus_playing_list(self, event):
+        """
+        Move the keyboard focus from the search box to the playing
+        list and select the first shown song.
+        """
+        self.playing_listbox.focus_set()
+        if self.playing_listbox.size() != 0:
+            first_ix = self.playing_listbox.step(0, 0)
+            self.playing_listbox.selection_set(first_ix)
+            self.playing_listbox.see(first_ix)
 
     def set_repeat(self):
         """
-        Set the value of self.repeat and the tooltip text according to
-        repeat check button.
+        Turn repeat of the engine on or off and set the tooltip text
+        according to repeat check button.
         """
         if self.repeat_checkbutton_var.get() == 0:
-            self.repeat = False
+            self.engine.set_repeat(False)
             self.create_tooltip(
                 widget=self.repeat_checkbutton, text='Turn repeat on'
             )
         elif self.repeat_checkbutton_var.get() == 1:
-            self.repeat = True
+            self.engine.set_repeat(True)
             self.create_tooltip(
                 widget=self.repeat_checkbutton, text='Turn repeat off'
             )
 
     def set_shuffle(self):
         """
-        Set the value of self.shuffle and the tooltip text according to
-        shuffle check button.
+        Turn shuffle of the engine on or off and set the tooltip text
+        according to shuffle check button.
         """
         if self.shuffle_checkbutton_var.get() == 0:
-            self.shuffle = False
+            self.engine.set_shuffle(False)
             self.create_tooltip(
                 widget=self.shuffle_checkbutton, text='Turn shuffle on'
             )
         elif self.shuffle_checkbutton_var.get() == 1:
-            self.shuffle = True
+            self.engine.set_shuffle(True)
             self.create_tooltip(
                 widget=self.shuffle_checkbutton, text='Turn shuffle off'
             )
 
-    def set_file_tags(self, file_metadata):
+    def set_gapless(self):
+        """
+        Turn gapless playback of the engine on or off according to
+        gapless playback check button of playback menu.
+        """
+        self.engine.set_gapless(self.gapless_var.get() == 1)
+
+    def set_normalize(self):
+        """
+        Turn normalizing the loudness of songs on or off according to
+        the value of the check button.
+        """
+        self.engine.set_normalize(bool(self.normalize_var.get()))
+
+    def start_loudness_analysis(self):
+        """
+        Analyze the loudness of the songs inside the library that have
+        not been analyzed, on worker threads.
+        """
+        if self.loudness_thread is not None:
+            return
+        files_list = self.engine.get_unanalyzed_files()
+        if len(files_list) == 0:
+            messagebox.showinfo(
+                'Loudness analyzed',
+                self.loudness_analyzed,
+            )
+            return
+        print('LIBRARY: analyzing loudness of {} songs.'.format(
+                len(files_list)))
+        self.loudness_stopped = threading.Event()
+        self.loudness_thread = threading.Thread(
+            target=run_loudness_analysis,
+            args=(files_list, self.loudness_results, self.loudness_stopped),
+            daemon=True,
+        )
+        self.loudness_thread.start()
+        self.master.after(1000, self.check_loudness)
+
+    def check_loudness(self):
+        """
+        Store the loudness of the songs that have been analyzed since
+        the last check as one batch inside the library; check again
+        later if the analysis is not finished.
+        """
+        results = {}
+        finished = False
+        while True:
+            try:
+                item = self.loudness_results.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+                break
+            results[item[0]] = item[1]
+        if len(results) != 0:
+            self.engine.store_loudness(results)
+            if self.engine.playing_list.current_track in results:
+                self.engine.update_track_gain()
+        if finished:
+            self.loudness_thread = None
+        else:
+            self.master.after(1000, self.check_loudness)
+
+    def toggle_gapless(self, event):
+        """Turn gapless playback on or off."""
+        self.gapless_var.set(1 - self.gapless_var.get())
+        self.set_gapless()
+
+    def set_tracing(self):
+        """
+        Turn tracing of timings on or off according to trace timings
+        check button of playback menu.
+        """
+        if self.trace_var.get() == 1:
+            TRACER.enable()
+        else:
+            TRACER.disable()
+
+    def export_trace(self, chrome):
+        """
+        Open file browser and write the recorded timings to the
+        selected file, in the trace event format of Chrome if 'chrome'
+        parameter is True, or as histograms and spans otherwise.
+        """
+        if len(TRACER.spans) == 0:
+            messagebox.showwarning(
+                'No timings',
+                self.no_timings,
+            )
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension='.json',
+            filetypes=[('JSON file', '*.json')],
+        )
+        if file_path == '':
+            return
+        if chrome:
+            TRACER.export_chrome_trace(file_path)
+        else:
+            TRACER.export_json(file_path)
+
+    def set_profiling(self):
+        """
+        Start or stop profiling with cProfile according to profile
+        session check button of playback menu; the statistics of the
+        session are saved to the selected file when it stops.
+        """
+        if self.profile_var.get() == 1:
+            TRACER.start_profile()
+        else:
+            file_path = filedialog.asksaveasfilename(
+                defaultextension='.prof',
+                filetypes=[('Profile statistics', '*.prof')],
+            )
+            # The slowest functions are printed if no file is selected.
+            TRACER.stop_profile(file_path or None)
+
+    def set_file_tags(self, tags):
         """
         Define self.file_tags_dict, a dictionary containing tags of
-        a song.
+        a song, from 'tags' parameter, a dictionary of the values of
+        tags keyed by the keys of self.tags_keys_list (tags that are
+        not there or are None are left out).
         """
         self.file_tags_dict = {}
-        self.playing = True
-        if self.playing:
-            metadata_tags = file_metadata['tags']
-            for key in self.tags_keys_list:
-                if key in metadata_tags:
-                    key_ix = self.tags_keys_list.index(key)
-                    name = self.tags_names_list[key_ix]
-                    self.file_tags_dict[name] = metadata_tags[key][0]
+        for key_ix, key in enumerate(self.tags_keys_list):
+            if tags.get(key) is not None:
+                name = self.tags_names_list[key_ix]
+                self.file_tags_dict[name] = tags[key]
 
+    @TRACER.traced('ui: show_file_tags')
     def show_file_tags(self):
         """
         Show song tags (if there are any available) on the artwork of
         playing song according to file tags check button. (In details,
-        the artwork is edited with PIL module and song tags are
+        the artwork is blurred with PIL module and song tags are
         added as text on the image, and finally it shows the new
-        (edited) artwork.)
+        (edited) artwork.) The edited artwork is kept in memory, so
+        showing the tags of the same song again costs nothing.
         """
+        from PIL import ImageTk
+
         if self.tags_checkbutton_var.get() == 1:
             self.create_tooltip(
                 widget=self.tags_checkbutton, text='Hide song tags'
             )
-            if self.artwork_path == 'png/default-music-artwork-324.png':
-                img = Image.open('png/default-music-artwork-324.png')
-                blur_img = img.filter(ImageFilter.GaussianBlur(radius=4))
-                blur_path = 'png/default-music-artwork-324-blur.png'
-                blur_img.save(blur_path)
-                self.artwork_photoimage = PhotoImage(file=blur_path)
-            elif self.artwork_path == 'png/artwork.png':
-                img = Image.open('png/artwork.png')
-                blur_img = img.filter(ImageFilter.GaussianBlur(radius=4))
-                blur_path = 'png/artwork-blur.png'
-                blur_img.save(blur_path)
-                self.artwork_photoimage = PhotoImage(file=blur_path)
-            blur_img = Image.open(blur_path)
-            enhancer = ImageEnhance.Contrast(blur_img)
-            enhence_output = enhancer.enhance(0.5)
-            enhence_output.save(blur_path)
-            if self.file_tags_dict != {}:
-                blur_img = Image.open(blur_path)
-                image_editable = ImageDraw.Draw(blur_img)
-                keys_font = ImageFont.truetype('NIRMALA.TTF', 14)
-                values_font = ImageFont.truetype('NIRMALAB.TTF', 14)
-                for ix, key in enumerate(self.file_tags_dict):
-                    value = self.file_tags_dict[key]
-                    if len(value) > 26:
-                        value = value[:26] + ' ...'
-                    keys_coordinates = (15, 15+(20*ix))
-                    values_coordinates = (108, 15+(20*ix))
-                    image_editable.text(
-                        xy=keys_coordinates, text=key,
-                        fill=(255, 255, 255), font=keys_font,
-                    )
-                    image_editable.text(
-                        xy=values_coordinates, text=value,
-                        fill=(255, 255, 255), font=values_font,
-                    )
-                blur_img.save(blur_path)
-            else:
-                blur_img = Image.open(blur_path)
-                image_editable = ImageDraw.Draw(blur_img)
-                font = ImageFont.truetype('NIRMALAB.TTF', 14)
-                coordinates = (108, 15)
-                text = 'No tags available.'
-                image_editable.text(
-                    xy=coordinates, text=text,
-                    fill=(255, 255, 255), font=font
+            tags_key = ('tags', self.artwork_key) + tuple(
+                (key, str(value)) for key, value in self.file_tags_dict.items()
+            )
+            self.tags_photoimage = self.tags_cache.get(tags_key)
+            if self.tags_photoimage is None:
+                tags_image = self.render_tags_artwork()
+                self.tags_photoimage = ImageTk.PhotoImage(tags_image)
+                self.tags_cache.put(
+                    tags_key, self.tags_photoimage,
+                    tags_image.size[0] * tags_image.size[1] * 4,
                 )
-                blur_img.save(blur_path)
-
-            self.artwork_photoimage = PhotoImage(file=blur_path)
-            self.artwork_label.configure(image=self.artwork_photoimage)
+            self.artwork_label.configure(image=self.tags_photoimage)
         elif self.tags_checkbutton_var.get() == 0:
             self.create_tooltip(
                 widget=self.tags_checkbutton, text='Show song tags'
             )
-            self.artwork_photoimage = PhotoImage(file=self.artwork_path)
             self.artwork_label.configure(image=self.artwork_photoimage)
 
+    def get_tags_fonts(self):
+        """
+        Return a tuple of the fonts of the keys and the values of song
+        tags, loading them only the first time.
+        """
+        from PIL import ImageFont
+
+        if self.tags_fonts is None:
+            try:
+                self.tags_fonts = (
+                    ImageFont.truetype('NIRMALA.TTF', 14),
+                    ImageFont.truetype('NIRMALAB.TTF', 14),
+                )
+            except OSError:
+                # Since Nirmala UI is only available on Windows, we
+                # use the default font of PIL module elsewhere.
+                font = ImageFont.load_default()
+                self.tags_fonts = (font, font)
+        return self.tags_fonts
+
+    def render_tags_artwork(self):
+        """
+        Return a blurred copy of the artwork of the playing song with
+        lower contrast, with song tags drawn on it. The blurred artwork
+        is kept in memory, so songs with the same artwork (songs of an
+        album) only draw the tags.
+        """
+        from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+
+        base_key = ('base', self.artwork_key)
+        base_image = self.tags_cache.get(base_key)
+        if base_image is None:
+            img = self.artwork_image
+            if img is None:
+                img = Image.open('png/default-music-artwork-324.png')
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGB')
+            blur_img = img.filter(ImageFilter.GaussianBlur(radius=4))
+            base_image = ImageEnhance.Contrast(blur_img).enhance(0.5)
+            self.tags_cache.put(
+                base_key, base_image,
+                base_image.size[0] * base_image.size[1]
+                * len(base_image.getbands()),
+            )
+        tags_image = base_image.copy()
+        image_editable = ImageDraw.Draw(tags_image)
+        keys_font, values_font = self.get_tags_fonts()
+        if self.file_tags_dict != {}:
+            for ix, key in enumerate(self.file_tags_dict):
+                value = str(self.file_tags_dict[key])
+                if len(value) > 26:
+                    value = value[:26] + ' ...'
+                keys_coordinates = (15, 15+(20*ix))
+                values_coordinates = (108, 15+(20*ix))
+                image_editable.text(
+                    xy=keys_coordinates, text=key,
+                    fill=(255, 255, 255), font=keys_font,
+                )
+                image_editable.text(
+                    xy=values_coordinates, text=value,
+                    fill=(255, 255, 255), font=values_font,
+                )
+        else:
+            image_editable.text(
+                xy=(108, 15), text='No tags available.',
+                fill=(255, 255, 255), font=values_font,
+            )
+        return tags_image
+
+    def load_artwork(self, key, artwork_data):
+        """
+        Return a tuple of the image (of PIL module) and the photo image
+        of the artwork with bytes 'artwork_data' and hash 'key',
+        resized to fit the artwork label, from the artwork cache; or
+        decode and resize it and keep it in the cache if it is not
+        there ('artwork_data' can be None if it is there).
+        """
+        from PIL import Image, ImageTk
+
+        artwork = self.artwork_cache.get(key)
+        if artwork is not None:
+            return artwork
+        img = Image.open(BytesIO(artwork_data))
+        # Since most artworks are big JPEG images, we let the decoder
+        # decode them at a smaller scale that is still at least as
+        # big as the label (other types ignore this).
+        img.draft('RGB', (self.artwork_size, self.artwork_size))
+        if img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGB')
+        # Resize the image, so its longer side fits the label.
+        resize_percent = self.artwork_size / float(max(img.size))
+        img = img.resize(
+            (
+                max(int(img.size[0] * resize_percent), 1),
+                max(int(img.size[1] * resize_percent), 1),
+            ),
+            Image.LANCZOS,
+        )
+        artwork = (img, ImageTk.PhotoImage(img))
+        # The pixels are kept twice: once by PIL and once by Tk (in
+        # 4 bytes each).
+        size = img.size[0] * img.size[1] * (len(img.getbands()) + 4)
+        self.artwork_cache.put(key, artwork, size)
+        return artwork
+
+    def set_artwork(self, key, image, photoimage):
+        """
+        Show the photo image 'photoimage' of the image (of PIL module)
+        'image' with hash 'key' as the artwork of the playing song
+        ('image' is None for the default artwork).
+        """
+        self.artwork_key = key
+        self.artwork_image = image
+        self.artwork_photoimage = photoimage
+        self.artwork_label.configure(image=photoimage)
+
+    def show_default_artwork(self):
+        """Show the default artwork on the artwork label."""
+        self.set_artwork('default', None, self.default_artwork_photoimage)
+
+    @TRACER.traced('ui: show_file_info')
     def show_file_info(self, playing_song):
         """
-        Get the metadata of playing song using audio_metadata module
-        and set the artwork, song title and song artists label widgets
-        using the metadata.
+        Set the artwork, song title and song artists label widgets of
+        the playing song. The tags and the hash of the artwork are
+        taken from the library, so the file is only parsed with
+        audio_metadata module if the song is not in the library or its
+        artwork is not in the artwork cache.
         """
         self.file_name = os.path.basename(playing_song)
         self.tags_checkbutton_var.set(0)
@@ -646,539 +5030,736 @@ class MusicPlayer:
             self.file_name = textwrap.shorten(
                 self.file_name, width=40, placeholder=" ..."
             )
-        file_metadata = audio_metadata.load(playing_song)
-        self.set_file_tags(file_metadata)
-        try:
-            artwork = file_metadata.pictures[0].data
-            artwork_stream = BytesIO(artwork)
-            img = Image.open(artwork_stream)
-            # Check width and height of the image and resize it.
-            if img.size[0] <= img.size[1]:
-                base_height = 324
-                resize_percent = base_height / float(img.size[1])
-                width_size = int((float(img.size[0]) * float(resize_percent)))
-                img = img.resize((width_size, base_height), Image.ANTIALIAS)
-            elif img.size[0] > img.size[1]:
-                base_width = 324
-                resize_percent = base_width / float(img.size[0])
-                height_size = int((float(img.size[1]) * float(resize_percent)))
-                img = img.resize((base_width, height_size), Image.ANTIALIAS)
-            img.save('png/artwork.png')
-            self.artwork_path = 'png/artwork.png'
-            with open(self.artwork_path, 'rb') as image:
-                # convert image to byte array to make a stream with
-                # BytesIO.
-                f = image.read()
-                b = bytearray(f)
-            artwork_stream = BytesIO(b)
-            self.artwork_photoimage = PhotoImage(file=self.artwork_path)
-            self.artwork_label.configure(image=self.artwork_photoimage)
-
-            file_title = file_metadata['tags']['title'][0]
-            self.file_title_label.config(text=file_title)
+        library_entry = self.engine.get_library_entry(playing_song)
+        artwork = None
+        if library_entry is not None and (
+            library_entry['artwork_hash'] == ''
+            or library_entry['artwork_hash'] in self.artwork_cache
+        ):
+            self.set_file_tags(library_entry)
+            artwork_key = library_entry['artwork_hash'] or None
+        else:
+            import audio_metadata
 
-            file_artists = file_metadata['tags']['artist'][0]
-            self.file_artists_label.config(text=file_artists)
-        except (IndexError, KeyError):
+            file_metadata = audio_metadata.load(playing_song)
+            metadata_tags = file_metadata['tags']
+            self.set_file_tags({
+                key: metadata_tags[key][0] for key in self.tags_keys_list
+                if key in metadata_tags
+            })
+            artwork_key = None
+            if len(file_metadata.pictures) != 0:
+                artwork = file_metadata.pictures[0].data
+                artwork_key = hashlib.sha1(artwork).hexdigest()
+        file_title = self.file_tags_dict.get('Title')
+        file_artists = self.file_tags_dict.get('Artist')
+        if artwork_key is None or file_title is None or file_artists is None:
             # If either of artwork, title or artists were not found in
             # metadata, set the artwork label with the default value,
             # song title label with the value of file name and
             # song artists with the value of 'Unknown artist'.
-            self.artwork_path = 'png/default-music-artwork-324.png'
-            self.artwork_photoimage = PhotoImage(file=self.artwork_path)
-            self.artwork_label.configure(image=self.artwork_photoimage)
-
-            file_title = self.file_name
+            self.show_default_artwork()
+            self.file_title_label.config(text=self.file_name)
+            self.file_artists_label.configure(text='Unknown artist')
+        else:
+            self.set_artwork(
+                artwork_key, *self.load_artwork(artwork_key, artwork)
+            )
             self.file_title_label.config(text=file_title)
+            self.file_artists_label.config(text=file_artists)
+
+    def format_time(self, seconds):
+        """Return 'seconds' parameter in the format of mm:ss."""
+        mins, secs = divmod(int(seconds), 60)
+        return '{:02d}:{:02d}'.format(mins, secs)
+
+    def start_clock(self):
+        """
+        Start updating the current time label of the playing song.
+        There is only one clock; starting it again replaces the
+        scheduled update.
+        """
+        self.stop_clock()
+        self.update_clock()
+
+    def stop_clock(self):
+        """Cancel the scheduled update of the current time label."""
+        if self.clock_job is not None:
+            self.master.after_cancel(self.clock_job)
+            self.clock_job = None
+
+    def update_clock(self):
+        """
+        Show the current time of the playing song, taken from the
+        engine, and schedule the next update for when the shown second
+        changes. Polling the engine also plays the next song if the
+        playing song has ended; its events show it. This runs on the
+        Tk loop and is not scheduled while the music is paused.
+        """
+        self.clock_job = None
+        position = self.engine.poll()
+        if position is None:
+            return
+        if not self.seek_dragging:
+            self.current_time_label['text'] = self.format_time(
+                position / 1000
+            )
+            self.move_playhead(position)
+        self.clock_job = self.master.after(
+            self.engine.get_poll_delay(), self.update_clock
+        )
+
+    def show_waveform(self, playing_song):
+        """
+        Draw the waveform of the playing song on the seek bar, from the
+        database; compute it (and the seek index of an MP3 song, so
+        the first seek does not wait for it) on the waveform worker
+        thread if it is not there.
+        """
+        peaks = self.engine.get_cached_waveform(playing_song)
+        self.draw_waveform(peaks)
+        self.move_playhead(self.engine.position)
+        needs_index = (
+            playing_song.lower().endswith('.mp3')
+            and not self.engine.has_seek_index(playing_song)
+        )
+        if (
+            (peaks is not None and not needs_index)
+            or playing_song in self.waveform_pending
+        ):
+            return
+
+        self.waveform_pending.add(playing_song)
+        self.waveform_jobs.put((playing_song, peaks is None, needs_index))
+        if self.waveform_thread is None:
+            self.waveform_thread = threading.Thread(
+                target=self.compute_waveforms, daemon=True
+            )
+            self.waveform_thread.start()
+        if len(self.waveform_pending) == 1:
+            self.master.after(100, self.check_waveforms)
+
+    def compute_waveforms(self):
+        """
+        Compute the waveforms and the seek indexes that
+        self.show_waveform() asks for one song at a time, and put them
+        in self.waveform_results; songs that are no longer playing when
+        their turn comes are skipped, so skipping through a playlist
+        does not decode every song of it. This runs on the waveform
+        worker thread, so it must not use the database or any widget.
+        """
+        while True:
+            file_path, needs_peaks, needs_index = self.waveform_jobs.get()
+            mtime = None
+            result = None
+            seek_index = None
+            if file_path == self.playing_song:
+                try:
+                    mtime = os.stat(file_path).st_mtime
+                    if needs_index:
+                        try:
+                            seek_index = build_seek_index(file_path)
+                        except ValueError:
+                            # An index without offsets is kept, so the
+                            # song is not walked again on every play.
+                            seek_index = (0, 0, b'')
+                    if needs_peaks:
+                        result = compute_waveform(file_path)
+                except Exception as e:
+                    result = e
+            self.waveform_results.put((file_path, mtime, result, seek_index))
+
+    def check_waveforms(self):
+        """
+        Store the waveforms and seek indexes that have been computed by
+        the waveform worker since the last check, and draw the waveform
+        of the playing song; check again later if any of them is not
+        finished.
+        """
+        while True:
+            try:
+                file_path, mtime, result, seek_index = \
+                    self.waveform_results.get_nowait()
+            except queue.Empty:
+                break
+            self.waveform_pending.discard(file_path)
+            if seek_index is not None:
+                self.engine.store_seek_index(file_path, mtime, seek_index)
+            if result is None:
+                continue
+            if isinstance(result, Exception):
+                print('MIXER: could not compute waveform of "{}" ({}).'.format(
+                        file_path, result))
+                continue
+            self.engine.store_waveform(file_path, mtime, result)
+            if file_path == self.playing_song:
+                self.draw_waveform(result)
+        if len(self.waveform_pending) != 0:
+            self.master.after(100, self.check_waveforms)
+
+    def draw_waveform(self, peaks):
+        """
+        Draw waveform 'peaks' (see compute_waveform()) on the seek bar
+        as one polygon, or a flat line if 'peaks' is None.
+        """
+        self.waveform_canvas.delete('waveform')
+        width = self.artwork_size
+        height = self.waveform_height
+        if peaks is None:
+            self.waveform_canvas.create_line(
+                0, height / 2, width, height / 2, fill='grey',
+                tags='waveform',
+            )
+        else:
+            # The highest samples are the top edge of the polygon from
+            # left to right, and the lowest samples are its bottom edge
+            # from right to left.
+            columns = len(peaks) // 2
+            top = []
+            bottom = []
+            for ix in range(columns):
+                x = ix * width / columns
+                top.extend((x, (255 - peaks[2 * ix + 1]) * height / 255))
+                bottom.extend((x, (255 - peaks[2 * ix]) * height / 255))
+            for ix in range(len(bottom) - 2, -1, -2):
+                top.extend(bottom[ix:ix + 2])
+            self.waveform_canvas.create_polygon(
+                top, fill='grey', outline='grey', tags='waveform',
+            )
+        self.waveform_canvas.tag_raise('playhead')
+
+    def move_playhead(self, position):
+        """
+        Move the playhead of the seek bar to time 'position' of the
+        playing song in milliseconds.
+        """
+        length = self.engine.track_length
+        if length:
+            x = min(position / 1000 / length, 1) * self.artwork_size
+        else:
+            x = 0
+        self.waveform_canvas.coords('playhead', x, 0, x, self.waveform_height)
+
+    def get_pointer_time(self, event):
+        """
+        Return the time in seconds of the playing song under the
+        pointer of 'event' on the seek bar, or None if nothing is
+        playing or the length of the song is not known.
+        """
+        length = self.engine.track_length
+        if not length or not (self.engine.playing or self.engine.paused):
+            return None
+        x = min(max(event.x, 0), self.artwork_size)
+        return x / self.artwork_size * length
 
-            file_artists = 'Unknown artist'
-            self.file_artists_label.configure(text=file_artists)
+    def drag_playhead(self, event):
+        """
+        Move the playhead to the pointer while the seek bar is pressed,
+        and show the time it seeks to when it is released.
+        """
+        seconds = self.get_pointer_time(event)
+        if seconds is None:
+            return
+        self.seek_dragging = True
+        self.current_time_label['text'] = self.format_time(seconds)
+        self.move_playhead(seconds * 1000)
+
+    def seek_to_pointer(self, event):
+        """Seek the playing song to the time under the pointer."""
+        if not self.seek_dragging:
+            return
+        self.seek_dragging = False
+        seconds = self.get_pointer_time(event)
+        if seconds is not None:
+            self.engine.seek(seconds)
+
+    def show_seeked(self, position):
+        """
+        Show time 'position' in milliseconds that the playing song has
+        been seeked to, and restart the clock from it.
+        """
+        self.current_time_label['text'] = self.format_time(position / 1000)
+        self.move_playhead(position)
+        if self.engine.playing:
+            self.start_clock()
 
+    @TRACER.traced('ui: show_details')
     def show_details(self, playing_song):
         """Show details for the playing song."""
-        def get_total_length(playing_song):
-            """
-            Get the total length of playing song using mutagen.mp3
-            module for file of type MP3 and pygame.mixer module for
-            files of type WAV, and return it.
-            """
-            if playing_song.endswith('.mp3'):
-                mp3_file = MP3(playing_song)
-                total_length = mp3_file.info.length
-            elif playing_song.endswith('.wav'):
-                wav_file = mixer.Sound(playing_song)
-                total_length = wav_file.get_length()
-            else:
-                messagebox.showerror(
-                    'Track type invalid',
-                    self.track_type_invalid,
-                )
-            return total_length
-
-        def start_count():
-            """
-            start counting and calculating the current time and
-            show it every second.
-            """
-            current_time = 0
-            while True:
-                while (
-                    current_time < round(total_length)
-                    and mixer.music.get_busy()
-                ):
-                    if self.paused:
-                        continue
-                    else:
-                        if self.current_time_label == self.total_length_label:
-                            self.next_music()
-                            return False
-                        mins, secs = divmod(current_time, 60)
-                        mins, secs = round(mins), round(secs)
-                        time_format = '{:02d}:{:02d}'.format(mins, secs)
-                        self.current_time_label['text'] = time_format
-                        time.sleep(1)
-                        current_time += 1
-                        if self.timeline_changed:
-                            return False
-                else:
-                    if self.paused:
-                        self.current_time_label['text'] = '00:00'
-                        return False
-                    else:
-                        self.current_time_label['text'] = '00:00'
-                        self.playing = False
-                        self.music_ended = True
-                        self.play_or_pause()
-                    return False
-
-        total_length = get_total_length(playing_song)
-        mins, secs = divmod(total_length, 60)
-        mins, secs = round(mins), round(secs)
-        time_format = '{:02d}:{:02d}'.format(mins, secs)
-        self.total_length_label['text'] = time_format
+        total_length = self.engine.get_track_length()
+        if total_length is None:
+            messagebox.showerror(
+                'Track type invalid',
+                self.track_type_invalid,
+            )
+            total_length = 0
+        self.total_length_label['text'] = self.format_time(total_length)
+        self.show_waveform(playing_song)
         if self.timeline_changed:
-            # if the playing song changed, set the current time label
-            # with the default value and make a thread for counting
-            # and calculating the current time.
-            self.current_time_label['text'] = '__:__'
-            time_calculator_thread = threading.Thread(
-                target=start_count, daemon=True
-            )
-            time_calculator_thread.start()
+            # if the playing song changed, start the clock of the
+            # current time from the beginning.
+            self.start_clock()
             self.timeline_changed = False
         self.show_file_info(playing_song)
 
+    def show_track(self, track_ix):
+        """
+        Select the playing song with index 'track_ix' in the playing
+        listbox and show its details, once the mixer has started it.
+        """
+        self.playing_song = self.playing_list.current_track
+        # The selection of the listbox follows the playing song.
+        self.playing_listbox.select_clear(0, 'end')
+        self.playing_listbox.selection_set(track_ix)
+        self.playing_listbox.see(track_ix)
+        self.timeline_changed = True
+        self.change_play_button_image(self.get_icon('pause-24'))
+        # Showing details and artwork of the song is left to when the
+        # Tk loop is idle, so it does not delay the music; if another
+        # song is played before that, only its details are shown.
+        if self.details_job is not None:
+            self.master.after_cancel(self.details_job)
+        self.details_job = self.master.after_idle(self.show_playing_details)
+
+    def show_playing_details(self):
+        """Show details for the playing song, after it has started."""
+        self.details_job = None
+        self.show_details(self.playing_song)
+        self.engine.queue_next_track()
+
+    def transport(self, command, *args):
+        """
+        Run the transport command 'command' ('play_pause', 'next' or
+        'previous') with arguments 'args'. No command waits for the
+        music; only the mixer is changed before returning and the
+        details of the playing song are shown afterwards.
+        """
+        self.transport_commands[command](*args)
+
+    def get_icon(self, name):
+        """
+        Return the photo image of icon 'png/<name>.png', loading it
+        only the first time.
+        """
+        if name not in self.icons:
+            self.icons[name] = PhotoImage(file='png/{}.png'.format(name))
+        return self.icons[name]
+
+    def change_play_button_image(self, photoimage):
+        """Change image of play/pause button."""
+        self.play_button.configure(image=photoimage)
+
     def play_or_pause(self, *args):
         """
-        Play or pause the music according to the action that
-        calls this function.
-        """
-        def change_image(image_path):
-            """Change image of play/pause button."""
-            button_photoimage = PhotoImage(file=image_path)
-            self.play_button.configure(image=button_photoimage)
-            self.play_button.image = button_photoimage
-        def unpause():
-            """Unpause music"""
-            mixer.music.unpause()
-            time.sleep(1)
-            self.paused = False
-            self.playing = True
-            change_image(pause_photo)
-        def play():
-            """Play music"""
-            try:
-                if len(listbox_selection) != 0:
-                    if (
-                        self.music_ended == True
-                        and self.music_ended != 'This is my first time!'
-                    ):
-                        # Since the playing song has been ended we check
-                        # if there is a song in queue or not.
-                        if self.playing_song_ix == len(self.playing_list)-1:
-                            if not self.repeat and not self.shuffle:
-                                # Since the ended song was the last one
-                                # in queue, and repeat and shuffle are
-                                # not enabled we set everything with
-                                # the default value.
-                                self.artwork_path = 'png/default-music-artwork-324.png'
-                                self.artwork_photoimage = PhotoImage(file=self.artwork_path)
-                                self.artwork_label.configure(image=self.artwork_photoimage)
-                                self.file_title_label['text'] = 'Nothing playing'
-                                self.file_artists_label['text'] = ''
-
-                                self.total_length_label['text'] = '__:__'
-                                self.current_time_label['text'] = '__:__'
-                                change_image(play_photo)
-                                
-                                self.playing_listbox.select_clear(0, END)
-                                self.playing_listbox.selection_set(0)
-                                self.playing_listbox.see(0)
-
-                                self.playing = False
-                                self.paused = False
-                                self.music_ended = 'This is my first time!'
-                            else:
-                                self.music_ended = 'This is my first time!'
-                                self.next_music()
-                                self.music_ended = False
-                        else:
-                            # Since there is another song or songs in
-                            # queue we play it.
-                            # 
-                            # Notice that in self.next_music(),
-                            # self.play_or_pause() has been called; so
-                            # we set the value of self.music_ended
-                            # 'This is my first time' to not to play
-                            # the song in that turn; but after calling
-                            # self.next_music we set it to False to play
-                            # the song in this turn.
-                            self.music_ended = 'This is my first time!'
-                            self.next_music()
-                            self.music_ended = False
-
-                    elif listbox_selection != self.playing_song_ix:
-                        # Since the user has selected another song than
-                        # the playing one, we set the selected song as
-                        # the value of self.playing_song to play it.
-                        self.playing_song_ix = self.playing_listbox.curselection()[0]
-                        self.playing_song = self.playing_list[self.playing_song_ix]
-                        self.timeline_changed = True
-                    time.sleep(1)
-                    if self.music_ended == 'This is my first time!':
-                        # As explained in a comment above, we pass
-                        # the function to not to play the song twice.
-                        pass
-                    else:
-                        # As explained in a comment above, we play
-                        # the next song in queue, when the current
-                        # song has been ended.
-                        mixer.music.load(self.playing_song)
-                        mixer.music.play()
-                        self.show_details(self.playing_song)
-                        change_image(pause_photo)
-                        self.playing = True
-                    self.music_ended = ''
-                elif (
-                    len(listbox_selection) == 0
-                    and len(self.playing_list) != 0
-                ):
-                    # Since the playing list is not empty but no song
-                    # has been selected we play the first song of queue.
-                    self.playing_song_ix = 0
-                    self.playing_song = self.playing_list[self.playing_song_ix]
-                    self.playing_listbox.selection_set(self.playing_song_ix)
-                    self.timeline_changed = True
-                    time.sleep(1)
-                    mixer.music.load(self.playing_song)
-                    mixer.music.play()
-                    self.show_details(self.playing_song)
-                    change_image(pause_photo)
-                    self.playing = True
-                else:
-                    # Otherwise we raise a NameError to enter
-                    # the exception.
-                    raise NameError
-            except NameError:
-                # Get info of the error and print it; then show an error
-                # message box.
-                exc_type, exc_obj, exc_tb = sys.exc_info()
-                del exc_obj
-                fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                print('File "{}", line {}, error {}'.format(
-                        fname, exc_tb.tb_lineno, exc_type))
-                messagebox.showerror(
-                    'File not found',
-                    self.file_not_found,
-                )
-        def pause():
-            """Pause music"""
-            try:
-                time.sleep(1)
-                self.timeline_changed = False
-                mixer.music.pause()
-                self.paused = True
-                self.playing = False
-                change_image(play_photo)
-            except:
-                messagebox.showerror(
-                    'File not found',
-                    self.file_not_found,
-                )
+        Play or pause the music according to the action that calls
+        this function. The selected song is played if it is not the
+        paused song; 'args' is only given when a song of the playing
+        listbox is double-clicked or chosen with Return key, which
+        plays it from the beginning.
+        """
+        if len(self.playing_list) == 0:
+            messagebox.showerror(
+                'File not found',
+                self.file_not_found,
+            )
+            return
+        listbox_selection = self.playing_listbox.curselection()
+        if len(listbox_selection) != 0:
+            track_ix = listbox_selection[0]
+        else:
+            track_ix = None
+        self.engine.play_pause(track_ix, restart=len(args) > 0)
 
-        if len(args) > 0:
-            self.playing = False
-            self.timeline_changed = True
-        if (
-            self.playing_song != ''
-            and self.playing_song in self.playing_list
-        ):
-            self.playing_song_ix = self.playing_list.index(self.playing_song)
+    def show_paused(self):
+        """Stop the clock and show the play button."""
+        self.timeline_changed = False
+        self.stop_clock()
+        self.change_play_button_image(self.get_icon('play-24'))
+
+    def show_unpaused(self):
+        """Start the clock and show the pause button."""
+        self.start_clock()
+        self.change_play_button_image(self.get_icon('pause-24'))
+
+    def show_stopped(self):
+        """Stop the clock, so it starts again with the next song."""
+        self.stop_clock()
+        self.timeline_changed = True
+
+    def show_list_ended(self):
+        """
+        Show that nothing is playing, since the ended song was the last
+        one in queue and repeat and shuffle are not enabled.
+        """
+        self.stop_clock()
+        self.show_default_artwork()
+        self.file_title_label['text'] = 'Nothing playing'
+        self.file_artists_label['text'] = ''
+
+        self.total_length_label['text'] = '__:__'
+        self.current_time_label['text'] = '__:__'
+        self.waveform_canvas.delete('waveform')
+        self.move_playhead(0)
+        self.change_play_button_image(self.get_icon('play-24'))
+
+        self.playing_listbox.select_clear(0, END)
+        self.playing_listbox.selection_set(0)
+        self.playing_listbox.see(0)
+
+    def set_volume(self, val):
+        """
+        Set the volume of music according to the value of
+        volume scale widget.
+        """
+        volume = float(val) / 100
+        self.engine.set_volume(volume)
+        if volume == 0:
+            self.volume_button.config(image=self.get_icon('muted-16'))
+        elif 0.5 > volume > 0:
+            self.volume_button.config(image=self.get_icon('volume-low-16'))
         else:
-            self.playing_song_ix = None
-        listbox_selection = self.playing_listbox.curselection()
-        if (
-            len(listbox_selection) != 0
-            and listbox_selection[0] != self.playing_song_ix
-        ):
-            self.timeline_changed = True
-        play_photo = self.play_photoimage['file']
-        pause_photo = self.pause_photoimage['file']
-        if self.paused == True:
-            if self.timeline_changed:
-                # Since the music is paused but the playing song
-                # has been changed we play the new song.
-                self.paused = False
-                play()
-            else:
-                # Since the music is paused and the playing song
-                # has not been changed, we unpause it.
-                unpause()
-        elif not self.playing and not self.paused:
-            # Since no song is being played and therefore
-            # nothing is paused we play the new song
-            # according to the action of user.
-            play()
-        elif self.playing and not self.paused:
-            # Since a song is playing and not paused, we pause it.
-            pause()
-
-    def next_music(self):
-        """Set the next song and play it."""
-        def set_next(selected_song_ix, next_song_ix):
-            """Set the next song"""
-            self.playing_song = self.playing_list[next_song_ix]
-            self.playing_listbox.select_clear(selected_song_ix, 'end')
-            self.playing_listbox.selection_set(next_song_ix)
-        listbox_selection = self.playing_listbox.curselection()
-        if (
-            self.playing_song != ''
-            and self.playing_song in self.playing_list
-        ):
-            # Since the playing list is not empty and includes
-            # the currently playing song, we set the next song
-            # to play it.
-            if len(listbox_selection) != 0:
-                selected_song_ix = listbox_selection[0]
-            else:
-                selected_song_ix = None
-            playing_song_ix = self.playing_list.index(self.playing_song)
-            if selected_song_ix != None:
-                if not self.repeat and not self.shuffle:
-                    if playing_song_ix == len(self.playing_list)-1:
-                        set_next(selected_song_ix, 0)
-                    else:
-                        set_next(selected_song_ix, playing_song_ix+1)
-                else:
-                    if self.repeat and not self.shuffle:
-                        if playing_song_ix == len(self.playing_list)-1:
-                            set_next(selected_song_ix, 0)
-                        else:
-                            set_next(selected_song_ix, playing_song_ix+1)
-                    elif self.shuffle:
-                        while True:
-                            next_song_ix = random.randrange(len(self.playing_list))
-                            if next_song_ix == playing_song_ix:
-                                pass
-                            else:
-                                break
-                        set_next(selected_song_ix, next_song_ix)
-                self.playing = False
-                if len(listbox_selection) > 0:
-                    # if the next song is not in sight scroll listbox so
-                    # the user can see it.
-                    index = self.playing_listbox.curselection()[0]
-                    self.playing_listbox.see(index)
-                self.timeline_changed = True
-                self.play_or_pause()
-
-    def previous_music(self):
-        """Set the previous song and play it."""
-        def set_previous(selected_song_ix, previous_song_ix):
-            """Set the previous song"""
-            self.playing_song = self.playing_list[previous_song_ix]
-            self.playing_listbox.select_clear(selected_song_ix, 'end')
-            self.playing_listbox.selection_set(previous_song_ix)
-        listbox_selection = self.playing_listbox.curselection()
+            self.volume_button.config(image=self.get_icon('volume-high-16'))
+
+    def mute_music(self):
+        """Mute or unmute music according to the current state."""
+        if not self.muted:
+            self.last_volume = int(self.volume_scale.get())
+            self.engine.set_volume(0)
+            self.volume_button.config(image=self.get_icon('muted-16'))
+            self.volume_scale.set(0)
+            self.muted = True
+        else:
+            decimal_volume = float(self.last_volume) / 100
+            self.engine.set_volume(decimal_volume)
+            self.volume_button.config(image=self.get_icon('volume-high-16'))
+            self.volume_scale.set(self.last_volume)
+            self.muted = False
+
+    def load_playlist(self, name, files_list):
+        """
+        Load playlist with name 'name' parameter and files
+        'files_list' parameter.
+        """
+        self.playing_list.replace(files_list)
+        self.refresh_playing_list()
+        self.playing_list_name['text'] = name
+        self.engine.stop()
+        self.total_length_label['text'] = '__:__'
+        self.current_time_label['text'] = '__:__'
+        self.playing_listbox.selection_set(0)
+        self.playing_song = ''
+        self.play_or_pause()
+
+    def start_import(self, files_list):
+        """
+        Read the files of 'files_list' parameter which are not in the
+        library or have been changed inside a pool of worker processes
+        and show the progress of reading them.
+        """
+        if self.import_library_stats is None:
+            # Fetch the library once for all chunks of an import.
+            self.import_library_stats = self.engine.get_library_stats()
+        changed_files = self.engine.get_changed_files(
+            files_list, self.import_library_stats
+        )
+        self.read_files(changed_files)
+
+    def read_files(self, files_list):
+        """
+        Read the files of 'files_list' parameter inside a pool of
+        worker processes and show the progress of reading them; they
+        are stored inside the library by self.check_import().
+        """
+        if len(files_list) == 0:
+            return
+        if self.import_executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.import_executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count()
+            )
+            self.import_total = 0
+            self.import_done = 0
+            self.import_progressbar['value'] = 0
+            self.import_frame.pack(after=self.playing_listbox_frame, pady=5)
+            self.master.after(100, self.check_import)
+        self.import_total += len(files_list)
+        self.import_progressbar['maximum'] = self.import_total
+        for file_path in files_list:
+            future = self.import_executor.submit(
+                probe_file, file_path, self.tags_keys_list
+            )
+            # The callback runs in a thread of the pool, so it only
+            # passes the future to the Tk thread through the queue.
+            future.add_done_callback(self.import_results.put)
+
+    def check_import(self):
+        """
+        Store the files that have been read by the import workers since
+        the last check as one batch inside the library and update the
+        progress bar; check again later if the import is not finished.
+        """
+        if self.import_executor is None:
+            return
+        entries = []
+        while True:
+            try:
+                future = self.import_results.get_nowait()
+            except queue.Empty:
+                break
+            self.import_done += 1
+            if future.cancelled():
+                continue
+            try:
+                entries.append(future.result())
+            except Exception as e:
+                print('LIBRARY: could not read file ({}).'.format(e))
+        if len(entries) != 0:
+            self.engine.store_library_entries(entries)
+            print('DATABASE: {} library entries UPDATED.'.format(len(entries)))
+        self.import_progressbar['value'] = self.import_done
         if (
-            self.playing_song != ''
-            and self.playing_song in self.playing_list
+            self.import_done >= self.import_total
+            and len(self.import_scans) == 0
         ):
-            # Since the playing list is not empty and includes
-            # the currently playing song, we set the previous song
-            # to play it.
-            #
-            # Notice that this function works the same as
-            # self.next_music() when shuffle is enabled.
-            if len(listbox_selection) != 0:
-                selected_song_ix = listbox_selection[0]
-            else:
-                selected_song_ix = None
-            playing_song_ix = self.playing_list.index(self.playing_song)
-            if selected_song_ix != None:
-                if not self.shuffle:
-                    if playing_song_ix == 0:
-                        set_previous(selected_song_ix, len(self.playing_list)-1)
-                    else:
-                        set_previous(selected_song_ix, playing_song_ix-1)
-                else:
-                    while True:
-                        previous_song_ix = random.randrange(len(self.playing_list))
-                        if previous_song_ix == playing_song_ix:
-                            pass
-                        else:
-                            break
-                    set_previous(selected_song_ix, previous_song_ix)
-                self.playing = False
-                if len(listbox_selection) > 0:
-                    # if the next song is not in sight scroll listbox so
-                    # the user can see it.
-                    index = self.playing_listbox.curselection()[0]
-                    self.playing_listbox.see(index)
-                self.timeline_changed = True
-                self.play_or_pause()
+            self.stop_import()
+            self.finish_import()
+        else:
+            self.master.after(100, self.check_import)
 
-    def set_volume(self, val):
+    def stop_import(self):
         """
-        Set the volume of music according to the value of
-        volume scale widget.
+        Stop reading the imported files, drop the files that have not
+        been read yet and hide the progress bar.
         """
-        volume = float(val) / 100
-        mixer.music.set_volume(volume)
-        if volume == 0:
-            self.volume_button.config(image=self.muted_photoimage)
-        elif 0.5 > volume > 0:
-            self.volume_button.config(image=self.volume_low_photoimage)
-        else:
-            self.volume_button.config(image=self.volume_high_photoimage)
+        if self.import_executor is not None:
+            self.import_executor.shutdown(wait=False, cancel_futures=True)
+            self.import_executor = None
+        self.import_scans.clear()
+        self.import_library_stats = None
+        self.import_seen = None
+        self.import_results = queue.Queue()
+        self.import_frame.pack_forget()
 
-    def mute_music(self):
-        """Mute or unmute music according to the current state."""
-        if not self.muted:
-            self.last_volume = int(self.volume_scale.get())
-            mixer.music.set_volume(0)
-            self.volume_button.config(image=self.muted_photoimage)
-            self.volume_scale.set(0)
-            self.muted = True
-        else:
-            decimal_volume = float(self.last_volume) / 100
-            mixer.music.set_volume(decimal_volume)
-            self.volume_button.config(image=self.volume_high_photoimage)
-            self.volume_scale.set(self.last_volume)
-            self.muted = False
+    def finish_import(self):
+        """
+        Find the duplicates of the songs that have been imported while
+        duplicates were skipped, now that all of them have been read.
+        """
+        self.import_seen = None
+        if len(self.duplicates_imported) != 0:
+            self.start_duplicates_scan()
 
-    def create_table(self):
+    def find_duplicates(self):
+        """Find the duplicate songs inside the library and show them."""
+        self.start_duplicates_scan(show=True)
+
+    def start_duplicates_scan(self, show=False):
         """
-        Create table 'playlists' inside the database file
-        'playlists.db', if it does not exist.
+        Hash the audio of the songs inside the library that may be
+        duplicates on a worker thread, which uses a pool of worker
+        processes; the duplicates are shown if 'show' parameter is
+        True. Songs that have been hashed before are not read again.
         """
-        def check_table_existence():
-            # Check if table 'playlists' exists.
-            self.c.execute(
-                """SELECT count(name) FROM sqlite_master
-                   WHERE type=:type AND name=:name""",
-                {'type': 'table', 'name': 'playlists'},
-            )
-            if self.c.fetchone()[0] == 1:
-                return True
-            else:
-                return False
+        self.duplicates_show = self.duplicates_show or show
+        if self.duplicates_thread is not None:
+            # The library is hashed again after the running scan, since
+            # it may have been changed after the scan started.
+            self.duplicates_again = True
+            return
+        entries = self.engine.get_payload_hashes()
 
-        table_exists = check_table_existence()
-        if table_exists:
-            pass
-        else:
-            with self.conn:
-                self.c.execute(
-                    """CREATE TABLE playlists (
-                            name text,
-                            files text)"""
-                )
-            print('DATABASE: TABLE "{}" CREATED.')
+        def scan():
+            from concurrent.futures import ProcessPoolExecutor
 
-    def check_playlist_existence(self, name):
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=os.cpu_count()
+                ) as executor:
+                    result = hash_duplicate_candidates(entries, executor)
+            except Exception as e:
+                result = e
+            self.duplicates_results.put(result)
+
+        self.duplicates_thread = threading.Thread(target=scan, daemon=True)
+        self.duplicates_thread.start()
+        self.master.after(200, self.check_duplicates)
+
+    def check_duplicates(self):
         """
-        Check if the playlist with name 'name' parameter exists inside
-        the database.
+        Store the hashes that the duplicates scan has found, remove the
+        duplicates of skipped imports and show the duplicates if they
+        were asked for; or check again later if the scan is not
+        finished.
         """
-        self.c.execute(
-            'SELECT count(name) FROM playlists WHERE name=:name',
-            {'name': name}
-        )
-        if self.c.fetchone()[0] == 1:
-            return True
-        else:
-            return False
+        try:
+            result = self.duplicates_results.get_nowait()
+        except queue.Empty:
+            self.master.after(200, self.check_duplicates)
+            return
+        self.duplicates_thread = None
+        if isinstance(result, Exception):
+            print('LIBRARY: could not find duplicates ({}).'.format(result))
+        elif len(result) != 0:
+            self.engine.store_payload_hashes(result)
+        if self.duplicates_again:
+            self.duplicates_again = False
+            self.start_duplicates_scan()
+            return
+        groups = self.engine.get_duplicate_groups()
+        if len(self.duplicates_imported) != 0:
+            self.remove_duplicates(groups, self.duplicates_imported)
+            self.duplicates_imported = set()
+        if self.duplicates_show:
+            self.duplicates_show = False
+            self.show_duplicates(groups)
 
-    def insert_playlist(self, name, files_list):
+    def remove_duplicates(self, groups, files=None):
         """
-        Insert a playlist with values 'name' and 'files_list'
-        parameters into the database, if it does not exist.
+        Remove the songs of playing list that have the same audio as an
+        earlier song of it, according to duplicate groups 'groups'; if
+        'files' is not None, only its songs are removed. The playing
+        song is never removed.
         """
-        playlist_exists = self.check_playlist_existence(name)
-        if playlist_exists:
-            pass
-        else:
-            files = json.dumps(files_list)
-            with self.conn:
-                self.c.execute(
-                    'INSERT INTO playlists VALUES (:name, :files)',
-                    {'name': name, 'files': files},
-                )
-            print('DATABASE: playlist "{}" INSERTED.'.format(name))
+        groups_ixs = {
+            path: group_ix
+            for group_ix, paths in enumerate(groups)
+            for path in paths
+        }
+        seen_groups = set()
+        duplicates = []
+        for ix, track in enumerate(self.playing_list):
+            group_ix = groups_ixs.get(track)
+            if group_ix is None:
+                continue
+            if (
+                group_ix in seen_groups
+                and (files is None or track in files)
+                and ix != self.playing_list.current
+            ):
+                duplicates.append(ix)
+            else:
+                seen_groups.add(group_ix)
+        self.playing_list.remove_many(duplicates)
+        if len(duplicates) != 0:
+            self.refresh_playing_list()
+            self.engine.queue_next_track()
+        print('LIBRARY: {} duplicates REMOVED from playing list.'.format(
+                len(duplicates)))
 
-    def update_playlist(self, name, files_list):
+    def show_duplicates(self, groups):
         """
-        Update the playlist with name 'name' parameter and set files
-        'files_list' to it inside database. This function is called
-        when user wants to add a song to a playlist.
+        Show the groups of duplicate songs 'groups' inside a top level
+        window, from which they can be removed from playing list.
         """
-        files_str = json.dumps(files_list)
-        with self.conn:
-            self.c.execute(
-                'UPDATE playlists SET files=:files WHERE name=:name',
-                {'name': name, 'files': files_str},
+        if len(groups) == 0:
+            messagebox.showinfo(
+                'No duplicates',
+                self.no_duplicates,
             )
-            print('DATABASE: playlist "{}" UPDATED.'.format(name))
+            return
+        new_window = Toplevel(self.master)
+        new_window.title('Duplicates')
+        new_window.iconbitmap('ico/junkie-audio-player-icon.ico')
+        new_window.focus_force()
+        ttk.Style().configure(
+            'Playlists.TLabel', foreground='black',
+            font=('Nirmala UI', 14), background=self.default_bg,
+        )
+        ttk.Label(
+            new_window,
+            text='{} songs have duplicates'.format(len(groups)),
+            style='Playlists.TLabel',
+        ).pack(pady=10)
+        duplicates_listbox = Listbox(
+            new_window, selectforeground='white',
+            activestyle='dotbox', selectbackground='grey',
+            selectmode='single', width=80,
+            foreground='black', height=15,
+        )
+        duplicates_listbox.pack(padx=15)
+        for paths in groups:
+            duplicates_listbox.insert('end', ' {} copies of "{}":'.format(
+                    len(paths), os.path.basename(paths[0])))
+            for path in paths:
+                duplicates_listbox.insert('end', '     ' + path)
+        ttk.Button(
+            new_window,
+            text='Remove duplicates from playing list',
+            command=partial(self.remove_duplicates, groups),
+        ).pack(pady=10)
 
-    def get_playlist(self, name):
+    def rescan_library(self, *args):
         """
-        Get files list of the playlist with name 'name' parameter from
-        database and return it, if it exists; Otherwise return None.
+        Rescan all files inside the library on a worker thread; the
+        changed files are read again by self.check_rescan() and the
+        files that no longer exist are deleted.
         """
-        self.c.execute(
-            'SELECT files FROM playlists WHERE name=:name',
-            {'name': name}
-        )
-        files_str = self.c.fetchone()[0]
-        if files_str == '[]':
-            return []
-        else:
-            files_list = [
-                i.replace('"', '')
-                for i in files_str.strip('][').split(', ')
-            ]
-            return files_list
+        if self.rescan_thread is not None:
+            return
+        stored = self.engine.get_library_stats()
 
-    def load_playlist(self, name, files_list):
+        def scan():
+            self.rescan_results.put(check_library_files(stored))
+
+        self.rescan_thread = threading.Thread(target=scan, daemon=True)
+        self.rescan_thread.start()
+        self.master.after(200, self.check_rescan)
+
+    def check_rescan(self):
         """
-        Load playlist with name 'name' parameter and files
-        'files_list' parameter.
+        Delete the files that the rescan has found missing and read the
+        changed files again inside the pool of the import workers, with
+        the progress shown; or check again later if the rescan is not
+        finished.
         """
-        self.clear_playing_list()
-        for file in files_list:
-            self.add_to_playing_list(file)
-        self.playing_list_name['text'] = name
-        if mixer.music.get_busy():
-            self.timeline_changed = True
-        self.stop_music()
-        self.total_length_label['text'] = '__:__'
-        self.current_time_label['text'] = '__:__'
-        self.playing_listbox.selection_set(0)
-        self.playing_song_ix = 0
-        self.playing_song = ''
-        self.playing = False
-        self.play_or_pause()
+        try:
+            changed_files, missing_files = self.rescan_results.get_nowait()
+        except queue.Empty:
+            self.master.after(200, self.check_rescan)
+            return
+        self.rescan_thread = None
+        self.engine.remove_library_files(missing_files)
+        self.read_files(changed_files)
+        self.refresh_playing_list()
+
+    def start_watcher(self):
+        """
+        Start watching the library folders (again, if they are being
+        watched), if there are any.
+        """
+        self.stop_watcher()
+        roots = self.engine.get_library_roots()
+        if len(roots) == 0:
+            return
+        self.watcher = FolderWatcher(roots, self.engine.get_library_stats())
+        self.watcher.start()
+        self.watcher_job = self.master.after(1000, self.check_watcher)
+
+    def stop_watcher(self):
+        """Stop watching the library folders."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if self.watcher_job is not None:
+            self.master.after_cancel(self.watcher_job)
+            self.watcher_job = None
+
+    def check_watcher(self):
+        """
+        Apply the changes that the watcher has found inside the library
+        folders since the last check to the library, the playlists and
+        the playing list, and check again a second later. Only the
+        songs that have been created or changed are read.
+        """
+        created, deleted, moved = self.watcher.get_changes()
+        self.engine.move_library_files(moved)
+        self.engine.remove_library_files(deleted)
+        self.engine.mark_found_files(created)
+        self.read_files(created)
+        if created or deleted or moved:
+            self.refresh_playing_list()
+        self.watcher_job = self.master.after(1000, self.check_watcher)
 
     def open_directory(self):
         """Open location of the selected song in Windows Explorer."""
@@ -1192,20 +5773,15 @@ class MusicPlayer:
         if len(selection) == 0:
             pass
         else:
-            selection_index = selection[0]
             self.playing_listbox.select_clear(selection[0], 'end')
-            if (
-                event.keysym == 'Down'
-                and selection_index < len(self.playing_list)-1
-            ):
-                self.playing_listbox.selection_set(selection_index+1)
-            elif (
-                event.keysym == 'Up'
-                and selection_index != 0
-            ):
-                self.playing_listbox.selection_set(selection_index-1)
-            else:
-                self.playing_listbox.selection_set(selection_index)
+            # Step to the next or previous shown song, since the search
+            # text may hide the songs between them.
+            if event.keysym == 'Down':
+                selection_index = self.playing_listbox.step(selection[0], 1)
+            elif event.keysym == 'Up':
+                selection_index = self.playing_listbox.step(selection[0], -1)
+            self.playing_listbox.selection_set(selection_index)
+            self.playing_listbox.see(selection_index)
 
     def show_playlists(self, *args):
         """Show saved playlists inside a top level window."""
@@ -1214,7 +5790,7 @@ class MusicPlayer:
             if len(playlists_listbox.curselection()) != 0:
                 selected_listname_ix = playlists_listbox.curselection()[0]
                 selected_listname = listnames[selected_listname_ix]
-                files_list = self.get_playlist(selected_listname)
+                files_list = self.engine.get_playlist(selected_listname)
                 new_window.grab_release()
                 new_window.destroy()
                 self.load_playlist(selected_listname, files_list)
@@ -1227,17 +5803,8 @@ class MusicPlayer:
             """Delete the chosen playlist"""
             if len(playlists_listbox.curselection()) != 0:
                 selected_listname_ix = playlists_listbox.curselection()[0]
-                selected_listname = listnames[selected_listname_ix]
-                self.c.execute(
-                    'SELECT * FROM playlists WHERE name=:name',
-                    {'name': selected_listname},
-                )
-                playlist = self.c.fetchone()
-                with self.conn:
-                    self.c.execute(
-                        'DELETE from playlists WHERE name=? AND files=?',
-                        playlist
-                    )
+                selected_listname = listnames.pop(selected_listname_ix)
+                self.engine.delete_playlist(selected_listname)
                 playlists_listbox.delete(selected_listname_ix)
             else:
                 messagebox.showerror(
@@ -1249,9 +5816,7 @@ class MusicPlayer:
             if len(playlists_listbox.curselection()) != 0:
                 selected_listname_ix = playlists_listbox.curselection()[0]
                 selected_listname = listnames[selected_listname_ix]
-                files_list = self.get_playlist(selected_listname)
-                files_list.append(selected_file)
-                self.update_playlist(selected_listname, files_list)
+                self.engine.append_to_playlist(selected_listname, selected_file)
                 print('track "{}" added to playlist.'.format(selected_listname))
                 new_window.grab_release()
                 new_window.destroy()
@@ -1300,30 +5865,94 @@ class MusicPlayer:
                 command=load_list
             ).grid(row=0, column=1)
             playlists_listbox.bind('<Double-1>', load_list)
-        self.c.execute('SELECT name FROM playlists')
-        fetched_data = self.c.fetchall()
-        listnames = [i[0] for i in fetched_data]
+        listnames = self.engine.get_playlist_names()
+        # Playlists with songs that have been deleted from the library
+        # folders show how many of them are missing.
+        missing_counts = self.engine.get_missing_counts()
         for listname in listnames:
             if listnames.index(listname) == 0:
                 list_ix = 0
-            playlists_listbox.insert(list_ix, ' ' + listname)
+            if listname in missing_counts:
+                playlists_listbox.insert(list_ix, ' {} ({} missing)'.format(
+                        listname, missing_counts[listname]))
+            else:
+                playlists_listbox.insert(list_ix, ' ' + listname)
             list_ix += 1
 
+    def show_library_folders(self):
+        """
+        Show the library folders inside a top level window, where
+        folders can be added to or removed from them.
+        """
+        def add_folder():
+            """Add a folder to the library folders and watch it."""
+            dir_path = filedialog.askdirectory(parent=new_window)
+            if dir_path != '':
+                self.engine.add_library_root(dir_path)
+                show_folders()
+                self.start_watcher()
+
+        def remove_folder():
+            """Remove the chosen folder from the library folders."""
+            if len(folders_listbox.curselection()) != 0:
+                dir_path = roots[folders_listbox.curselection()[0]]
+                self.engine.remove_library_root(dir_path)
+                show_folders()
+                self.start_watcher()
+            else:
+                messagebox.showerror(
+                    'No folder selected',
+                    self.no_folder_selected,
+                    parent=new_window,
+                )
+
+        def show_folders():
+            """Show the library folders inside the listbox."""
+            roots[:] = self.engine.get_library_roots()
+            folders_listbox.delete(0, 'end')
+            for dir_path in roots:
+                folders_listbox.insert('end', ' ' + dir_path)
+
+        new_window = Toplevel(self.master)
+        new_window.title('Library folders')
+        new_window.iconbitmap('ico/junkie-audio-player-icon.ico')
+        new_window.focus_force()
+        new_window.grab_set()
+        ttk.Style().configure(
+            'Playlists.TLabel', foreground='black',
+            font=('Nirmala UI', 14), background=self.default_bg,
+        )
+        ttk.Label(
+            new_window, text='Library folders', style='Playlists.TLabel'
+        ).pack(pady=10)
+        folders_listbox = Listbox(
+            new_window, selectforeground='white',
+            activestyle='dotbox', selectbackground='grey',
+            selectmode='single', width=50,
+            foreground='black', height=10,
+        )
+        folders_listbox.pack(padx=15)
+        buttons_frame = Frame(new_window)
+        buttons_frame.pack(pady=10)
+        ttk.Button(
+            buttons_frame,
+            text='Remove folder',
+            command=remove_folder
+        ).grid(row=0, column=0)
+        ttk.Button(
+            buttons_frame,
+            text='Add folder',
+            command=add_folder
+        ).grid(row=0, column=1)
+        roots = []
+        show_folders()
+
     def save_playlist(self, *args):
         """Save the playing list inside the database."""
         def insert_list():
             """Insert the playing list into the database."""
             self.playing_list_name['text'] = name
-            self.insert_playlist(name, self.playing_list)
-            with self.conn:
-                # Delete playlists which are the same, except one from
-                # the database.
-                self.c.execute(
-                    """DELETE FROM playlists
-                            WHERE ROWID NOT IN (SELECT MIN(ROWID)
-                                                FROM playlists
-                                                GROUP BY name)"""
-                )
+            self.engine.insert_playlist(name, self.playing_list)
         def get_name():
             """
             Create a top level window and an entry widget inside it,
@@ -1362,8 +5991,6 @@ class MusicPlayer:
             ).grid(column=0, row=2, pady=10)
             entry.bind('<Return>', set_name)
 
-        self.create_table()
-
         if len(self.playing_list) != 0:
             get_name()
         else:
@@ -1387,86 +6014,46 @@ class MusicPlayer:
 
     def show_lyrics(self):
         """
-        Get the lyrics for the playing song from Genius API and
-        display them in a top level window.
+        Show the lyrics for the playing song in a top level window,
+        from the database if they have been searched before; otherwise
+        ask for a client access token of Genius API (once) and search
+        them on a worker thread.
         """
-        def get_lyrics():
-            try:
-                if (
-                    'Artist' in self.file_tags_dict
-                    and 'Title' in self.file_tags_dict
-                ):
-                    # Get lyrics from Genius API using client access token
-                    # and display them in a top level window.
-                    new_window = Toplevel(self.master)
-                    new_window.title('Genius lyrics')
-                    new_window.iconbitmap('ico/junkie-audio-player-icon.ico')
-
-                    genius = lg.Genius(
-                        self.token,
-                        skip_non_songs=True,
-                        excluded_terms=['(Remix)', '(Live)'],
-                        remove_section_headers=True,
-                    )
-                    file_artist = self.file_tags_dict['Artist']
-                    file_title = self.file_tags_dict['Title']
-                    song = genius.search_song(file_title, file_artist)
-                    song_lyrics = song.lyrics
-                    Label(
-                        self.new_window,
-                        text='Lyrics for "{}" by {}'.format(file_title,
-                                                            file_artist),
-                        font=('Nirmala UI', 15),
-                        background=self.default_bg,
-                        foreground='#222',
-                    ).pack(padx=10, pady=5)
-                    text_area = scrolledtext.ScrolledText(
-                        self.new_window, width=50,
-                        font=('Nirmala UI', 12), height=30
-                    )
-                    text_area.pack(pady=10, padx=10)
-                    text_area.insert(INSERT, song_lyrics)
-                    text_area.configure(state='disabled')
-                else:
-                    messagebox.showerror(
-                        'File info not found',
-                        self.file_info_not_found,
-                    )
-            except (
-                AttributeError,
-                TypeError,
-                requests.exceptions.ConnectionError,
-            ) as e:
-                new_window.destroy()
-                if type(e) == TypeError:
-                    messagebox.showwarning(
-                        'API access error',
-                        self.api_access_error,
-                    )
-                elif type(e) == requests.exceptions.ConnectionError:
-                    messagebox.showwarning(
-                        'Conneciton error',
-                        self.connection_error,
-                    )
-                else:
-                    messagebox.showwarning(
-                        'Lyrics not found',
-                        self.lyrics_not_found,
-                    )
-
         def set_token(var):
-            """Set the client access token and call get_lyrics()."""
+            """Set the client access token and search the lyrics."""
             if text.get() == '':
                 pass
             else:
                 self.token = text.get()
-                get_lyrics()
                 new_window.destroy()
+                self.search_lyrics(file_artist, file_title)
 
-        if (
+        if not (
             'Artist' in self.file_tags_dict
             and 'Title' in self.file_tags_dict
         ):
+            messagebox.showerror(
+                'File info not found',
+                self.file_info_not_found,
+            )
+            return
+        file_artist = self.file_tags_dict['Artist']
+        file_title = self.file_tags_dict['Title']
+        cached_lyrics = self.engine.get_cached_lyrics(file_artist, file_title)
+        if cached_lyrics is not None:
+            lyrics, = cached_lyrics
+            if lyrics is None:
+                # Since the lyrics were not found a short time ago, we
+                # do not search them again.
+                messagebox.showwarning(
+                    'Lyrics not found',
+                    self.lyrics_not_found,
+                )
+            else:
+                self.create_lyrics_window(file_artist, file_title, lyrics)
+        elif self.token is not None:
+            self.search_lyrics(file_artist, file_title)
+        else:
             # Create a top level window and an entry widget to
             # get a entry of access token.
             new_window = Toplevel(self.master)
@@ -1488,11 +6075,118 @@ class MusicPlayer:
             ).grid(row=2, column=0, pady=10)
             nw_frame.pack()
             entry.bind('<Return>', set_token)
-        else:
-            messagebox.showerror(
-                'File info not found',
-                self.file_info_not_found,
-            )
+
+    def create_lyrics_window(self, file_artist, file_title, lyrics):
+        """
+        Create a top level window showing lyrics 'lyrics' of the song
+        with title 'file_title' by 'file_artist', and return its text
+        area.
+        """
+        new_window = Toplevel(self.master)
+        new_window.title('Genius lyrics')
+        new_window.iconbitmap('ico/junkie-audio-player-icon.ico')
+        Label(
+            new_window,
+            text='Lyrics for "{}" by {}'.format(file_title, file_artist),
+            font=('Nirmala UI', 15),
+            background=self.default_bg,
+            foreground='#222',
+        ).pack(padx=10, pady=5)
+        text_area = scrolledtext.ScrolledText(
+            new_window, width=50,
+            font=('Nirmala UI', 12), height=30
+        )
+        text_area.pack(pady=10, padx=10)
+        text_area.insert(INSERT, lyrics)
+        text_area.configure(state='disabled')
+        return text_area
+
+    def search_lyrics(self, file_artist, file_title):
+        """
+        Show a lyrics window for the song with title 'file_title' by
+        'file_artist' and search its lyrics on a worker thread; the
+        window is filled when they are found.
+        """
+        key = (
+            normalize_lyrics_key(file_artist),
+            normalize_lyrics_key(file_title),
+        )
+        if key in self.lyrics_windows:
+            # The lyrics of this song are being searched already.
+            return
+        self.lyrics_windows[key] = self.create_lyrics_window(
+            file_artist, file_title, 'Searching lyrics ...'
+        )
+
+        def search():
+            try:
+                result = fetch_lyrics(
+                    self.token, file_artist, file_title, self.genius_root
+                )
+            except Exception as e:
+                result = e
+            self.lyrics_results.put((key, result))
+
+        threading.Thread(target=search, daemon=True).start()
+        if len(self.lyrics_windows) == 1:
+            self.master.after(100, self.check_lyrics)
+
+    def check_lyrics(self):
+        """
+        Store and show the lyrics that have been found by the workers
+        since the last check; check again later if any search is not
+        finished.
+        """
+        import requests
+
+        while True:
+            try:
+                key, result = self.lyrics_results.get_nowait()
+            except queue.Empty:
+                break
+            text_area = self.lyrics_windows.pop(key)
+            window_exists = text_area.winfo_exists()
+            if isinstance(result, Exception):
+                print('LYRICS: could not search lyrics ({}).'.format(result))
+                if window_exists:
+                    text_area.winfo_toplevel().destroy()
+                if isinstance(result, requests.exceptions.HTTPError):
+                    if result.response is not None and \
+                            result.response.status_code in (401, 403):
+                        # Since the token was not accepted, we ask for
+                        # it again next time.
+                        self.token = None
+                    messagebox.showwarning(
+                        'API access error',
+                        self.api_access_error,
+                    )
+                elif isinstance(result, requests.exceptions.RequestException):
+                    messagebox.showwarning(
+                        'Conneciton error',
+                        self.connection_error,
+                    )
+                else:
+                    self.token = None
+                    messagebox.showwarning(
+                        'API access error',
+                        self.api_access_error,
+                    )
+                continue
+            self.engine.store_lyrics(key, result)
+            if result is None:
+                if window_exists:
+                    text_area.winfo_toplevel().destroy()
+                messagebox.showwarning(
+                    'Lyrics not found',
+                    self.lyrics_not_found,
+                )
+            elif window_exists:
+                text_area.configure(state='normal')
+                text_area.delete('1.0', END)
+                text_area.insert(INSERT, result)
+                text_area.configure(state='disabled')
+        if len(self.lyrics_windows) != 0:
+            self.master.after(100, self.check_lyrics)
 
     def video_search(self):
         """Search Youtube API for the playing song in the browser."""
@@ -1591,42 +6285,181 @@ class MusicPlayer:
 
         new_window.protocol('WM_DELETE_WINDOW', on_closing)
 
-    def stop_music(self):
-        """Stop music, if something is playing."""
-        mixer.music.stop()
-        self.timeline_changed = True
-
     def closing(self, *args):
         """
-        Delete cache files that were created while using the app.
-        This function is called on closing the root window.
+        Stop the imports and the music, close the database and destroy
+        the root window. This function is called on closing the root
+        window.
         """
-        to_delete_files = [
-            'png/artwork.png',
-            'png/artwork-blur.png',
-            'png/default-music-artwork-324-blur.png',
-        ]
-        for i in to_delete_files:
-            try:
-                os.remove(i)
-            except FileNotFoundError:
-                continue
-        self.conn.close()
-        root.destroy()
+        self.stop_import()
+        self.stop_watcher()
+        if self.loudness_stopped is not None:
+            self.loudness_stopped.set()
+        # A profile that has not been stopped is printed.
+        TRACER.stop_profile()
+        self.engine.close()
+        self.master.destroy()
+
+
+def create_root():
+    """
+    Create the root window with the theme and settings of the app and
+    return it.
+    """
+    from ttkthemes import themed_tk as thk
+
+    root = thk.ThemedTk()
+    root.get_themes()
+    root.set_theme('adapta')
+    root.title('Junkie Audio Player')
+    root.iconbitmap('ico/junkie-audio-player-icon.ico')
+    root.geometry('850x636')
+    root.resizable(True, False)
+    root.update()
+    root.minsize(root.winfo_width(), root.winfo_height())
+    return root
+
+
+def play_headless(path, shuffle=False, repeat=False, gapless=False,
+                  normalize=False):
+    """
+    Play the songs of the folder or playlist file with path 'path'
+    without a window and print every song that starts, until the last
+    song ends (never, if repeat or shuffle is on) or Ctrl+C is pressed.
+    """
+    engine = PlayerEngine(shuffle_seed=os.environ.get('JUNKIE_SHUFFLE_SEED'))
+    engine.set_normalize(normalize)
+    if os.path.isdir(path):
+        files_list = list(scan_directory(path))
+    else:
+        files_list = list(engine.scan_playlist_file(path))
+    if len(files_list) == 0:
+        engine.close()
+        raise SystemExit('Junkie player could not find any songs in "{}".'
+                         .format(path))
+    engine.playing_list.extend(files_list)
 
+    def show_track(track_ix):
+        """Print the song that has started and queue the next one."""
+        length = engine.get_track_length()
+        if length is None:
+            length_text = '__:__'
+        else:
+            length_text = '{:02d}:{:02d}'.format(*divmod(int(length), 60))
+        print('PLAYING: [{}/{}] {} ({})'.format(
+            track_ix + 1, len(engine.playing_list),
+            engine.playing_list[track_ix], length_text,
+        ), flush=True)
+        engine.queue_next_track()
+
+    ended = []
+    engine.subscribe('track_started', show_track)
+    engine.subscribe('list_ended', partial(ended.append, True))
+    engine.set_repeat(repeat)
+    engine.set_shuffle(shuffle)
+    engine.set_gapless(gapless)
+    if shuffle:
+        engine.play_track(engine.playing_list.shuffle_next_index())
+    else:
+        engine.play_track(0)
+    try:
+        while not ended:
+            engine.poll()
+            time.sleep(engine.get_poll_delay() / 1000)
+    except KeyboardInterrupt:
+        engine.stop()
+    engine.close()
+
+
+def analyze_library():
+    """
+    Analyze the loudness of the songs inside the library that have not
+    been analyzed without a window, storing the results every few
+    seconds, until all of them are done or Ctrl+C is pressed.
+    """
+    engine = PlayerEngine()
+    files_list = engine.get_unanalyzed_files()
+    print('LIBRARY: analyzing loudness of {} songs.'.format(len(files_list)),
+          flush=True)
+    results = queue.Queue()
+    stopped = threading.Event()
+    threading.Thread(
+        target=run_loudness_analysis,
+        args=(files_list, results, stopped),
+        daemon=True,
+    ).start()
+    start = time.perf_counter()
+    analyzed = 0
+    finished = False
+    while not finished:
+        try:
+            time.sleep(5)
+        except KeyboardInterrupt:
+            stopped.set()
+        batch = {}
+        while True:
+            try:
+                item = results.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+                break
+            batch[item[0]] = item[1]
+        if len(batch) != 0:
+            engine.store_loudness(batch)
+            analyzed += len(batch)
+            print('LIBRARY: {} of {} songs analyzed in {:.0f} s.'.format(
+                    analyzed, len(files_list), time.perf_counter() - start),
+                  flush=True)
+    engine.close()
 
-# Initialize and set the settings of the Tk interface
-root = thk.ThemedTk()
-root.get_themes()
-root.set_theme('adapta')
-root.title('Junkie Audio Player')
-root.iconbitmap('ico/junkie-audio-player-icon.ico')
-root.geometry('850x590')
-root.resizable(True, False)
-root.update()
-root.minsize(root.winfo_width(), root.winfo_height())
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Junkie Audio Player')
+    parser.add_argument(
+        '--headless', metavar='PATH',
+        help='play a folder or a playlist file without a window',
+    )
+    parser.add_argument('--shuffle', action='store_true')
+    parser.add_argument('--repeat', action='store_true')
+    parser.add_argument('--gapless', action='store_true')
+    parser.add_argument(
+        '--normalize', action='store_true',
+        help='normalize the loudness of songs that have been analyzed',
+    )
+    parser.add_argument(
+        '--analyze-loudness', action='store_true',
+        help='analyze the loudness of the library without a window',
+    )
+    parser.add_argument(
+        '--trace', metavar='FILE',
+        help='trace timings and write them as a Chrome trace on exit',
+    )
+    parser.add_argument(
+        '--timings', metavar='FILE',
+        help='trace timings and write their histograms as JSON on exit',
+    )
+    args = parser.parse_args()
+    if args.trace is not None or args.timings is not None:
+        TRACER.enable()
+
     mixer.init()  # Initialize pygame.mixer module for audio playback.
-    music_player = MusicPlayer(root)
-    root.mainloop()
+    if args.analyze_loudness:
+        analyze_library()
+    elif args.headless is not None:
+        play_headless(args.headless, args.shuffle, args.repeat, args.gapless,
+                      args.normalize)
+    else:
+        # Initialize and set the settings of the Tk interface (Worker
+        # processes of folder imports import this file too, so this
+        # must only run in the main process).
+        root = create_root()
+        music_player = MusicPlayer(root)
+        root.mainloop()
+    if args.trace is not None:
+        TRACER.export_chrome_trace(args.trace)
+    if args.timings is not None:
+        TRACER.export_json(args.timings)
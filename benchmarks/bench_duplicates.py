@@ -0,0 +1,121 @@
+"""
+Benchmark of finding duplicate songs.
+
+Write MP3 files whose audio frames differ from each other (and a share
+of copies of them with other tags and names) and time finding their
+duplicates through hash_duplicate_candidates() with a pool of worker
+processes: first with an empty library, then again with the hashes
+stored. Report how many songs had to be read fully and the time per
+100k songs.
+
+Usage: python benchmarks/bench_duplicates.py [--songs N] [--copies RATIO]
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random
+import shutil
+import time
+
+from common import REPO_DIR, load_app, make_work_dir
+from library import MP3_FRAME, id3_tag
+
+
+def make_songs(dir_path, count, copies_ratio, seed=0):
+    """
+    Write 'count' MP3 files of 100 to 400 frames inside 'dir_path'
+    and a copy with other tags of 'copies_ratio' of them; return the
+    paths of all files and the number of copies.
+    """
+    rng = random.Random(seed)
+    paths = []
+    copies = 0
+    for ix in range(count):
+        album_dir = os.path.join(dir_path, 'album-{:04d}'.format(ix // 12))
+        os.makedirs(album_dir, exist_ok=True)
+        # The bytes after the header of a frame are random, so songs
+        # of the same length have different audio.
+        frames = b''.join(
+            MP3_FRAME[:4] + rng.randbytes(len(MP3_FRAME) - 4)
+            for _ in range(4)
+        ) * (rng.randint(100, 400) // 4)
+        path = os.path.join(album_dir, 'track-{:06d}.mp3'.format(ix))
+        with open(path, 'wb') as f:
+            f.write(id3_tag({'TIT2': 'Track {}'.format(ix)}))
+            f.write(frames)
+        paths.append(path.replace('\\', '/'))
+        if rng.random() < copies_ratio:
+            copy_path = os.path.join(album_dir, 'copy-{:06d}.mp3'.format(ix))
+            with open(copy_path, 'wb') as f:
+                f.write(id3_tag({
+                    'TIT2': 'Track {} (copy)'.format(ix), 'TPE1': 'Someone',
+                }))
+                f.write(frames)
+                f.write(b'TAG' + b'\0' * 125)
+            paths.append(copy_path.replace('\\', '/'))
+            copies += 1
+    return paths, copies
+
+
+def scan(app, engine):
+    """
+    Hash the library for duplicates, store the hashes and return the
+    time in seconds and the hashes that were found.
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        found = app.hash_duplicate_candidates(
+            engine.get_payload_hashes(), executor
+        )
+    if len(found) != 0:
+        engine.store_payload_hashes(found)
+    return time.perf_counter() - start, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--songs', type=int, default=20000)
+    parser.add_argument('--copies', type=float, default=0.1)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    os.chdir(work_dir)
+    paths, copies = make_songs(
+        os.path.join(work_dir, 'music'), args.songs, args.copies
+    )
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    print('Library:  {} songs ({} copies), {:.1f} MB'.format(
+        len(paths), copies, total_bytes / 1e6))
+
+    app = load_app()
+    engine = app.PlayerEngine()
+    columns = engine.library_columns()
+    entries = []
+    for path in paths:
+        entry = dict.fromkeys(columns)
+        file_stat = os.stat(path)
+        entry.update(path=path, size=file_stat.st_size,
+                     mtime=file_stat.st_mtime)
+        entries.append(entry)
+    engine.store_library_entries(entries)
+
+    elapsed, found = scan(app, engine)
+    hashed = sum(1 for _, payload_hash in found.values() if payload_hash)
+    groups = engine.get_duplicate_groups()
+    print('Cold:     {:8.2f} s  ({:.1f} s per 100k songs)'.format(
+        elapsed, elapsed / len(paths) * 100000))
+    print('Read fully: {} of {} songs; {} duplicate groups found'.format(
+        hashed, len(paths), len(groups)))
+    elapsed, found = scan(app, engine)
+    print('Warm:     {:8.2f} s  ({} new hashes)'.format(elapsed, len(found)))
+
+    engine.conn.close()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+    if len(groups) != copies:
+        print('FAIL: {} copies were written.'.format(copies))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark of importing a folder into the playing list.
+
+Create a tree of small WAV files inside a temporary directory, import it
+with MusicPlayer.import_directory() and print the time until the first
+rows are shown in the playing list, the time until all rows are shown
+and the time until all files are read into the library.
+
+Usage: python benchmarks/bench_import.py [--files N] [--skip-library]
+"""
+import argparse
+import os
+import shutil
+import time
+
+from common import REPO_DIR, load_app, make_work_dir, wav_bytes
+
+
+def make_tree(root_dir, files_count, files_per_dir=100, dirs_per_dir=10):
+    """
+    Create 'files_count' WAV files of 10 milliseconds of silence inside
+    nested directories of 'root_dir'.
+    """
+    file_bytes = wav_bytes(0.01)
+    for ix in range(files_count):
+        dir_ix = ix // files_per_dir
+        dir_path = os.path.join(
+            root_dir,
+            'artist-{:03d}'.format(dir_ix // dirs_per_dir),
+            'album-{:03d}'.format(dir_ix % dirs_per_dir),
+        )
+        if ix % files_per_dir == 0:
+            os.makedirs(dir_path, exist_ok=True)
+        file_path = os.path.join(dir_path, 'track-{:06d}.wav'.format(ix))
+        with open(file_path, 'wb') as f:
+            f.write(file_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument(
+        '--skip-library', action='store_true',
+        help='cancel reading the files after all rows are shown',
+    )
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    tree_dir = os.path.join(work_dir, 'music')
+    print('Creating {} files...'.format(args.files))
+    make_tree(tree_dir, args.files)
+
+    os.chdir(work_dir)
+    app = load_app()
+    import tkinter
+    root = tkinter.Tk()
+    app.mixer.init()
+    player = app.MusicPlayer(root)
+    root.update()
+
+    start = time.perf_counter()
+    player.import_directory(tree_dir)
+    root.update_idletasks()
+    first_row = time.perf_counter() - start
+    first_rows_count = player.playing_listbox.size()
+    while len(player.import_scans) != 0:
+        root.update()
+    all_rows = time.perf_counter() - start
+    rows_count = player.playing_listbox.size()
+    if args.skip_library:
+        player.stop_import()
+    while player.import_executor is not None:
+        root.update()
+        time.sleep(0.001)
+    library = time.perf_counter() - start
+
+    print('Time to first rows:  {:9.1f} ms ({} rows)'.format(
+            first_row * 1000, first_rows_count))
+    print('Time to all rows:    {:9.1f} ms ({} rows)'.format(
+            all_rows * 1000, rows_count))
+    if not args.skip_library:
+        print('Time to library:     {:9.1f} ms'.format(library * 1000))
+
+    player.engine.close()
+    root.destroy()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark of analyzing the loudness of songs.
+
+Write stereo WAV files of a 997 Hz tone at several levels (whose
+loudness is known: a full scale tone in both channels is 0 LKFS),
+analyze them through run_loudness_analysis() with pygame.mixer
+decoding the files, and report how many times faster than real time
+the analysis runs and how far the measured loudness is from the
+expected one. Exit with status 1 if any song is off by more than
+0.1 LU.
+
+Usage: python benchmarks/bench_loudness.py [--songs N] [--seconds S]
+"""
+import argparse
+import math
+import os
+import queue
+import shutil
+import threading
+import time
+import wave
+
+import numpy as np
+
+from common import REPO_DIR, load_app, make_work_dir
+
+
+def write_tone(path, seconds, level, rate=44100):
+    """
+    Write a stereo 16-bit WAV file of a 997 Hz tone of 'level' dBFS in
+    both channels and return its loudness in LKFS.
+    """
+    amplitude = 10 ** (level / 20)
+    t = np.arange(int(seconds * rate)) / rate
+    tone = (np.sin(2 * np.pi * 997 * t) * amplitude * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.column_stack((tone, tone)).tobytes())
+    return level
+
+
+def analyze(app, paths):
+    """
+    Analyze the loudness of 'paths' and return the time in seconds and
+    the results by path.
+    """
+    results = queue.Queue()
+    start = time.perf_counter()
+    app.run_loudness_analysis(paths, results, threading.Event())
+    elapsed = time.perf_counter() - start
+    found = {}
+    for item in iter(results.get, None):
+        found[item[0]] = item[1]
+    return elapsed, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--songs', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=180.0)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    os.chdir(work_dir)
+    expected = {}
+    for ix in range(args.songs):
+        path = os.path.join(work_dir, 'tone-{:03d}.wav'.format(ix))
+        expected[path] = write_tone(path, args.seconds, -3.0 - ix % 24 * 1.5)
+    app = load_app()
+    app.mixer.init(frequency=44100)
+
+    elapsed, found = analyze(app, list(expected))
+    audio_seconds = args.songs * args.seconds
+    print('Songs:    {} of {:.0f} s ({} workers)'.format(
+        args.songs, args.seconds, app.LOUDNESS_WORKERS))
+    print('Analysis: {:8.2f} s  ({:.0f}x real time, {:.1f} h per 100k '
+          'songs of 4 min)'.format(
+              elapsed, audio_seconds / elapsed,
+              elapsed / audio_seconds * 240 * 100000 / 3600))
+    errors = [abs(found[path][0] - loudness)
+              for path, loudness in expected.items()]
+    print('Largest error: {:.3f} LU'.format(max(errors)))
+    loudness, peak = found[min(expected, key=expected.get)]
+    gain = app.get_loudness_gain(loudness, peak)
+    print('Quietest song: {:.2f} LKFS, gain {:+.2f} dB (peak {:.1f} dBFS)'
+          .format(loudness, gain, 20 * math.log10(peak)))
+
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+    if len(found) != args.songs or max(errors) > 0.1:
+        print('FAIL: the loudness of a song is off by more than 0.1 LU.')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark of the latency of showing and hiding song tags.
+
+Show a big artwork with song tags in MusicPlayer and click the song tags
+check button repeatedly, once with the old pipeline (blurring, saving
+and reopening the artwork and loading the fonts on every click) and
+once with the in-memory pipeline of MusicPlayer.show_file_tags, and
+report the time each click takes.
+
+Usage: python benchmarks/bench_overlay.py [--clicks N]
+"""
+import argparse
+from io import BytesIO
+import hashlib
+import os
+import shutil
+import statistics
+import time
+
+from common import REPO_DIR, load_app, make_work_dir
+
+
+def old_show_file_tags(app, player):
+    """
+    Show song tags on the artwork the way MusicPlayer did before the
+    in-memory pipeline, with the files it wrote.
+    """
+    Image = app.Image
+    if player.tags_checkbutton_var.get() == 1:
+        blur_path = 'png/artwork-blur.png'
+        player.artwork_image.save('png/artwork.png')
+        img = Image.open('png/artwork.png')
+        blur_img = img.filter(app.ImageFilter.GaussianBlur(radius=4))
+        blur_img.save(blur_path)
+        blur_img = Image.open(blur_path)
+        enhancer = app.ImageEnhance.Contrast(blur_img)
+        enhancer.enhance(0.5).save(blur_path)
+        blur_img = Image.open(blur_path)
+        image_editable = app.ImageDraw.Draw(blur_img)
+        try:
+            keys_font = app.ImageFont.truetype('NIRMALA.TTF', 14)
+            values_font = app.ImageFont.truetype('NIRMALAB.TTF', 14)
+        except OSError:
+            keys_font = values_font = app.ImageFont.load_default()
+        for ix, key in enumerate(player.file_tags_dict):
+            image_editable.text(
+                xy=(15, 15+(20*ix)), text=key,
+                fill=(255, 255, 255), font=keys_font,
+            )
+            image_editable.text(
+                xy=(108, 15+(20*ix)), text=player.file_tags_dict[key],
+                fill=(255, 255, 255), font=values_font,
+            )
+        blur_img.save(blur_path)
+        player.tags_photoimage = app.PhotoImage(file=blur_path)
+        player.artwork_label.configure(image=player.tags_photoimage)
+    else:
+        player.artwork_photoimage = app.PhotoImage(file='png/artwork.png')
+        player.artwork_label.configure(image=player.artwork_photoimage)
+
+
+def time_clicks(root, player, clicks, show_file_tags):
+    """
+    Click the song tags check button 'clicks' times, calling
+    'show_file_tags' on each click, and return the time of each click
+    in milliseconds.
+    """
+    latencies = []
+    for _ in range(clicks):
+        start = time.perf_counter()
+        player.tags_checkbutton_var.set(1 - player.tags_checkbutton_var.get())
+        show_file_tags()
+        root.update_idletasks()
+        latencies.append((time.perf_counter() - start) * 1000)
+    player.tags_checkbutton_var.set(0)
+    show_file_tags()
+    return latencies
+
+
+def report(name, latencies):
+    """Print the first, median, 95th percentile and maximum latency."""
+    first = latencies[0]
+    latencies = sorted(latencies[1:])
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print('{:10} first {:8.2f} ms  median {:8.2f} ms  95th {:8.2f} ms  '
+          'max {:8.2f} ms'.format(
+              name, first, statistics.median(latencies), p95, latencies[-1]
+          ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clicks', type=int, default=50)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    os.chdir(work_dir)
+    app = load_app()
+    import tkinter
+    root = tkinter.Tk()
+    app.mixer.init()
+    player = app.MusicPlayer(root)
+    root.update()
+
+    # A big JPEG artwork, like the ones embedded by music stores.
+    artwork_stream = BytesIO()
+    app.Image.radial_gradient('L').resize((1400, 1400)).convert('RGB').save(
+        artwork_stream, 'JPEG', quality=90
+    )
+    artwork = artwork_stream.getvalue()
+    artwork_key = hashlib.sha1(artwork).hexdigest()
+    player.set_artwork(
+        artwork_key, *player.load_artwork(artwork_key, artwork)
+    )
+    player.file_tags_dict = {
+        name: 'Value of {}'.format(name.lower())
+        for name in player.tags_names_list
+    }
+
+    report('Old', time_clicks(
+        root, player, args.clicks, lambda: old_show_file_tags(app, player)
+    ))
+    report('In-memory', time_clicks(
+        root, player, args.clicks, player.show_file_tags
+    ))
+
+    player.engine.close()
+    root.destroy()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark of searching the playing list.
+
+Fill the library of a new database with entries of synthetic songs,
+put all of them in the playing list and time
+PlayerEngine.search_playing_list() for queries of several lengths, as
+they are typed in the search box. Also time storing a batch of
+entries, which updates the full-text index through its triggers. Exit
+with status 1 if the 95th percentile of the searches is over the
+budget.
+
+Usage: python benchmarks/bench_search.py [--tracks N] [--budget MS]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import time
+
+from common import REPO_DIR, load_app, make_work_dir
+
+WORDS = (
+    'love night day heart fire rain blue dream gold city road home light '
+    'dark sky sun moon star time life river ocean summer winter song '
+    'wild young lost free never forever kiss dance angel ghost shadow '
+    'glass stone paper silver echo storm thunder wave garden window'
+).split()
+
+FIRST_NAMES = (
+    'john paul anna maria david sarah james emma lucas olivia noah mia '
+    'liam sofia ethan chloe oscar nina hugo lena'
+).split()
+
+LAST_NAMES = (
+    'smith jones brown taylor wilson davies evans thomas johnson roberts '
+    'walker wright robinson thompson white hughes edwards green hall wood'
+).split()
+
+QUERIES = [
+    'lo', 'love', 'love ni', 'love night', 'john', 'john smi',
+    'ghost sto', 'rock', '07 love', 'mozart', 'blue moon sum',
+]
+
+
+def make_entries(engine, count, seed=0):
+    """Return 'count' library entries of synthetic songs."""
+    rng = random.Random(seed)
+    genres = ['Rock', 'Jazz', 'Pop', 'Classical', 'Electronic', 'Folk']
+    entries = []
+    for ix in range(count):
+        if ix % 12 == 0:
+            # A new album of 12 songs, and of a new artist every 10
+            # albums.
+            if ix % 120 == 0:
+                artist = '{} {}'.format(
+                    rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                ).title()
+            album = ' '.join(rng.sample(WORDS, 2)).title()
+            genre = rng.choice(genres)
+        title = ' '.join(rng.sample(WORDS, rng.randint(1, 3))).title()
+        entry = dict.fromkeys(engine.library_columns())
+        entry.update(
+            path='/music/{}/{}/{:02d} - {}.mp3'.format(
+                artist, album, ix % 12 + 1, title),
+            size=4000000, mtime=1600000000.0 + ix, duration=240.0,
+            title=title, album=album, artist=artist, albumartist=artist,
+            composer='Mozart' if ix % 97 == 0 else None,
+            genre=genre,
+        )
+        entries.append(entry)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tracks', type=int, default=100000)
+    parser.add_argument('--budget', type=float, default=20.0)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    os.chdir(work_dir)
+    app = load_app()
+    engine = app.PlayerEngine()
+    entries = make_entries(engine, args.tracks)
+
+    start = time.perf_counter()
+    for ix in range(0, len(entries), 500):
+        engine.store_library_entries(entries[ix:ix + 500])
+    elapsed = time.perf_counter() - start
+    print('Library:  {} entries stored in {:.2f} s ({:.1f} ms per 500)'.format(
+        len(entries), elapsed, elapsed / len(entries) * 500 * 1000))
+    engine.playing_list.extend(entry['path'] for entry in entries)
+
+    # The first search fetches the row ids of the library once.
+    start = time.perf_counter()
+    engine.search_playing_list('warm')
+    print('First search: {:8.2f} ms'.format(
+        (time.perf_counter() - start) * 1000))
+
+    latencies = []
+    for query in QUERIES:
+        # Search the query as it is typed, one letter at a time.
+        times = []
+        for length in range(1, len(query) + 1):
+            start = time.perf_counter()
+            rows = engine.search_playing_list(query[:length])
+            times.append((time.perf_counter() - start) * 1000)
+        latencies.extend(times)
+        print('  {:14} {:6} songs  last {:8.2f} ms  max {:8.2f} ms'.format(
+            repr(query), len(rows or ()), times[-1], max(times)))
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print('Searches: {}'.format(len(latencies)))
+    print('Median:   {:8.2f} ms'.format(statistics.median(latencies)))
+    print('95th:     {:8.2f} ms'.format(p95))
+    print('Max:      {:8.2f} ms'.format(latencies[-1]))
+
+    engine.conn.close()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+    if p95 > args.budget:
+        print('FAIL: 95th percentile is over {} ms.'.format(args.budget))
+        sys.exit(1)
+    print('OK: 95th percentile is under {} ms.'.format(args.budget))
+
+
+if __name__ == '__main__':
+    main()
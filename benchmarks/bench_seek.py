@@ -0,0 +1,123 @@
+"""
+Benchmark of seeking in long MP3 files.
+
+Write a VBR MP3 file of silent frames of random bitrates (a two-hour
+DJ mix by default), time building its seek index, then time seeking
+to random times through PlayerEngine.seek() (with the index in memory
+and read from the database) against mixer.music.set_pos() on the same
+file (whose landing time the mixer does not tell, so only its speed is
+compared). Exit with status 1 if a seek does not land within one frame of
+its time.
+
+Usage: python benchmarks/bench_seek.py [--minutes N] [--seeks N]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import time
+
+from common import REPO_DIR, load_app, make_work_dir
+from library import id3_tag
+
+# MPEG-1 Layer III frames at 44100 Hz of 64, 128 and 192 kbit/s; all
+# zeros after the header is silence.
+VBR_FRAMES = [
+    header + b'\0' * (length - 4) for header, length in (
+        (b'\xff\xfb\x50\x00', 208),
+        (b'\xff\xfb\x90\x00', 417),
+        (b'\xff\xfb\xb0\x00', 626),
+    )
+]
+FRAME_SECONDS = 1152 / 44100
+
+
+def write_mix(path, minutes, seed=0):
+    """
+    Write an MP3 file of 'minutes' minutes of frames of random
+    bitrates and return the number of frames.
+    """
+    rng = random.Random(seed)
+    frames_count = int(minutes * 60 / FRAME_SECONDS)
+    with open(path, 'wb') as f:
+        f.write(id3_tag({'TIT2': 'Mix'}))
+        f.write(b''.join(rng.choices(VBR_FRAMES, k=frames_count)))
+    return frames_count
+
+
+def time_seeks(seek, targets):
+    """
+    Call 'seek' with every time of 'targets' and return the times of
+    the calls in milliseconds.
+    """
+    times = []
+    for seconds in targets:
+        start = time.perf_counter()
+        seek(seconds)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--minutes', type=float, default=120.0)
+    parser.add_argument('--seeks', type=int, default=50)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    os.chdir(work_dir)
+    path = os.path.join(work_dir, 'mix.mp3').replace('\\', '/')
+    frames_count = write_mix(path, args.minutes)
+    print('Mix:      {:.0f} min, {} frames, {:.1f} MB'.format(
+        args.minutes, frames_count, os.path.getsize(path) / 1e6))
+    app = load_app()
+    app.mixer.init(frequency=44100)
+    engine = app.PlayerEngine()
+    engine.playing_list.extend([path])
+    engine.play_track(0)
+
+    start = time.perf_counter()
+    engine.seek(1.0)
+    print('First seek (builds the index): {:8.2f} ms'.format(
+        (time.perf_counter() - start) * 1000))
+
+    rng = random.Random(1)
+    targets = [rng.uniform(0, args.minutes * 60) for _ in range(args.seeks)]
+    errors = []
+
+    def seek(seconds):
+        engine.seek(seconds)
+        errors.append(abs(engine.position / 1000 - seconds))
+
+    def seek_from_database(seconds):
+        # Forget the index in memory, as when another song has been
+        # seeked in between.
+        engine.seek_index = None
+        seek(seconds)
+
+    for label, function in (
+        ('Indexed seek (memory)', seek),
+        ('Indexed seek (database)', seek_from_database),
+        ('mixer.music.set_pos', app.mixer.music.set_pos),
+    ):
+        if function is app.mixer.music.set_pos:
+            app.mixer.music.load(path)
+            app.mixer.music.play()
+        times = time_seeks(function, targets)
+        print('{:24} median {:8.2f} ms  max {:8.2f} ms'.format(
+            label, statistics.median(times), max(times)))
+    print('Largest distance from the time: {:.1f} ms (a frame is {:.1f} ms)'
+          .format(max(errors) * 1000, FRAME_SECONDS * 1000))
+
+    engine.close()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+    # The position of the engine is in whole milliseconds.
+    if max(errors) > FRAME_SECONDS + 0.001:
+        print('FAIL: a seek did not land within one frame.')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark of the startup time of the app.
+
+Import audio-player.py with 'python -X importtime' and report the
+imports that take the most time, then start the app in new processes
+and measure the time from starting the process to the first frame of
+the window with all its widgets. Exit with status 1 if the median time
+to first frame is over the budget.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--budget MS]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from common import REPO_DIR, make_work_dir
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_CODE = """
+import sys
+sys.path.insert(0, {benchmarks_dir!r})
+from common import load_app
+load_app()
+"""
+
+FIRST_FRAME_CODE = """
+import sys
+sys.path.insert(0, {benchmarks_dir!r})
+from common import load_app
+app = load_app()
+root = app.create_root()
+app.mixer.init()
+player = app.MusicPlayer(root)
+root.update()
+print('first frame', flush=True)
+player.engine.close()
+root.destroy()
+"""
+
+
+def measure_imports(work_dir, top):
+    """
+    Import the app with 'python -X importtime' and print the 'top'
+    imports with the highest cumulative time; return the time of all
+    of them in milliseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         IMPORT_CODE.format(benchmarks_dir=BENCHMARKS_DIR)],
+        cwd=work_dir, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Only the imports that are not nested in another one are
+        # counted, so no time is counted twice.
+        if name.startswith('  '):
+            continue
+        imports.append((int(cumulative) / 1000, name.strip()))
+    imports.sort(reverse=True)
+    print('Slowest imports:')
+    for cumulative, name in imports[:top]:
+        print('  {:8.2f} ms  {}'.format(cumulative, name))
+    total = sum(cumulative for cumulative, _ in imports)
+    print('All imports: {:8.2f} ms'.format(total))
+    return total
+
+
+def measure_first_frame(work_dir):
+    """
+    Start the app in a new process and return the time from starting
+    the process to the first frame of the window in milliseconds.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-c',
+         FIRST_FRAME_CODE.format(benchmarks_dir=BENCHMARKS_DIR)],
+        cwd=work_dir, stdout=subprocess.PIPE, text=True,
+    )
+    for line in process.stdout:
+        if line.strip() == 'first frame':
+            elapsed = (time.perf_counter() - start) * 1000
+            break
+    else:
+        process.wait()
+        raise RuntimeError('the app exited before showing the window')
+    process.stdout.read()
+    process.wait()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1000.0)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    measure_imports(work_dir, args.top)
+    times = [measure_first_frame(work_dir) for _ in range(args.runs)]
+    median = statistics.median(times)
+    print('Time to first frame:')
+    print('  Min:     {:8.2f} ms'.format(min(times)))
+    print('  Median:  {:8.2f} ms'.format(median))
+    print('  Max:     {:8.2f} ms'.format(max(times)))
+    shutil.rmtree(work_dir)
+    os.chdir(REPO_DIR)
+    if median > args.budget:
+        print('FAIL: median time to first frame is over {} ms.'.format(
+            args.budget))
+        sys.exit(1)
+    print('OK: median time to first frame is under {} ms.'.format(
+        args.budget))
+
+
+if __name__ == '__main__':
+    main()
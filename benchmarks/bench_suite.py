@@ -0,0 +1,321 @@
+"""
+Benchmark suite of the main operations of the app on a synthetic library.
+
+Generate a library of WAV and MP3 files (see library.py) and time the
+real operations of the app on it: walking and reading the library,
+saving and loading a large playlist, next-track latency and, when a
+display is available, importing the folder into the window, loading a
+playlist into it, showing artworks and rendering song tags on them.
+Print a summary, including the peak RSS of the process and of its
+worker processes, and write all results as JSON so the results of two
+versions can be compared.
+
+Usage: python benchmarks/bench_suite.py [--wav N] [--mp3 N]
+           [--playlist-size N] [--runs N] [--output FILE] [--label TEXT]
+           [--compare FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from common import REPO_DIR, load_app, make_work_dir
+from library import make_library
+
+
+class Suite:
+    """Run timed operations and collect their results."""
+
+    def __init__(self):
+        self.results = {}
+
+    def add(self, name, times, **details):
+        """Keep times 'times' (in milliseconds) of operation 'name'."""
+        self.results[name] = dict(
+            runs=len(times),
+            min_ms=round(min(times), 3),
+            median_ms=round(statistics.median(times), 3),
+            max_ms=round(max(times), 3),
+            **details
+        )
+        print('  {:28} median {:10.2f} ms  min {:10.2f} ms  max {:10.2f} ms'
+              .format(name, statistics.median(times), min(times), max(times)))
+
+    def skip(self, name, reason):
+        """Record that operation 'name' was not run."""
+        self.results[name] = {'skipped': reason}
+        print('  {:28} skipped ({})'.format(name, reason))
+
+    def time(self, name, function, runs=1, setup=None, **details):
+        """
+        Call 'function' 'runs' times (calling 'setup' before each run,
+        untimed) and keep the times; return the last result.
+        """
+        times = []
+        for _ in range(runs):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = function()
+            times.append((time.perf_counter() - start) * 1000)
+        self.add(name, times, **details)
+        return result
+
+
+def peak_rss_kb():
+    """
+    Return the peak resident set size in kilobytes of this process and
+    of its finished worker processes, or None if it is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1024 if sys.platform == 'darwin' else 1
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        'children': (
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+        ),
+    }
+
+
+def git_label():
+    """Return the short hash of the checked out commit, or 'unknown'."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_engine(suite, app, engine, music_dir, playlist, runs):
+    """Time the operations of the engine, which need no display."""
+    files = suite.time(
+        'scan_directory', lambda: list(app.scan_directory(music_dir)),
+        runs=runs,
+    )
+    suite.time(
+        'update_library_cold', lambda: engine.update_library(files),
+        files=len(files),
+    )
+    suite.time(
+        'update_library_warm', lambda: engine.update_library(files),
+        runs=runs, files=len(files),
+    )
+
+    def delete_playlist():
+        if engine.check_playlist_existence('bench'):
+            engine.delete_playlist('bench')
+    suite.time(
+        'insert_playlist', lambda: engine.insert_playlist('bench', playlist),
+        runs=runs, setup=delete_playlist, tracks=len(playlist),
+    )
+    suite.time(
+        'get_playlist', lambda: engine.get_playlist('bench'),
+        runs=runs, tracks=len(playlist),
+    )
+
+    # Next-track latency is the time until the mixer plays the song.
+    engine.playing_list.replace(playlist)
+    engine.play_track(0)
+    suite.time('next_track', engine.next_track, runs=max(runs, 50))
+    engine.stop()
+
+
+def run_window(suite, app, root, player, music_dir, playlist, mp3_files,
+               runs):
+    """Time the operations of the window."""
+    def wait_for_import():
+        while (
+            len(player.import_scans) != 0
+            or player.import_executor is not None
+        ):
+            root.update()
+            time.sleep(0.001)
+
+    def import_directory():
+        player.import_directory(music_dir)
+        wait_for_import()
+
+    def clear_library():
+        player.clear_playing_list()
+        with player.engine.conn:
+            player.engine.c.execute('DELETE FROM library')
+    # A cold import reads every file; a warm one finds them all inside
+    # the library.
+    suite.time('import_directory_cold', import_directory, runs=runs,
+               setup=clear_library)
+    suite.time('import_directory_warm', import_directory, runs=runs,
+               setup=player.clear_playing_list)
+
+    def load_playlist():
+        player.load_playlist('bench', playlist)
+        root.update()
+    suite.time('load_playlist', load_playlist, runs=runs,
+               tracks=len(playlist))
+    player.engine.stop()
+
+    # The details of the song (its length, tags and artwork) are shown
+    # when the Tk loop is idle, after the song has started.
+    player.load_playlist('mp3', mp3_files)
+    root.update()
+
+    def next_track_details():
+        player.transport('next')
+        root.update()
+    suite.time('next_track_details', next_track_details,
+               runs=max(runs, 20))
+    player.engine.stop()
+
+    # Every album has its own artwork; the first song of each album
+    # decodes it and the second one finds it in the cache.
+    albums = {}
+    for file_path in mp3_files:
+        albums.setdefault(os.path.dirname(file_path), []).append(file_path)
+    first_songs = [songs[0] for songs in albums.values()]
+    second_songs = [songs[1 % len(songs)] for songs in albums.values()]
+    player.artwork_cache = app.ArtworkCache(player.artwork_cache.max_bytes)
+    times = []
+    for file_path in first_songs:
+        start = time.perf_counter()
+        player.show_file_info(file_path)
+        root.update_idletasks()
+        times.append((time.perf_counter() - start) * 1000)
+    suite.add('artwork_display_cold', times)
+    times = []
+    for file_path in second_songs:
+        start = time.perf_counter()
+        player.show_file_info(file_path)
+        root.update_idletasks()
+        times.append((time.perf_counter() - start) * 1000)
+    suite.add('artwork_display_warm', times)
+
+    def click_tags():
+        player.tags_checkbutton_var.set(1 - player.tags_checkbutton_var.get())
+        player.show_file_tags()
+        root.update_idletasks()
+    times = []
+    for file_path in first_songs:
+        player.show_file_info(file_path)
+        start = time.perf_counter()
+        click_tags()
+        times.append((time.perf_counter() - start) * 1000)
+        click_tags()
+    suite.add('tags_overlay_first', times)
+    suite.time('tags_overlay_toggle', click_tags, runs=max(runs, 50))
+
+
+def compare(results, baseline_path):
+    """
+    Print the median time of every operation of 'results' relative to
+    the results inside JSON file 'baseline_path'.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print('Compared to "{}":'.format(baseline['label']))
+    for name, result in results['operations'].items():
+        old = baseline['operations'].get(name, {})
+        if 'median_ms' not in result or 'median_ms' not in old:
+            continue
+        ratio = result['median_ms'] / max(old['median_ms'], 0.001)
+        print('  {:28} {:10.2f} ms -> {:10.2f} ms  x{:.2f}'.format(
+            name, old['median_ms'], result['median_ms'], ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--wav', type=int, default=2000)
+    parser.add_argument('--mp3', type=int, default=120)
+    parser.add_argument('--playlist-size', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--label', default=None,
+                        help='name of the results (the commit by default)')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='results of another version to compare with')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline_path = args.compare and os.path.abspath(args.compare)
+
+    work_dir = make_work_dir()
+    music_dir = os.path.join(work_dir, 'music')
+    suite = Suite()
+    print('Operations:')
+    wav_files, mp3_files = suite.time(
+        'generate_library',
+        lambda: make_library(music_dir, args.wav, args.mp3),
+        files=args.wav + args.mp3,
+    )
+    files = wav_files + mp3_files
+    # A large playlist repeats the files of the library.
+    playlist = [
+        files[ix % len(files)] for ix in range(args.playlist_size)
+    ]
+
+    os.chdir(work_dir)
+    app = load_app()
+    app.mixer.init()
+    import tkinter
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError as e:
+        root = None
+        display_error = str(e)
+
+    if root is None:
+        engine = app.PlayerEngine()
+        run_engine(suite, app, engine, music_dir, playlist, args.runs)
+        for name in ('import_directory_cold', 'import_directory_warm',
+                     'load_playlist',
+                     'next_track_details', 'artwork_display_cold',
+                     'artwork_display_warm', 'tags_overlay_first',
+                     'tags_overlay_toggle'):
+            suite.skip(name, display_error)
+        engine.close()
+    else:
+        player = app.MusicPlayer(root)
+        root.update()
+        run_engine(suite, app, player.engine, music_dir, playlist, args.runs)
+        run_window(suite, app, root, player, music_dir, playlist, mp3_files,
+                   args.runs)
+        player.stop_import()
+        player.engine.close()
+        root.destroy()
+
+    rss = peak_rss_kb()
+    if rss is not None:
+        print('Peak RSS: {} kB (worker processes: {} kB)'.format(
+            rss['self'], rss['children']))
+    results = {
+        'label': args.label or git_label(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            'wav': args.wav, 'mp3': args.mp3,
+            'playlist_size': args.playlist_size, 'runs': args.runs,
+        },
+        'operations': suite.results,
+        'peak_rss_kb': rss,
+    }
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to "{}".'.format(output))
+    if baseline_path is not None:
+        compare(results, baseline_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of the overhead of tracing.
+
+Time a traced call and a SQL statement of the traced cursor with
+tracing disabled and enabled, against the same call and statement
+without tracing, and report the overhead of each in nanoseconds.
+
+Usage: python benchmarks/bench_tracing.py [--calls N]
+"""
+import argparse
+import sqlite3
+import time
+
+from common import load_app
+
+
+def time_calls(function, calls, rounds=3):
+    """
+    Return the mean time of a call of 'function' in nanoseconds, in
+    the fastest of 'rounds' rounds of 'calls' calls.
+    """
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        for _ in range(calls):
+            function()
+        times.append((time.perf_counter_ns() - start) / calls)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=200000)
+    args = parser.parse_args()
+
+    app = load_app()
+    tracer = app.TRACER
+
+    def plain():
+        pass
+    traced = tracer.traced('bench: call')(plain)
+
+    conn = sqlite3.connect(':memory:')
+    plain_cursor = conn.cursor()
+    traced_cursor = conn.cursor(app.TracedCursor)
+
+    def plain_sql():
+        plain_cursor.execute('SELECT 1').fetchall()
+
+    def traced_sql():
+        traced_cursor.execute('SELECT 1').fetchall()
+
+    base_call = time_calls(plain, args.calls)
+    base_sql = time_calls(plain_sql, args.calls)
+    print('Plain call:    {:8.1f} ns'.format(base_call))
+    print('Plain SQL:     {:8.1f} ns'.format(base_sql))
+    for enabled in (False, True):
+        tracer.enabled = enabled
+        tracer.clear()
+        call = time_calls(traced, args.calls) - base_call
+        sql = time_calls(traced_sql, args.calls) - base_sql
+        print('Tracing {:8}  call overhead {:8.1f} ns  SQL overhead '
+              '{:8.1f} ns'.format('on:' if enabled else 'off:', call, sql))
+    tracer.enabled = False
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
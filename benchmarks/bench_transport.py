@@ -0,0 +1,91 @@
+"""
+Benchmark of the latency of transport controls.
+
+Create a list of short WAV files, click the next, previous and play
+buttons of MusicPlayer repeatedly and measure the time from each click
+to the call of mixer.music.play() (or mixer.music.pause() and
+mixer.music.unpause() for the play/pause button). Exit with status 1
+if the 95th percentile is over the budget.
+
+Usage: python benchmarks/bench_transport.py [--clicks N] [--budget MS]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import time
+
+from common import REPO_DIR, load_app, make_work_dir, wav_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clicks', type=int, default=100)
+    parser.add_argument('--budget', type=float, default=50.0)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    music_dir = os.path.join(work_dir, 'music')
+    os.mkdir(music_dir)
+    files = []
+    for ix in range(20):
+        file_path = os.path.join(music_dir, 'track-{:02d}.wav'.format(ix))
+        with open(file_path, 'wb') as f:
+            f.write(wav_bytes(30))
+        files.append(file_path)
+
+    os.chdir(work_dir)
+    app = load_app()
+    import tkinter
+    root = tkinter.Tk()
+    app.mixer.init()
+    player = app.MusicPlayer(root)
+    player.add_to_playing_list(*files)
+    root.update()
+
+    # Record the time of every call to the mixer that a click leads to.
+    mixer_calls = []
+    for name in ('play', 'pause', 'unpause'):
+        def record(*call_args, mixer_function=getattr(app.mixer.music, name),
+                   **call_kwargs):
+            mixer_calls.append(time.perf_counter())
+            return mixer_function(*call_args, **call_kwargs)
+        setattr(app.mixer.music, name, record)
+
+    buttons = [player.next_button, player.previous_button, player.play_button]
+    latencies = []
+    player.play_button.invoke()
+    root.update()
+    for ix in range(args.clicks):
+        del mixer_calls[:]
+        button = buttons[ix % len(buttons)]
+        start = time.perf_counter()
+        button.invoke()
+        if len(mixer_calls) != 0:
+            latencies.append((mixer_calls[0] - start) * 1000)
+        # Let the Tk loop show the details of the song, as it would
+        # between two clicks of a user.
+        root.update()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print('Clicks:  {}'.format(len(latencies)))
+    print('Min:     {:8.2f} ms'.format(latencies[0]))
+    print('Median:  {:8.2f} ms'.format(statistics.median(latencies)))
+    print('95th:    {:8.2f} ms'.format(p95))
+    print('Max:     {:8.2f} ms'.format(latencies[-1]))
+
+    player.engine.stop()
+    player.engine.close()
+    root.destroy()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+    if p95 > args.budget:
+        print('FAIL: 95th percentile is over {} ms.'.format(args.budget))
+        sys.exit(1)
+    print('OK: 95th percentile is under {} ms.'.format(args.budget))
+
+
+if __name__ == '__main__':
+    main()
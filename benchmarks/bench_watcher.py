@@ -0,0 +1,123 @@
+"""
+Benchmark of watching the library folders.
+
+Create a tree of folders of empty songs, start FolderWatcher on it
+(with inotify and with polling) and time the first reading of the
+tree, how long a created, moved and deleted song takes to be
+reported and how long a round of polling takes (with and without
+checking every song), against a full rescan of the tree, which is
+what finding the same changes without the watcher costs.
+
+Usage: python benchmarks/bench_watcher.py [--folders N] [--songs N]
+"""
+import argparse
+import os
+import shutil
+import time
+
+from common import REPO_DIR, load_app, make_work_dir
+
+
+def make_tree(root, folders, songs):
+    """
+    Create 'folders' album folders with 'songs' empty songs each
+    inside artist folders of 'root' and return the number of songs.
+    """
+    for folder_ix in range(folders):
+        dir_path = os.path.join(
+            root, 'artist-{:03d}'.format(folder_ix // 10),
+            'album-{:05d}'.format(folder_ix),
+        )
+        os.makedirs(dir_path)
+        for song_ix in range(songs):
+            open(os.path.join(
+                dir_path, 'track-{:02d}.mp3'.format(song_ix)), 'wb').close()
+    return folders * songs
+
+
+def wait_for(watcher, kind, timeout=30.0):
+    """
+    Return the time in milliseconds until the watcher reports a
+    change of kind 'kind' (0: created, 1: deleted, 2: moved).
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if len(watcher.get_changes()[kind]) != 0:
+            return (time.perf_counter() - start) * 1000
+        time.sleep(0.001)
+    raise RuntimeError('no change was reported')
+
+
+def run(app, root, polling, poll_interval):
+    """Time the watcher of 'root' with inotify or with polling."""
+    label = 'polling' if polling else 'inotify'
+    if polling:
+        # Polling is used wherever inotify can not be loaded.
+        load_inotify = app.load_inotify
+        app.load_inotify = lambda: None
+    watcher = app.FolderWatcher([root], {}, poll_interval)
+    start = time.perf_counter()
+    watcher.start()
+    # Every song is new to the watcher, so the first reading reports
+    # them all as created.
+    wait_for(watcher, 0, timeout=600)
+    print('{}: first reading      {:10.2f} ms ({} folders)'.format(
+        label, (time.perf_counter() - start) * 1000, len(watcher.files)))
+    if polling:
+        app.load_inotify = load_inotify
+
+    first_dir = os.path.join(root, 'artist-000', 'album-00000')
+    song_path = os.path.join(first_dir, 'new.mp3')
+    open(song_path, 'wb').close()
+    print('{}: created reported   {:10.2f} ms'.format(
+        label, wait_for(watcher, 0)))
+    os.rename(song_path, song_path + '.mp3')
+    print('{}: moved reported     {:10.2f} ms'.format(
+        label, wait_for(watcher, 2)))
+    os.remove(song_path + '.mp3')
+    print('{}: deleted reported   {:10.2f} ms'.format(
+        label, wait_for(watcher, 1)))
+    if polling:
+        start = time.perf_counter()
+        watcher.poll_dirs()
+        print('{}: round of polling   {:10.2f} ms'.format(
+            label, (time.perf_counter() - start) * 1000))
+        # Every few rounds, the songs are checked one by one too.
+        start = time.perf_counter()
+        watcher.poll_dirs(restat=True)
+        print('{}: round with songs   {:10.2f} ms'.format(
+            label, (time.perf_counter() - start) * 1000))
+    watcher.stop()
+    watcher.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--folders', type=int, default=2000)
+    parser.add_argument('--songs', type=int, default=12)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    root = os.path.join(work_dir, 'music').replace('\\', '/')
+    songs = make_tree(root, args.folders, args.songs)
+    app = load_app()
+
+    # A full rescan walks the tree and checks every song.
+    start = time.perf_counter()
+    for file_path in app.scan_directory(root):
+        os.stat(file_path)
+    print('Full rescan:            {:10.2f} ms ({} songs)'.format(
+        (time.perf_counter() - start) * 1000, songs))
+    if app.load_inotify() is None:
+        print('inotify: not available')
+    else:
+        run(app, root, False, args.poll_interval)
+    run(app, root, True, args.poll_interval)
+
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark of the waveforms of the seek bar.
+
+Write a stereo WAV file of a tone and an MP3 file of silent frames of
+the same length, time compute_waveform() on each (decoding included),
+then store the waveforms and time reading them back from the database,
+which is what playing the song again costs. Exit with status 1 if
+computing a waveform takes longer than the budget.
+
+Usage: python benchmarks/bench_waveform.py [--seconds S] [--budget S]
+"""
+import argparse
+import os
+import shutil
+import time
+
+from bench_loudness import write_tone
+from common import REPO_DIR, load_app, make_work_dir
+from library import write_mp3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=300.0)
+    parser.add_argument('--budget', type=float, default=1.0)
+    args = parser.parse_args()
+
+    work_dir = make_work_dir()
+    os.chdir(work_dir)
+    wav_path = os.path.join(work_dir, 'tone.wav').replace('\\', '/')
+    mp3_path = os.path.join(work_dir, 'silence.mp3').replace('\\', '/')
+    write_tone(wav_path, args.seconds, -6.0)
+    write_mp3(mp3_path, args.seconds, {'TIT2': 'Silence'})
+    app = load_app()
+    app.mixer.init(frequency=44100)
+    engine = app.PlayerEngine()
+
+    slowest = 0
+    for path in (wav_path, mp3_path):
+        start = time.perf_counter()
+        peaks = app.compute_waveform(path)
+        elapsed = time.perf_counter() - start
+        slowest = max(slowest, elapsed)
+        print('{:12} computed in {:8.2f} ms ({} bytes)'.format(
+            os.path.basename(path), elapsed * 1000, len(peaks)))
+        engine.store_waveform(path, os.stat(path).st_mtime, peaks)
+        start = time.perf_counter()
+        cached = engine.get_cached_waveform(path)
+        print('{:12} cached in   {:8.2f} ms'.format(
+            os.path.basename(path), (time.perf_counter() - start) * 1000))
+        assert cached == peaks
+
+    engine.conn.close()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+    if slowest > args.budget:
+        print('FAIL: computing a waveform took over {} s.'.format(
+            args.budget))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Check of searching and caching lyrics against a stand-in of Genius.
+
+Start a local HTTP server that answers the requests of lyricsgenius
+like Genius does (a search, the details of a song and the page of its
+lyrics), point the app at it and run the real show_lyrics(),
+search_lyrics() and check_lyrics() of the window, on a stand-in of the
+window without a display. Check that found lyrics are cached, that a
+song without lyrics is cached as not found until its time to live
+ends, that a rejected token (401) is cleared and that a connection
+error keeps it. Exit with status 1 if any check fails.
+
+Usage: python benchmarks/check_lyrics.py
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from common import REPO_DIR, load_app, make_work_dir
+
+SONG = {
+    'id': 1,
+    'title': 'Known Song',
+    'primary_artist': {'name': 'Some Artist'},
+    'lyrics_state': 'complete',
+    'url': 'https://genius.com/known-song-lyrics',
+    'path': '/known-song-lyrics',
+}
+LYRICS_PAGE = (
+    '<html><body><div data-lyrics-container="true">'
+    'First line<br/>Second line</div></body></html>'
+)
+
+
+class GeniusHandler(BaseHTTPRequestHandler):
+    """Answer the requests of lyricsgenius for the song of SONG."""
+
+    requests_count = 0
+    rejected = False
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, content_type='application/json'):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        GeniusHandler.requests_count += 1
+        url = urlparse(self.path)
+        if GeniusHandler.rejected:
+            self.send(401, json.dumps({'error': 'invalid_token'}))
+        elif url.path.startswith('/api/search'):
+            search_term = parse_qs(url.query).get('q', [''])[0]
+            hits = []
+            if SONG['title'] in search_term:
+                hits.append({'index': 'song', 'type': 'song', 'result': SONG})
+            self.send(200, json.dumps({'response': {
+                'sections': [{'type': 'song', 'hits': hits}], 'hits': hits,
+            }}))
+        elif url.path == '/songs/1':
+            self.send(200, json.dumps({'response': {'song': SONG}}))
+        elif url.path == SONG['path']:
+            self.send(200, LYRICS_PAGE, 'text/html')
+        else:
+            self.send(404, '{}')
+
+
+class Master:
+    """Stand-in of the Tk root that keeps the scheduled calls."""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, delay, function):
+        self.scheduled.append(function)
+
+
+class TextArea:
+    """Stand-in of the text area of a lyrics window that was closed."""
+
+    def winfo_exists(self):
+        return False
+
+
+class Messages:
+    """Stand-in of tkinter.messagebox that keeps the titles shown."""
+
+    def __init__(self):
+        self.titles = []
+
+    def show(self, title, message):
+        self.titles.append(title)
+
+    showerror = showwarning = showinfo = show
+
+
+def make_window(app, engine, api_root):
+    """
+    Return a stand-in of the window with the lyrics methods of
+    MusicPlayer, which keeps the lyrics it shows.
+    """
+
+    class Window:
+        show_lyrics = app.MusicPlayer.show_lyrics
+        search_lyrics = app.MusicPlayer.search_lyrics
+        check_lyrics = app.MusicPlayer.check_lyrics
+
+        def create_lyrics_window(self, file_artist, file_title, lyrics):
+            self.shown.append(lyrics)
+            return TextArea()
+
+    window = Window()
+    window.engine = engine
+    window.master = Master()
+    window.token = 'token'
+    window.genius_root = api_root
+    window.lyrics_results = queue.Queue()
+    window.lyrics_windows = {}
+    window.shown = []
+    window.file_tags_dict = {}
+    window.file_info_not_found = window.lyrics_not_found = ''
+    window.api_access_error = window.connection_error = ''
+    return window
+
+
+def show_lyrics(window, artist, title):
+    """
+    Show the lyrics of the song with title 'title' by 'artist' as the
+    window does, running the checks it schedules until the search is
+    finished.
+    """
+    window.file_tags_dict = {'Artist': artist, 'Title': title}
+    window.show_lyrics()
+    while window.master.scheduled:
+        function = window.master.scheduled.pop(0)
+        if window.lyrics_results.empty():
+            time.sleep(0.01)
+        function()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GeniusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_root = 'http://127.0.0.1:{}/'.format(server.server_port)
+
+    work_dir = make_work_dir()
+    os.chdir(work_dir)
+    app = load_app()
+    messages = Messages()
+    app.messagebox = messages
+    engine = app.PlayerEngine()
+    window = make_window(app, engine, api_root)
+    failures = []
+
+    def check(condition, text):
+        print('{}: {}'.format('OK  ' if condition else 'FAIL', text))
+        if not condition:
+            failures.append(text)
+
+    show_lyrics(window, 'Some Artist', 'Known Song')
+    requests_count = GeniusHandler.requests_count
+    check(
+        engine.get_cached_lyrics('Some Artist', 'Known Song')
+        == ('First line\nSecond line',),
+        'found lyrics are cached',
+    )
+    show_lyrics(window, 'Some Artist', 'Known Song (Remastered)')
+    check(
+        window.shown[-1:] == ['First line\nSecond line']
+        and GeniusHandler.requests_count == requests_count,
+        'cached lyrics are shown without a request',
+    )
+
+    show_lyrics(window, 'Other Artist', 'Unknown Song')
+    requests_count = GeniusHandler.requests_count
+    check(
+        engine.get_cached_lyrics('Other Artist', 'Unknown Song') == (None,)
+        and messages.titles[-1:] == ['Lyrics not found'],
+        'a song without lyrics is cached as not found',
+    )
+    show_lyrics(window, 'Other Artist', 'Unknown Song')
+    check(
+        GeniusHandler.requests_count == requests_count,
+        'a song without lyrics is not searched again right away',
+    )
+    engine.lyrics_not_found_ttl = 0.5
+    time.sleep(0.6)
+    check(
+        engine.get_cached_lyrics('Other Artist', 'Unknown Song') is None
+        and engine.get_cached_lyrics('Some Artist', 'Known Song')
+        is not None,
+        'not found lyrics expire after their time to live',
+    )
+    show_lyrics(window, 'Other Artist', 'Unknown Song')
+    check(
+        GeniusHandler.requests_count > requests_count,
+        'expired lyrics are searched again',
+    )
+
+    GeniusHandler.rejected = True
+    show_lyrics(window, 'Some Artist', 'Another Song')
+    check(
+        window.token is None and messages.titles[-1:] == ['API access error'],
+        'a rejected token (401) is cleared',
+    )
+    GeniusHandler.rejected = False
+    server.shutdown()
+    server.server_close()
+    window.token = 'token'
+    show_lyrics(window, 'Some Artist', 'Third Song')
+    check(
+        window.token == 'token'
+        and messages.titles[-1:] == ['Conneciton error'],
+        'a connection error keeps the token',
+    )
+
+    engine.conn.close()
+    os.chdir(REPO_DIR)
+    shutil.rmtree(work_dir)
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
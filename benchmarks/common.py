@@ -0,0 +1,51 @@
+"""Helpers shared by the benchmarks of Junkie Audio Player."""
+import importlib.util
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app():
+    """
+    Import audio-player.py as a module and return it. The working
+    directory must contain 'png', 'ico' and 'db' directories.
+    """
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    spec = importlib.util.spec_from_file_location(
+        'audio_player', os.path.join(REPO_DIR, 'audio-player.py')
+    )
+    app = importlib.util.module_from_spec(spec)
+    # Worker processes find the functions of the app by the name of
+    # its module.
+    sys.modules[spec.name] = app
+    spec.loader.exec_module(app)
+    return app
+
+
+def make_work_dir():
+    """
+    Create a temporary working directory with the images of the app
+    and an empty database directory and return its path.
+    """
+    work_dir = tempfile.mkdtemp(prefix='junkie-bench-')
+    for name in ('png', 'ico'):
+        shutil.copytree(
+            os.path.join(REPO_DIR, name), os.path.join(work_dir, name)
+        )
+    os.mkdir(os.path.join(work_dir, 'db'))
+    return work_dir
+
+
+def wav_bytes(seconds, rate=44100):
+    """Return the bytes of a mono 16-bit WAV file of silence."""
+    frames = b'\0\0' * int(seconds * rate)
+    header = b'RIFF' + struct.pack('<I', 36 + len(frames)) + b'WAVE'
+    header += b'fmt ' + struct.pack(
+        '<IHHIIHH', 16, 1, 1, rate, rate * 2, 2, 16
+    )
+    header += b'data' + struct.pack('<I', len(frames))
+    return header + frames
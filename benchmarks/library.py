@@ -0,0 +1,149 @@
+"""
+Generator of a synthetic music library for the benchmarks.
+
+Write short WAV files with the 'wave' module and MP3 files of silent
+frames with ID3v2 tags and an embedded JPEG artwork (one artwork per
+album), inside 'artist-NNN/album-NNN' directories.
+
+Usage: python benchmarks/library.py DIR [--wav N] [--mp3 N]
+"""
+import argparse
+from io import BytesIO
+import os
+import wave
+
+# A frame of MPEG-1 Layer III, 128 kbit/s, 44100 Hz, stereo and no
+# padding is 417 bytes long and holds 1152 samples; all zeros after
+# the header (and side information) is silence.
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\0' * 413
+MP3_FRAME_SECONDS = 1152 / 44100
+
+
+def write_wav(path, seconds, rate=44100):
+    """Write a mono 16-bit WAV file of 'seconds' seconds of silence."""
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b'\0\0' * int(seconds * rate))
+
+
+def syncsafe(size):
+    """Return 'size' as a 4-byte syncsafe integer of ID3v2.4."""
+    return bytes((size >> shift) & 0x7f for shift in (21, 14, 7, 0))
+
+
+def id3_frame(frame_id, data):
+    """Return an ID3v2.4 frame with id 'frame_id' and bytes 'data'."""
+    return frame_id.encode() + syncsafe(len(data)) + b'\0\0' + data
+
+
+def id3_tag(tags, artwork=None):
+    """
+    Return an ID3v2.4 tag with text frames of dictionary 'tags' (keyed
+    by frame id, like 'TIT2') and a front cover of JPEG bytes
+    'artwork', if it is not None.
+    """
+    frames = b''.join(
+        id3_frame(frame_id, b'\x03' + value.encode('utf-8'))
+        for frame_id, value in tags.items()
+    )
+    if artwork is not None:
+        frames += id3_frame(
+            'APIC', b'\x00image/jpeg\x00\x03\x00' + artwork
+        )
+    return b'ID3\x04\x00\x00' + syncsafe(len(frames)) + frames
+
+
+def artwork_bytes(seed, size=600):
+    """
+    Return the bytes of a JPEG artwork of 'size'x'size' pixels, whose
+    colors depend on 'seed', so every album has its own artwork.
+    """
+    from PIL import Image
+
+    gradient = Image.radial_gradient('L').resize((size, size))
+    image = Image.merge('RGB', (
+        gradient.point(lambda v: (v + seed * 37) % 256),
+        gradient.point(lambda v: (255 - v + seed * 11) % 256),
+        gradient.point(lambda v: (v * 2 + seed * 71) % 256),
+    ))
+    stream = BytesIO()
+    image.save(stream, 'JPEG', quality=90)
+    return stream.getvalue()
+
+
+def write_mp3(path, seconds, tags, artwork=None):
+    """
+    Write an MP3 file of 'seconds' seconds of silence with ID3v2 tags
+    'tags' and JPEG artwork 'artwork'.
+    """
+    frames_count = max(1, int(seconds / MP3_FRAME_SECONDS))
+    with open(path, 'wb') as f:
+        f.write(id3_tag(tags, artwork))
+        f.write(MP3_FRAME * frames_count)
+
+
+def album_dir(root_dir, album_ix, albums_per_artist=10):
+    """Return (and create) the directory of album 'album_ix'."""
+    dir_path = os.path.join(
+        root_dir,
+        'artist-{:03d}'.format(album_ix // albums_per_artist),
+        'album-{:03d}'.format(album_ix % albums_per_artist),
+    )
+    os.makedirs(dir_path, exist_ok=True)
+    return dir_path
+
+
+def make_library(root_dir, wav_count, mp3_count, tracks_per_album=12,
+                 wav_seconds=0.05, mp3_seconds=2):
+    """
+    Create 'wav_count' WAV files and 'mp3_count' MP3 files inside
+    album directories of 'root_dir' and return the lists of their
+    paths (WAV files first, then MP3 files).
+    """
+    wav_files = []
+    for ix in range(wav_count):
+        dir_path = album_dir(root_dir, ix // tracks_per_album)
+        file_path = os.path.join(dir_path, 'track-{:06d}.wav'.format(ix))
+        write_wav(file_path, wav_seconds)
+        wav_files.append(file_path.replace('\\', '/'))
+
+    # The albums of MP3 files come after the albums of WAV files.
+    first_album = -(-wav_count // tracks_per_album)
+    mp3_files = []
+    artwork = None
+    for ix in range(mp3_count):
+        album_ix = first_album + ix // tracks_per_album
+        if ix % tracks_per_album == 0:
+            artwork = artwork_bytes(album_ix)
+        file_path = os.path.join(
+            album_dir(root_dir, album_ix), 'track-{:06d}.mp3'.format(ix)
+        )
+        write_mp3(file_path, mp3_seconds, {
+            'TIT2': 'Track {}'.format(ix % tracks_per_album + 1),
+            'TPE1': 'Artist {}'.format(album_ix // 10),
+            'TPE2': 'Artist {}'.format(album_ix // 10),
+            'TALB': 'Album {}'.format(album_ix),
+            'TRCK': str(ix % tracks_per_album + 1),
+            'TDRC': str(1970 + album_ix % 50),
+            'TCON': 'Synthetic',
+        }, artwork)
+        mp3_files.append(file_path.replace('\\', '/'))
+    return wav_files, mp3_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('dir')
+    parser.add_argument('--wav', type=int, default=2000)
+    parser.add_argument('--mp3', type=int, default=120)
+    args = parser.parse_args()
+
+    wav_files, mp3_files = make_library(args.dir, args.wav, args.mp3)
+    print('Created {} WAV files and {} MP3 files inside "{}".'.format(
+        len(wav_files), len(mp3_files), args.dir))
+
+
+if __name__ == '__main__':
+    main()